@@ -1,18 +1,175 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, Response
+from fastapi import Depends, FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, Response
+import gzip
 import os
+import re
+from contextlib import asynccontextmanager
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
 import mimetypes
 
-app = FastAPI()
+from jobs import JobManager, JobQueueFull
+import metrics
+from ocr_organizer import IMAGE_OUTPUT_DIR
+from renderer import LOGO_PATH
+from site_builder import SITE_DIR
+from workspace import Workspace
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background extraction workers, started with the server rather than at
+    # import. Set app.state.jobs before startup (or override
+    # get_job_manager) to run the service against stubbed clients.
+    if getattr(app.state, "jobs", None) is None:
+        app.state.jobs = JobManager()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # Get the current directory where your files are located
 CURRENT_DIR = Path(".")
 
+# Content-hashed outputs (<hash>.ext, name.<hash>.ext, or with a label such as
+# <hash>.thumb.webp for image variants) never change under the same name
+CONTENT_HASHED_NAME = re.compile(r'(^|\.)[0-9a-f]{16,64}(\.[A-Za-z0-9_-]+)?\.[A-Za-z0-9]+$')
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PRECOMPRESSED_SUFFIXES = [("br", ".br"), ("gzip", ".gz")]
+COMPRESSIBLE_SUFFIXES = {".html", ".js", ".css", ".json", ".svg", ".txt", ".xml"}
+
+# The catch-all route serves only these: generated images, the static site,
+# the logo directory and web assets at the top of CURRENT_DIR. Logs, caches,
+# job workspaces, build manifests and the sources are never served.
+STATIC_DIRS = {IMAGE_OUTPUT_DIR, SITE_DIR, os.path.dirname(LOGO_PATH)}
+TOP_LEVEL_SUFFIXES = {".html", ".js", ".css", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".ico"}
+TOP_LEVEL_FILES = {"data.json"}  # fetched by the rendered page
+
+_html_listing = {"mtime_ns": None, "files": []}
+
+def html_files_in_root() -> list:
+    """*.html files in CURRENT_DIR, re-globbed only when the directory changes."""
+    mtime_ns = CURRENT_DIR.stat().st_mtime_ns
+    if _html_listing["mtime_ns"] != mtime_ns:
+        _html_listing["files"] = sorted(CURRENT_DIR.glob("*.html"))
+        _html_listing["mtime_ns"] = mtime_ns
+    return _html_listing["files"]
+
+def is_public_path(relative: Path) -> bool:
+    """Whether a path relative to CURRENT_DIR is in the static allowlist."""
+    parts = relative.parts
+    if any(part.startswith(".") for part in parts):
+        return False
+    if len(parts) == 1:
+        return relative.suffix.lower() in TOP_LEVEL_SUFFIXES or relative.name in TOP_LEVEL_FILES
+    return parts[0] in STATIC_DIRS
+
+def resolve_static_path(relative_path: str) -> Path:
+    """Map a request path to an allowlisted file inside CURRENT_DIR (see STATIC_DIRS); anything else is a 404."""
+    root = CURRENT_DIR.resolve()
+    try:
+        file_path = (root / relative_path).resolve()
+    except (OSError, ValueError):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if not file_path.is_relative_to(root) or file_path == root:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not is_public_path(file_path.relative_to(root)):
+        raise HTTPException(status_code=404, detail="File not found")
+    return file_path
+
+def precompressed_variant(file_path: Path, accept_encoding: str):
+    """Return (path, encoding) of an up-to-date .br/.gz sibling the client accepts, if any."""
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    source_mtime = file_path.stat().st_mtime_ns
+    for encoding, suffix in PRECOMPRESSED_SUFFIXES:
+        if encoding not in accepted:
+            continue
+        variant = file_path.with_name(file_path.name + suffix)
+        try:
+            if variant.stat().st_mtime_ns >= source_mtime:
+                return variant, encoding
+        except OSError:
+            continue
+    return file_path, None
+
+def static_file_response(request: Request, file_path: Path) -> Response:
+    """
+    Stream a file with validators and conditional-request handling:
+    ETag/Last-Modified on every response, 304 when the client copy is
+    current, and a pre-compressed variant when one exists.
+    """
+    if not file_path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+
+    served_path, encoding = precompressed_variant(file_path, request.headers.get("accept-encoding", ""))
+    stat = file_path.stat()
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if CONTENT_HASHED_NAME.search(file_path.name) else "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+    elif "if-modified-since" in request.headers:
+        try:
+            if int(stat.st_mtime) <= parsedate_to_datetime(request.headers["if-modified-since"]).timestamp():
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    content_type, _ = mimetypes.guess_type(str(file_path))
+    if file_path.suffix.lower() == ".js":
+        content_type = "application/javascript"
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(served_path, media_type=content_type or "application/octet-stream", headers=headers)
+
+def precompress_static_files(root: Path = CURRENT_DIR) -> int:
+    """Write .gz (and .br when brotli is installed) next to compressible top-level files that are out of date."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    written = 0
+    for file_path in root.iterdir():
+        if not file_path.is_file() or file_path.suffix.lower() not in COMPRESSIBLE_SUFFIXES:
+            continue
+        if file_path.name.startswith("."):
+            continue
+        source_mtime = file_path.stat().st_mtime_ns
+        compressors = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            compressors.append((".br", lambda data: brotli.compress(data, quality=11)))
+        for suffix, compress in compressors:
+            variant = file_path.with_name(file_path.name + suffix)
+            if variant.exists() and variant.stat().st_mtime_ns >= source_mtime:
+                continue
+            variant.write_bytes(compress(file_path.read_bytes()))
+            written += 1
+    return written
+
+@app.get("/health")
+async def health_check():
+    """Health check endpoint"""
+    return {"status": "healthy"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    """Pipeline counters and stage histograms in the Prometheus text format"""
+    body = metrics.render_prometheus()
+    body += f"# TYPE extraction_jobs_pending gauge\nextraction_jobs_pending {request.app.state.jobs.pending()}\n"
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 @app.get("/", response_class=HTMLResponse)
-async def read_root():
+async def read_root(request: Request):
     """Serve the main HTML file"""
-    html_files = list(CURRENT_DIR.glob("*.html"))
+    html_files = html_files_in_root()
     
     if not html_files:
         raise HTTPException(status_code=404, detail="No HTML file found")
@@ -22,67 +179,99 @@ async def read_root():
     html_file = html_files[0]
     
     try:
-        with open(html_file, "r", encoding="utf-8") as f:
-            content = f.read()
-        return HTMLResponse(content=content)
-    except Exception as e:
+        return static_file_response(request, html_file)
+    except OSError as e:
         raise HTTPException(status_code=500, detail=f"Error reading HTML file: {str(e)}")
 
-@app.get("/{filename}")
-async def serve_static_files(filename: str):
-    """Serve static files (JS, CSS, images, etc.) from the current directory"""
-    file_path = CURRENT_DIR / filename
-    
-    if not file_path.exists():
+def get_job_manager(request: Request) -> JobManager:
+    return request.app.state.jobs
+
+def public_job(job: dict) -> dict:
+    """Job status as returned by the API (no server paths)."""
+    return {
+        "job_id": job["id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+        "outputs": sorted(job["outputs"]),
+    }
+
+@app.post("/jobs", status_code=202)
+def submit_job(file: UploadFile = File(...), jobs: JobManager = Depends(get_job_manager)):
+    """Queue a PDF for extraction and return its job ID"""
+    # Plain def: FastAPI runs it in the threadpool, so the upload read and
+    # the workspace write don't block the event loop
+    if not (file.filename or "").lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Only PDF uploads are supported")
+
+    content = file.file.read()
+    try:
+        job = jobs.submit(file.filename, content)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Job queue is full: {e}", headers={"Retry-After": "30"})
+    return public_job(job)
+
+def get_job_or_404(job_id: str, jobs: JobManager) -> dict:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def job_output(job_id: str, name: str, jobs: JobManager) -> str:
+    job = get_job_or_404(job_id, jobs)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    if name not in job["outputs"]:
+        raise HTTPException(status_code=404, detail=f"Job produced no {name} output")
+    return job["outputs"][name]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    """Poll a job's status"""
+    return public_job(get_job_or_404(job_id, jobs))
+
+@app.get("/jobs/{job_id}/data.json")
+async def get_job_data(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    """Fetch the product data JSON of a finished job"""
+    return FileResponse(job_output(job_id, "data", jobs), media_type="application/json")
+
+@app.get("/jobs/{job_id}/html")
+async def get_job_html(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    """Fetch the rendered product page of a finished job"""
+    return FileResponse(job_output(job_id, "html", jobs), media_type="text/html")
+
+@app.get("/jobs/{job_id}/extracted_images/{name}")
+async def get_job_image(request: Request, job_id: str, name: str, jobs: JobManager = Depends(get_job_manager)):
+    """Fetch an image referenced by a finished job's page and data.json"""
+    job = get_job_or_404(job_id, jobs)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    images_dir = Path(job["workspace"], Workspace.IMAGES_DIR).resolve()
+    image_path = (images_dir / name).resolve()
+    if name.startswith(".") or image_path.parent != images_dir:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    if not file_path.is_file():
-        raise HTTPException(status_code=404, detail="Not a file")
-    
-    # Get the file extension to determine content type
-    file_extension = file_path.suffix.lower()
-    
-    # Read file content based on type
+    return static_file_response(request, image_path)
+
+@app.get("/jobs/{job_id}/timings.json")
+async def get_job_timings(job_id: str, jobs: JobManager = Depends(get_job_manager)):
+    """Fetch the per-stage timing report of a finished or failed job"""
+    job = get_job_or_404(job_id, jobs)
+    if not job["timings"]:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return FileResponse(job["timings"], media_type="application/json")
+
+@app.get("/{file_path:path}")
+async def serve_static_files(request: Request, file_path: str):
+    """Serve allowlisted static files (web assets, extracted images, the site) from the current directory"""
+    resolved_path = resolve_static_path(file_path)
     try:
-        if file_extension in ['.js', '.css', '.html', '.txt', '.json', '.xml', '.svg']:
-            # Text-based files
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Set appropriate content type
-            content_type_map = {
-                '.js': 'application/javascript',
-                '.css': 'text/css',
-                '.html': 'text/html',
-                '.txt': 'text/plain',
-                '.json': 'application/json',
-                '.xml': 'application/xml',
-                '.svg': 'image/svg+xml'
-            }
-            content_type = content_type_map.get(file_extension, 'text/plain')
-            
-            return Response(content=content, media_type=content_type)
-            
-        else:
-            # Binary files (images, etc.)
-            with open(file_path, 'rb') as f:
-                content = f.read()
-            
-            # Get MIME type for binary files
-            content_type, _ = mimetypes.guess_type(str(file_path))
-            if not content_type:
-                content_type = 'application/octet-stream'
-            
-            return Response(content=content, media_type=content_type)
-            
-    except Exception as e:
+        return static_file_response(request, resolved_path)
+    except OSError as e:
         raise HTTPException(status_code=500, detail=f"Error reading file: {str(e)}")
 
-@app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy"}
-
 if __name__ == "__main__":
     import uvicorn
     
@@ -91,5 +280,6 @@ if __name__ == "__main__":
     for file in CURRENT_DIR.iterdir():
         if file.is_file():
             print(f"  - {file.name}")
+    print(f"Pre-compressed {precompress_static_files()} static file variants")
     
     uvicorn.run(app, host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -0,0 +1,203 @@
+# -----------------------------------------------------------------------------
+# Batch PDF -> product data pipeline
+# -----------------------------------------------------------------------------
+import argparse
+import contextlib
+import glob
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from logger import setup_logger, log_info
+import metrics
+import build_graph
+import serialization
+from workspace import atomic_open
+from clients import get_mistral_client
+from ocr_cache import ocr_pdf_pages
+from ocr_organizer import process_ocr_pages, organized_data_path
+import main as pipeline
+
+logger = setup_logger()
+
+BATCH_OUTPUT_DIR = "output"
+
+
+def find_pdfs(inputs: List[str]) -> List[Path]:
+    """Expand directories, globs and file paths into a sorted, de-duplicated list of PDFs."""
+    found = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            candidates = path.rglob("*")
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = (Path(p) for p in glob.glob(item, recursive=True))
+        found.extend(p for p in candidates if p.is_file() and p.suffix.lower() == ".pdf")
+    return sorted(set(found))
+
+
+def document_outputs(pdf_path: Path, output_dir: str) -> Tuple[str, str]:
+    """Paths of the organized JSON and product data JSON written for `pdf_path`."""
+    organized_path = organized_data_path(str(pdf_path), output_dir)
+    data_path = os.path.join(output_dir, f"{pdf_path.stem}_data.json")
+    return organized_path, data_path
+
+
+def process_document(pdf_path: Path, output_dir: str, ocr_slots: threading.Semaphore,
+                     llm_slots: threading.Semaphore, mistral_client=None, force: bool = False,
+                     image_dir: Optional[str] = None, compact: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Run one PDF through OCR, organizing and conversion. `ocr_slots` and
+    `llm_slots` bound how many documents may be in the OCR and LLM stages
+    at the same time. Images go to `image_dir` (default: the organizer's
+    shared, content-hashed IMAGE_OUTPUT_DIR). `compact` (default
+    JSON_COMPACT) drops the indentation of the JSON outputs. Stages that
+    are up to date in the document's build manifest (see build_graph) are
+    skipped unless `force` is set; the result's "stages" holds why each stage ran and
+    "data" the converted product data (absent when conversion was skipped).
+    """
+    organized_path, data_path = document_outputs(pdf_path, output_dir)
+    build = build_graph.DocumentBuild(str(pdf_path), output_dir, data_path, force=force, compact=compact)
+    result = {"pdf": str(pdf_path), "status": "done", "data_file": data_path, "stages": {}}
+
+    start = time.perf_counter()
+    organized_data = None  # handed to conversion in memory when organize runs here
+    reasons = result["stages"]["organize"] = build.reasons("organize")
+    if reasons:
+        stage_start = time.perf_counter()
+        with metrics.span("wait.ocr_slot"):
+            ocr_slots.acquire()
+        try:
+            pages = ocr_pdf_pages(mistral_client or get_mistral_client(), str(pdf_path))
+        finally:
+            ocr_slots.release()
+        # Feature splitting calls the LLM
+        with metrics.span("wait.llm_slot"):
+            llm_slots.acquire()
+        try:
+            organized_data = process_ocr_pages(pages, str(pdf_path), output_dir, image_dir, build.compact)
+        finally:
+            llm_slots.release()
+        build.record("organize", time.perf_counter() - stage_start)
+
+    # Checked after organize ran: an unchanged organized JSON needs no conversion
+    reasons = result["stages"]["convert"] = build.reasons("convert")
+    if reasons:
+        stage_start = time.perf_counter()
+        with metrics.span("wait.llm_slot"):
+            llm_slots.acquire()
+        try:
+            result["data"] = pipeline.convert_json_format(organized_data or organized_path, data_path, build.compact)
+        finally:
+            llm_slots.release()
+        build.record("convert", time.perf_counter() - stage_start)
+    elif not result["stages"]["organize"]:
+        result["status"] = "skipped"
+        return result
+    # Processed when any stage ran, even if organize reproduced the same organized JSON
+    metrics.count("documents_total", help="Documents processed")
+
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(inputs: List[str], output_dir: str = BATCH_OUTPUT_DIR, workers: int = 4,
+              ocr_concurrency: int = 2, llm_concurrency: int = 2, force: bool = False,
+              mistral_client=None, jsonl_path: Optional[str] = None,
+              compact: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Process every PDF matched by `inputs` on a thread pool and return a
+    summary report. With `jsonl_path`, the product data of every document
+    is also written there as JSON Lines ({"pdf", "products"} per line, in
+    completion order).
+    """
+    pdfs = find_pdfs(inputs)
+    os.makedirs(output_dir, exist_ok=True)
+    ocr_slots = threading.Semaphore(ocr_concurrency)
+    llm_slots = threading.Semaphore(llm_concurrency)
+
+    report = {"total": len(pdfs), "processed": 0, "skipped": 0, "failed": 0, "failures": [], "documents": []}
+    start = time.perf_counter()
+
+    jsonl = atomic_open(jsonl_path, "wb") if jsonl_path else contextlib.nullcontext()
+    with jsonl as jsonl_file, ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch") as executor:
+        futures = {
+            executor.submit(process_document, pdf, output_dir, ocr_slots, llm_slots, mistral_client, force,
+                            compact=compact): pdf
+            for pdf in pdfs
+        }
+        for future in as_completed(futures):
+            pdf = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                log_info(logger, f"Failed to process {pdf}: {e}\n{traceback.format_exc()}")
+                report["failed"] += 1
+                report["failures"].append({"pdf": str(pdf), "error": str(e)})
+                continue
+
+            # Dropped from the report so a large batch does not hold every document's data
+            data = result.pop("data", None)
+            report["documents"].append(result)
+            if jsonl_file is not None:
+                # Only skipped documents are read back from disk
+                data = data or serialization.load(result["data_file"])
+                serialization.write_jsonl_record(jsonl_file, {"pdf": str(pdf), "products": data["products"]})
+            if result["status"] == "skipped":
+                report["skipped"] += 1
+            else:
+                report["processed"] += 1
+                log_info(logger, f"Processed {pdf} in {result['seconds']:.1f}s")
+
+    elapsed = time.perf_counter() - start
+    report["elapsed_seconds"] = elapsed
+    report["docs_per_minute"] = report["processed"] * 60 / elapsed if elapsed > 0 else 0.0
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"Documents: {report['total']} total, {report['processed']} processed, "
+        f"{report['skipped']} skipped, {report['failed']} failed",
+        f"Elapsed: {report['elapsed_seconds']:.1f}s ({report['docs_per_minute']:.2f} docs/min)",
+    ]
+    for failure in report["failures"]:
+        lines.append(f"  FAILED {failure['pdf']}: {failure['error']}")
+    return "\n".join(lines)
+
+
+def format_explanation(report: Dict[str, Any]) -> str:
+    """Why each stage of each document ran or was skipped."""
+    return "\n".join(build_graph.format_explanation(document["pdf"], document["stages"])
+                     for document in sorted(report["documents"], key=lambda document: document["pdf"]))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert a directory or glob of PDFs into product data JSON.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default=BATCH_OUTPUT_DIR)
+    parser.add_argument("-w", "--workers", type=int, default=4, help="documents processed at once")
+    parser.add_argument("--ocr-concurrency", type=int, default=2, help="documents in the OCR stage at once")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="documents in the LLM stages at once")
+    parser.add_argument("--force", action="store_true", help="reprocess documents whose outputs are up to date")
+    parser.add_argument("--explain", action="store_true", help="print why each stage ran or was skipped")
+    parser.add_argument("--jsonl", help="also write every document's products to this JSON Lines file")
+    parser.add_argument("--compact", action="store_true", help="write JSON outputs without indentation")
+    args = parser.parse_args(argv)
+
+    report = run_batch(args.inputs, args.output_dir, args.workers, args.ocr_concurrency,
+                       args.llm_concurrency, args.force, jsonl_path=args.jsonl, compact=args.compact or None)
+    print(format_report(report))
+    if args.explain:
+        print(format_explanation(report))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,96 @@
+# -----------------------------------------------------------------------------
+# Batched vs per-section feature splitting: LLM calls, tokens and latency
+#
+#   python benchmarks/bench_feature_split.py [--documents 20] [--latency 0.3]
+#   GROQ_API_KEY=... python benchmarks/bench_feature_split.py --live
+#
+# Runs extract_features_from_image_sections in both modes over synthetic
+# documents. Offline, FakeLLM simulates a per-request latency plus a
+# per-output-token cost and reports prompt tokens as chars / 4; with --live
+# the real Groq client is used and the token counts come from its usage
+# reports. The LLM cache is bypassed so every run makes real requests.
+# -----------------------------------------------------------------------------
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict
+
+os.environ.setdefault("LLM_CACHE_PATH", ":memory:")
+os.environ.setdefault("LLM_CACHE_BYPASS", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clients  # noqa: E402
+import metrics  # noqa: E402
+import ocr_organizer  # noqa: E402
+from fixtures import FakeLLM, synthetic_ocr_response  # noqa: E402
+
+
+def _counter_total(counters: Dict[str, float], prefix: str) -> float:
+    return sum(value for name, value in counters.items() if name.startswith(prefix))
+
+
+def run_mode(mode: str, texts, client, max_in_flight: int, local_threshold: float) -> Dict[str, Any]:
+    start = time.perf_counter()
+    with metrics.collect() as report:
+        features = [ocr_organizer.extract_features_from_image_sections(text, max_in_flight, client, mode,
+                                                                       local_threshold)
+                    for text in texts]
+    seconds = time.perf_counter() - start
+    timings = report.to_dict()
+    calls = sum(stage["count"] for name, stage in timings["stages"].items() if name.startswith("llm."))
+    return {
+        "mode": mode,
+        "features": features,
+        "seconds": seconds,
+        "calls": calls,
+        "prompt_tokens": _counter_total(timings["counters"], "llm_prompt_tokens_total"),
+        "completion_tokens": _counter_total(timings["counters"], "llm_completion_tokens_total"),
+        "retried_items": _counter_total(timings["counters"], 'feature_split_batch_items_total{result="failed"}'),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare batched and per-section feature splitting.")
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3, help="fake LLM seconds per request")
+    parser.add_argument("--seconds-per-token", type=float, default=0.002, help="fake LLM seconds per output token")
+    parser.add_argument("--max-in-flight", type=int, default=ocr_organizer.FEATURE_MAX_IN_FLIGHT)
+    parser.add_argument("--local-threshold", type=float, default=1.01,
+                        help="local splitter threshold (default: send every section to the LLM)")
+    parser.add_argument("--live", action="store_true", help="call Groq (needs GROQ_API_KEY)")
+    args = parser.parse_args()
+
+    logging.getLogger("suvetha").setLevel(logging.WARNING)
+    if args.live:
+        client = clients.get_groq_client()
+    else:
+        client = FakeLLM(args.latency, args.seconds_per_token)
+
+    # One product document per seed, a few pages each
+    texts = [
+        "\n".join(page["markdown"] for page in synthetic_ocr_response(2, image_bytes=16, seed=seed)["pages"])
+        for seed in range(args.documents)
+    ]
+
+    results = [run_mode(mode, texts, client, args.max_in_flight, args.local_threshold)
+               for mode in ("per_section", "batched")]
+    per_section, batched = results
+    print(f"{args.documents} documents, max in flight {args.max_in_flight}, "
+          f"{'live Groq' if args.live else f'fake LLM {args.latency}s + {args.seconds_per_token}s/token'}")
+    print(f"  {'mode':12} {'calls':>6} {'prompt tok':>11} {'output tok':>11} {'seconds':>9} {'retried':>8}")
+    for result in results:
+        print(f"  {result['mode']:12} {result['calls']:6d} {result['prompt_tokens']:11.0f} "
+              f"{result['completion_tokens']:11.0f} {result['seconds']:9.2f} {result['retried_items']:8.0f}")
+    if per_section["prompt_tokens"]:
+        print(f"  batched uses {batched['prompt_tokens'] / per_section['prompt_tokens']:.0%} of the prompt tokens "
+              f"and {batched['seconds'] / per_section['seconds']:.0%} of the time")
+
+    same = sum(a == b for a, b in zip(per_section["features"], batched["features"]))
+    print(f"  identical features: {same}/{len(texts)} documents")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
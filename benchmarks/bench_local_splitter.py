@@ -0,0 +1,67 @@
+# -----------------------------------------------------------------------------
+# Local feature splitter: LLM calls avoided and agreement on a labeled corpus
+#
+#   python benchmarks/bench_local_splitter.py [--corpus benchmarks/data/feature_split_labeled.jsonl]
+#
+# For each confidence threshold, reports the share of sections local_split
+# handles on its own (= LLM calls avoided) and how often its topic matches
+# the label on those sections. fallback_parse on every section is shown as
+# the previous no-LLM baseline, plus the local splitter's timing.
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_organizer  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "feature_split_labeled.jsonl")
+THRESHOLDS = [0.5, 0.6, 0.7, 0.75, 0.8, 0.9, 1.01]
+
+
+def load_corpus(path: str) -> List[Dict[str, str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def topic_of(result: Dict[str, str]) -> str:
+    return " ".join(next(iter(result)).split())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Evaluate local_split against a labeled corpus.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    logging.getLogger("suvetha").setLevel(logging.WARNING)
+    corpus = load_corpus(args.corpus)
+
+    start = time.perf_counter()
+    scored = [(item, *ocr_organizer.local_split(item["text"])) for item in corpus]
+    per_section_us = (time.perf_counter() - start) / len(corpus) * 1e6
+
+    baseline = sum(topic_of(ocr_organizer.fallback_parse(item["text"])) == item["topic"] for item in corpus)
+    print(f"{len(corpus)} labeled sections; local_split {per_section_us:.1f} us/section")
+    print(f"fallback_parse on every section: {baseline / len(corpus):.0%} topic agreement")
+    print(f"  {'threshold':>9} {'local':>7} {'LLM calls avoided':>18} {'agreement (local)':>18}")
+    for threshold in THRESHOLDS:
+        local = [(item, result) for item, result, confidence in scored if confidence >= threshold]
+        agree = sum(topic_of(result) == item["topic"] for item, result in local)
+        rate = f"{agree / len(local):.0%}" if local else "-"
+        print(f"  {threshold:9.2f} {len(local):7d} {len(local) / len(corpus):18.0%} {rate:>18}")
+
+    if args.show_errors:
+        for item, result, confidence in scored:
+            if topic_of(result) != item["topic"]:
+                print(f"  {confidence:.2f} {topic_of(result)!r} != {item['topic']!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,184 @@
+# -----------------------------------------------------------------------------
+# Golden comparison and micro-benchmark for extract_product_info_from_text
+#
+#   python benchmarks/bench_product_info.py [--pages 2000] [--repeat 5]
+#
+# Runs the single-pass classifier against the previous three-pass
+# implementation (kept below as the reference) on a generated corpus of
+# OCR-like markdown, checks that both produce identical output and
+# reports the timings.
+# -----------------------------------------------------------------------------
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_organizer  # noqa: E402
+
+
+def legacy_first_word(text: str) -> str:
+    cleaned_text = re.sub(r'[^\w\s]', ' ', text)
+    words = [word.strip() for word in cleaned_text.split() if word.strip()]
+    return words[0] if words else ""
+
+
+def legacy_extract_product_info_from_text(text: str) -> Dict[str, Any]:
+    text = re.sub(r'!\[.*?\]\(.*?\)', '', text)
+
+    product_info = {
+        "product_name": "",
+        "product_description": "",
+        "specifications": {},
+        "features": [],
+        "model_number": "",
+        "brand": ""
+    }
+
+    lines = text.split('\n')
+
+    for line in lines:
+        line = line.strip()
+        if not line or re.match(r'^\|.*\|$', line):
+            continue
+        first_word = legacy_first_word(line)
+        if first_word and len(first_word) > 2:
+            product_info["product_name"] = first_word
+            break
+
+    for line in lines:
+        line = line.strip()
+        if not line or re.match(r'^\|.*\|$', line):
+            continue
+
+        model_match = re.search(r'Model[:\s]+([A-Z0-9\-]+)', line, re.IGNORECASE)
+        if model_match:
+            product_info["model_number"] = model_match.group(1)
+
+        brand_match = re.search(r'Brand[:\s]+(\w+)', line, re.IGNORECASE)
+        if brand_match:
+            product_info["brand"] = brand_match.group(1)
+
+        spec_match = re.match(r'^([A-Za-z\s]+):\s*(.+)$', line)
+        if spec_match:
+            key = spec_match.group(1).strip()
+            value = spec_match.group(2).strip()
+            product_info["specifications"][key] = value
+
+        if not product_info["product_description"]:
+            if '#' in line and '**' in line:
+                desc_match = re.search(r'\*\*(.+?)\*\*', line)
+                if desc_match:
+                    product_info["product_description"] = desc_match.group(1).strip()
+
+    if not product_info["product_name"]:
+        for line in lines:
+            line = line.strip()
+            if len(line) > 2 and not line.isdigit():
+                first_word = legacy_first_word(line)
+                if first_word:
+                    product_info["product_name"] = first_word
+                    break
+
+    if not product_info["product_description"]:
+        description_lines = []
+        for line in lines:
+            if len(line.strip()) > 20:
+                description_lines.append(line.strip())
+            if len(description_lines) >= 3:
+                break
+        product_info["product_description"] = " ".join(description_lines)
+
+    return product_info
+
+
+LINE_TEMPLATES = [
+    "# **{word} Backpack Blower** high performance",
+    "## {word} series",
+    "Model: MS{num}-{word}",
+    "model {word}{num}",
+    "Brand: Maruyama",
+    "BRAND:{word}",
+    "Engine Displacement: {num} cc",
+    "Fuel Tank Capacity: {num}.{num} L",
+    "Weight : {num} kg",
+    "| Engine | {num}cc |",
+    "| --- | --- |",
+    "|{word}|",
+    "![img-{num}.jpeg](img-{num}.jpeg)",
+    "{word} The solid steel inner drive-shaft is threaded at the clutch end, which eliminates vibration.",
+    "{num}",
+    "-- {word}",
+    "é {word}: ünïcode value",
+    "**{word}** bold without heading",
+    "  ",
+    "",
+    "ab",
+    "12 {word}",
+]
+
+WORDS = ["Treaded", "Clutch", "H.E.R.E", "Shaft", "MS75", "Sprayer", "x", "Low-emission", "ab", "ÉCO"]
+
+
+def make_page(rng: random.Random, lines: int) -> str:
+    out = []
+    for _ in range(lines):
+        template = rng.choice(LINE_TEMPLATES)
+        out.append(template.format(word=rng.choice(WORDS), num=rng.randint(0, 999)))
+    return "\n".join(out)
+
+
+def make_corpus(seed: int = 7) -> List[str]:
+    """Small documents that exercise every fallback, including no name / no description cases."""
+    rng = random.Random(seed)
+    corpus = ["", "\n\n", "12\n| a | b |\n", "ab\n|MS75 blower|\n", "| only | table |\n| --- | --- |"]
+    for size in (1, 2, 3, 5, 10, 40):
+        corpus.extend(make_page(rng, size) for _ in range(200))
+    return corpus
+
+
+def timed(fn, texts: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare extract_product_info_from_text against the legacy implementation.")
+    parser.add_argument("--pages", type=int, default=2000, help="pages in the large benchmark document")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    ocr_organizer.logger.setLevel(logging.WARNING)
+    current = ocr_organizer.extract_product_info_from_text
+
+    corpus = make_corpus()
+    mismatches = [text for text in corpus if current(text) != legacy_extract_product_info_from_text(text)]
+    print(f"golden corpus: {len(corpus)} documents, {len(mismatches)} mismatches")
+    if mismatches:
+        print(repr(mismatches[0][:500]))
+        return 1
+
+    rng = random.Random(11)
+    large = "\n\n".join(make_page(rng, 60) for _ in range(args.pages))
+    assert current(large) == legacy_extract_product_info_from_text(large)
+
+    legacy_s = timed(legacy_extract_product_info_from_text, [large], args.repeat)
+    current_s = timed(current, [large], args.repeat)
+    print(f"large document: {len(large) / 1e6:.1f} MB, {large.count(chr(10)) + 1} lines")
+    print(f"  three-pass (legacy): {legacy_s * 1000:8.1f} ms")
+    print(f"  single-pass        : {current_s * 1000:8.1f} ms  ({legacy_s / current_s:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,133 @@
+# -----------------------------------------------------------------------------
+# JSON serialization benchmark on image-heavy artifacts
+#
+#   python benchmarks/bench_serialization.py [--images 60] [--image-kb 200] [--repeat 5]
+#
+# Builds an inline-mode organized document (base64 image payloads, as in
+# IMAGE_MODE=inline) and the data.json it converts to, then times the
+# artifact I/O between the organize and convert stages:
+#   before: json indent=4 write, re-read from disk, json indent=2 write
+#   after:  serialization.dump with the organized dict handed over in memory,
+#           for each available backend, pretty and compact.
+# Every variant is checked to round-trip to the same data.
+# -----------------------------------------------------------------------------
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+
+
+def make_fixture(images: int, image_kb: int, seed: int = 7) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(organized data, converted data) sharing `images` base64 payloads of about `image_kb` KB each."""
+    rng = random.Random(seed)
+    payloads = [
+        "data:image/jpeg;base64," + base64.b64encode(rng.randbytes(image_kb * 1024)).decode("ascii")
+        for _ in range(images)
+    ]
+    page_images = [
+        {"id": f"img-{index}.jpeg", "filename": f"page_{index // 3 + 1}image{index + 1}.jpg",
+         "local_path": f"extracted_images/page_{index // 3 + 1}image{index + 1}.jpg", "base64_data": payload,
+         "page_number": index // 3 + 1, "size_estimate": len(payload) * 3 // 4}
+        for index, payload in enumerate(payloads)
+    ]
+    text = "\n".join(f"Feature {index} Title Here describes the feature in detail." for index in range(200))
+    organized = {
+        "products": [{
+            "product_name": "MS25 blower",
+            "product_description": text[:400],
+            "features": [{f"Feature {index}": "describes the feature in detail."} for index in range(4)],
+            "tables": [{"headers": ["Engine", "25cc"], "rows": [["Tank", "2 L"]] * 20}],
+            "all_page_images": page_images,
+            "full_text": text,
+        }],
+        "all_extracted_images": page_images,
+        "metadata": {"total_pages": images // 3 + 1, "total_images": images, "total_text_length": len(text)},
+    }
+    converted = {"products": [{
+        "product_name": "MS25 blower",
+        "product_description": text[:400],
+        "features": organized["products"][0]["features"],
+        "specifications": [{"label": "Tank", "value": "2 L"}] * 20,
+        "mainImage": payloads[0],
+        "thumbnails": payloads[1:],
+    }]}
+    return organized, converted
+
+
+def legacy_io(organized: Dict[str, Any], converted: Dict[str, Any], directory: str) -> int:
+    organized_path = os.path.join(directory, "organized.json")
+    with open(organized_path, "w", encoding="utf-8") as f:
+        json.dump(organized, f, indent=4, ensure_ascii=False)
+    with open(organized_path, "r") as f:
+        json.load(f)
+    data_path = os.path.join(directory, "data.json")
+    with open(data_path, "w") as f:
+        json.dump(converted, f, indent=2)
+    return os.path.getsize(organized_path) + os.path.getsize(data_path)
+
+
+def handoff_io(compact: bool) -> Callable[[Dict[str, Any], Dict[str, Any], str], int]:
+    def run(organized: Dict[str, Any], converted: Dict[str, Any], directory: str) -> int:
+        organized_path = serialization.dump(organized, os.path.join(directory, "organized.json"), 4, compact)
+        data_path = serialization.dump(converted, os.path.join(directory, "data.json"), 2, compact)
+        return os.path.getsize(organized_path) + os.path.getsize(data_path)
+    return run
+
+
+def round_trips(organized: Dict[str, Any], converted: Dict[str, Any], directory: str) -> bool:
+    return (serialization.load(os.path.join(directory, "organized.json")) == organized
+            and serialization.load(os.path.join(directory, "data.json")) == converted)
+
+
+def best_of(fn: Callable[[], int], repeat: int) -> Tuple[float, int]:
+    timings, size = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), size
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark artifact JSON I/O on image-heavy documents.")
+    parser.add_argument("--images", type=int, default=60)
+    parser.add_argument("--image-kb", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    organized, converted = make_fixture(args.images, args.image_kb)
+    backends = ["json"] + (["orjson"] if serialization._orjson() else [])
+    if len(backends) == 1:
+        print("orjson is not installed; timing the standard library backend only")
+
+    variants = [("before: json indent + re-read", None, legacy_io)]
+    for backend in backends:
+        variants.append((f"after: {backend} pretty, in memory", backend, handoff_io(False)))
+        variants.append((f"after: {backend} compact, in memory", backend, handoff_io(True)))
+
+    print(f"{args.images} images of {args.image_kb} KB, best of {args.repeat}")
+    baseline, failures = None, 0
+    for label, backend, fn in variants:
+        if backend:
+            serialization.JSON_BACKEND = backend
+        with tempfile.TemporaryDirectory(prefix="bench-serialization-") as directory:
+            seconds, size = best_of(lambda: fn(organized, converted, directory), args.repeat)
+            ok = round_trips(organized, converted, directory)
+        failures += not ok
+        baseline = baseline or seconds
+        print(f"  {label:36} {seconds * 1000:8.1f} ms  {size / 2 ** 20:7.1f} MB  "
+              f"x{baseline / seconds:4.1f}  {'ok' if ok else 'ROUND TRIP FAILED'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
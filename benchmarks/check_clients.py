@@ -0,0 +1,170 @@
+# -----------------------------------------------------------------------------
+# Shared client layer against a local fake provider
+#
+#   python benchmarks/check_clients.py
+#
+# Starts an OpenAI-compatible fake chat endpoint on localhost that fails on
+# a script (429 with Retry-After, 503, ...) and checks that clients.Provider
+# honours Retry-After, backs off, opens and recovers its circuit breaker
+# and keeps to its token bucket. When the groq SDK is installed the same
+# server is called through the shared, pooled Groq client as well, and the
+# number of TCP connections it opened is reported.
+# -----------------------------------------------------------------------------
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clients  # noqa: E402
+
+
+class FakeProvider(ThreadingHTTPServer):
+    """Answers POST .../chat/completions; `script` holds (status, headers) replies to send first."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.script: List[Tuple[int, dict]] = []
+        self.requests = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            status, headers = server.script.pop(0) if server.script else (200, {})
+        if status == 200:
+            body = json.dumps({
+                "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": "fake",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": '{"Fake Topic": "fake description"}'}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+            }).encode()
+        else:
+            body = json.dumps({"error": {"message": f"fake {status}"}}).encode()
+        self.send_response(status)
+        for name, value in {"Content-Type": "application/json", **headers}.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPStatusError(Exception):
+    """Shaped like the SDK errors: `status_code` plus a response with headers."""
+
+    def __init__(self, error: urllib.error.HTTPError):
+        super().__init__(f"HTTP {error.code}")
+        self.status_code = error.code
+        self.response = error
+
+
+def post(url: str) -> dict:
+    request = urllib.request.Request(url + "/openai/v1/chat/completions", data=b"{}", method="POST",
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        raise HTTPStatusError(e) from None
+
+
+def check(name: str, condition: bool, detail: str = "") -> bool:
+    print(f"  {'ok  ' if condition else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    return condition
+
+
+def main() -> int:
+    logging.getLogger("suvetha").setLevel(logging.WARNING)
+    server = FakeProvider()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = []
+
+    print("retry")
+    provider = clients.Provider("fake", 6000, 10, max_retries=3, backoff_base=0.05,
+                                breaker=clients.CircuitBreaker(3, 0.5))
+    server.script = [(429, {"Retry-After": "1"}), (503, {})]
+    start = time.perf_counter()
+    answer = provider.call(post, server.url)
+    elapsed = time.perf_counter() - start
+    results.append(check("succeeds after 429 and 503", answer["choices"][0]["message"]["content"].startswith("{")))
+    results.append(check("waits for Retry-After", 1.0 <= elapsed < 2.0, f"{elapsed:.2f}s"))
+    server.script = [(400, {})]
+    try:
+        provider.call(post, server.url)
+        results.append(check("400 is not retried", False))
+    except HTTPStatusError:
+        results.append(check("400 is not retried", server.script == [] and provider.breaker.state == "closed"))
+
+    print("circuit breaker")
+    server.script = [(500, {})] * 3
+    requests_before = server.requests
+    try:
+        provider.call(post, server.url)
+    except HTTPStatusError:
+        pass
+    results.append(check("opens after 3 failures", provider.breaker.state == "open",
+                         f"{server.requests - requests_before} requests"))
+    requests_before = server.requests
+    try:
+        provider.call(post, server.url)
+        results.append(check("fails fast while open", False))
+    except clients.CircuitOpenError:
+        results.append(check("fails fast while open", server.requests == requests_before))
+    time.sleep(0.6)
+    provider.call(post, server.url)
+    results.append(check("closes after a successful trial call", provider.breaker.state == "closed"))
+
+    print("rate limit")
+    limited = clients.Provider("fake-limited", 600, 2)  # 10 per second, burst 2
+    start = time.perf_counter()
+    for _ in range(7):
+        limited.call(post, server.url)
+    elapsed = time.perf_counter() - start
+    results.append(check("7 calls at 10/s with burst 2 take ~0.5s", 0.45 <= elapsed < 0.9, f"{elapsed:.2f}s"))
+
+    if importlib.util.find_spec("groq") is None:
+        print("groq SDK not installed; skipping the pooled client check")
+    else:
+        print("pooled Groq client")
+        os.environ.setdefault("GROQ_API_KEY", "fake")
+        os.environ["GROQ_BASE_URL"] = server.url
+        client = clients.get_groq_client()
+        server.connections.clear()
+        server.script = [(429, {"Retry-After": "0"})]
+        for _ in range(5):
+            completion = client.chat.completions.create(model="fake", messages=[{"role": "user", "content": "x"}])
+        results.append(check("SDK call retried through the provider", completion.usage.completion_tokens == 5))
+        results.append(check("connections reused", len(server.connections) == 1, f"{len(server.connections)} opened"))
+
+    server.shutdown()
+    print(f"{sum(results)}/{len(results)} checks passed")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+# -----------------------------------------------------------------------------
+# Import-time guard
+#
+#   python benchmarks/check_import_time.py [--runs 5] [--budget-ratio 8]
+#
+# Imports each pipeline module in a fresh interpreter under
+# `python -X importtime` (inside an empty scratch directory) and fails when
+#   - a heavy library (groq, mistralai, httpx, pybars, dotenv, PIL, pymupdf,
+#     orjson) is imported eagerly,
+#   - the import creates files or directories (log files, caches, ...),
+#   - the module's median cumulative import time over --runs imports is more
+#     than --budget-ratio times that of `import logging` on the same machine
+#     (or over --budget-ms, when given).
+# Modules built on a framework (app on fastapi) are measured net of the
+# framework's own import time and imports, and skipped when it is missing.
+# -----------------------------------------------------------------------------
+import argparse
+import importlib.util
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["logger", "metrics", "llm_cache", "clients", "ocr_cache", "ocr_organizer", "main", "renderer", "batch",
+           "jobs", "site_builder", "build_graph", "workspace", "serialization", "app"]
+LAZY_MODULES = ["groq", "mistralai", "httpx", "pybars", "dotenv", "PIL", "pymupdf", "orjson"]
+# Stdlib import the budget is relative to, so it scales with the machine
+BASELINE_MODULE = "logging"
+# Modules whose import cost is mostly a framework's: judged net of it
+FRAMEWORKS = {"app": "fastapi"}
+
+# "import time: self [us] | cumulative | imported package"
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _import_once(module: str) -> Dict[str, object]:
+    with tempfile.TemporaryDirectory(prefix="importtime-") as scratch:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])),
+                   LOG_DIR=os.path.join(scratch, "logs"))
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              cwd=scratch, env=env, capture_output=True, text=True)
+        created = sorted(os.listdir(scratch))
+
+    imported, cumulative_us = set(), None
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        imported.add(name.split(".")[0])
+        if name == module and not match.group(3).strip(" "):
+            cumulative_us = int(match.group(2))
+    if proc.returncode != 0:
+        error = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        return {"module": module, "error": error[-1] if error else "import failed"}
+    return {"module": module, "cumulative_ms": (cumulative_us or 0) / 1000, "imported": imported, "created": created}
+
+
+def import_profile(module: str, runs: int = 1) -> Dict[str, object]:
+    """_import_once `runs` times; cumulative_ms is the median, so one slow run does not fail the check."""
+    profiles = [_import_once(module) for _ in range(max(1, runs))]
+    errors = [profile for profile in profiles if "error" in profile]
+    if errors:
+        return errors[0]
+    profile = profiles[0]
+    profile["cumulative_ms"] = statistics.median(p["cumulative_ms"] for p in profiles)
+    return profile
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Fail when importing a pipeline module is slow or has side effects.")
+    parser.add_argument("--runs", type=int, default=5, help="imports per module; the median time is compared")
+    parser.add_argument("--budget-ratio", type=float, default=8.0,
+                        help=f"import time allowed per module, as a multiple of `import {BASELINE_MODULE}`")
+    parser.add_argument("--budget-ms", type=float, default=None, help="absolute budget instead of --budget-ratio")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args(argv)
+
+    if args.budget_ms is None:
+        baseline = import_profile(BASELINE_MODULE, args.runs)
+        budget_ms = args.budget_ratio * baseline["cumulative_ms"]
+        print(f"  budget {budget_ms:.0f} ms ({args.budget_ratio:g} x import {BASELINE_MODULE}, "
+              f"{baseline['cumulative_ms']:.1f} ms)")
+    else:
+        budget_ms = args.budget_ms
+
+    failures = 0
+    for module in args.modules:
+        framework = FRAMEWORKS.get(module)
+        if framework and importlib.util.find_spec(framework) is None:
+            print(f"  skip {module:14} {framework} is not installed")
+            continue
+        profile = import_profile(module, args.runs)
+        if "error" in profile:
+            print(f"  FAIL {module:14} {profile['error']}")
+            failures += 1
+            continue
+        if framework:
+            base = import_profile(framework, args.runs)
+            profile["cumulative_ms"] -= base.get("cumulative_ms", 0)
+            profile["imported"] -= base.get("imported", set())
+        problems = [f"imports {name}" for name in LAZY_MODULES if name in profile["imported"]]
+        problems += [f"creates {name}" for name in profile["created"]]
+        if profile["cumulative_ms"] > budget_ms:
+            problems.append(f"over the {budget_ms:.0f} ms budget")
+        failures += bool(problems)
+        print(f"  {'FAIL' if problems else 'ok  '} {module:14} {profile['cumulative_ms']:8.1f} ms  {', '.join(problems)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
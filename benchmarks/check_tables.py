@@ -0,0 +1,66 @@
+# -----------------------------------------------------------------------------
+# Golden cases for the Markdown pipe-table parser
+#
+#   python benchmarks/check_tables.py
+#
+# Runs ocr_organizer.extract_tables_from_text on small OCR-shaped snippets
+# (separators, escaped pipes, multi-line cells, unclosed rows, several
+# tables per page) and compares the result with the expected tables.
+# -----------------------------------------------------------------------------
+import os
+import sys
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_organizer  # noqa: E402
+
+
+def table(headers: List[str], rows: List[List[str]], has_separator: bool = True) -> Dict[str, Any]:
+    return {"headers": headers, "rows": rows, "page_number": None, "has_separator": has_separator}
+
+
+GOLDEN_CASES = [
+    ("header and separator",
+     "| Engine | 25cc |\n| --- | --- |\n| Tank | 2 L |",
+     [table(["Engine", "25cc"], [["Tank", "2 L"]])]),
+    ("no separator",
+     "| Engine | 25cc |\n| Tank | 2 L |",
+     [table(["Engine", "25cc"], [["Tank", "2 L"]], has_separator=False)]),
+    ("short rows padded to the header width",
+     "| a | b | c |\n|:-|:-:|-:|\n| 1 |",
+     [table(["a", "b", "c"], [["1", "", ""]])]),
+    ("escaped pipe and <br>",
+     "| Name | Note |\n|---|---|\n| A \\| B | one<br>two |",
+     [table(["Name", "Note"], [["A | B", "one\ntwo"]])]),
+    ("multi-line cell",
+     "| Name | Note |\n|---|---|\n| A | first line\nsecond line |",
+     [table(["Name", "Note"], [["A", "first line\nsecond line"]])]),
+    ("two tables split by prose",
+     "| a | b |\n|---|---|\n| 1 | 2 |\nText between.\n| x | y |\n|---|---|\n| 3 | 4 |",
+     [table(["a", "b"], [["1", "2"]]), table(["x", "y"], [["3", "4"]])]),
+    # Regression: an unclosed row used to swallow the prose and the next table
+    ("unclosed row ends at prose",
+     "| a | b\nSome paragraph text here.\n\nMore text.\n| x | y |\n|---|---|\n| 1 | 2 |",
+     [table(["a", "b"], [], has_separator=False), table(["x", "y"], [["1", "2"]])]),
+    ("rows without trailing pipes",
+     "| a | b\n|---|---\n| 1 | 2\n\nAfter.",
+     [table(["a", "b"], [["1", "2"]])]),
+]
+
+
+def main() -> int:
+    failures = 0
+    for name, text, expected in GOLDEN_CASES:
+        actual = ocr_organizer.extract_tables_from_text(text)
+        ok = actual == expected
+        failures += not ok
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+        if not ok:
+            print(f"       expected {expected}\n       got      {actual}")
+    print(f"{len(GOLDEN_CASES) - failures}/{len(GOLDEN_CASES)} golden cases passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,187 @@
+# -----------------------------------------------------------------------------
+# Offline fixtures for the pipeline benchmarks
+#
+# Recorded OCR responses live in benchmarks/fixtures/<name>.ocr.jsonl.gz
+# (see record_fixtures.py). Synthetic documents of any size are generated
+# here with the same shape as `ocr_response.model_dump()`, and FakeLLM
+# stands in for the Groq client with a configurable latency.
+# -----------------------------------------------------------------------------
+import base64
+import gzip
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+RECORDED_DOCUMENTS = ["test", "test_2"]
+
+_FEATURES = [
+    "Treaded Clutch Shaft The solid steel inner drive-shaft is threaded at the clutch end, which eliminates vibration.",
+    "H.E.R.E Technology High Efficiency Recirculatory Engine A unique engineered system that is low emission, "
+    "high power and highly fuel efficient. EU stage 2 compliant.",
+    "Anti-Vibration System Rubber dampers isolate the engine from the handles for all-day comfort.",
+    "Large Fuel Tank The 1.2 L tank gives longer run times between refills.",
+    "Easy Start Primer bulb and decompression valve reduce pull force by 40%.",
+]
+
+
+def fixture_path(name: str) -> str:
+    return os.path.join(FIXTURE_DIR, f"{name}.ocr.jsonl.gz")
+
+
+def save_recorded(name: str, response_dict: Dict[str, Any]) -> str:
+    """Store an OCR response dict as gzipped JSON Lines: a header line, then one line per page."""
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    path = fixture_path(name)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        header = {k: v for k, v in response_dict.items() if k != "pages"}
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for page in response_dict.get("pages", []):
+            f.write(json.dumps(page, ensure_ascii=False) + "\n")
+    return path
+
+
+def load_recorded(name: str) -> Optional[Dict[str, Any]]:
+    path = fixture_path(name)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        response_dict = json.loads(f.readline())
+        response_dict["pages"] = [json.loads(line) for line in f if line.strip()]
+    return response_dict
+
+
+def _fake_jpeg(rng: random.Random, size: int) -> str:
+    # JPEG SOI/EOI markers around random bytes; only the size and uniqueness matter here
+    payload = b"\xff\xd8\xff\xe0" + rng.randbytes(size) + b"\xff\xd9"
+    return "data:image/jpeg;base64," + base64.b64encode(payload).decode("ascii")
+
+
+def synthetic_page(rng: random.Random, page_index: int, first_image: int, images_per_page: int,
+                   image_bytes: int) -> Dict[str, Any]:
+    lines = [
+        f"# **MS{page_index:04d} Backpack Blower** high performance",
+        f"Model: MS{page_index:04d}-BX",
+        "Brand: Maruyama",
+        f"Engine Displacement: {rng.randint(20, 80)} cc",
+        f"Weight: {rng.randint(3, 15)} kg",
+        "",
+        "| Specification | Value |",
+        "| --- | --- |",
+        f"| Engine | {rng.randint(20, 80)}cc |",
+        f"| Fuel Tank | {rng.randint(5, 20) / 10} L |",
+        f"| Noise Level | {rng.randint(80, 110)} dB(A)<br>at operator ear |",
+        "",
+    ]
+    images = []
+    for offset in range(images_per_page):
+        image_id = f"img-{first_image + offset}.jpeg"
+        lines.append(f"![{image_id}]({image_id})")
+        lines.append(rng.choice(_FEATURES))
+        lines.append("")
+        images.append({
+            "id": image_id,
+            "top_left_x": 0, "top_left_y": 0, "bottom_right_x": 100, "bottom_right_y": 100,
+            "image_base64": _fake_jpeg(rng, image_bytes),
+        })
+    return {
+        "index": page_index,
+        "markdown": "\n".join(lines),
+        "images": images,
+        "dimensions": {"dpi": 200, "height": 2200, "width": 1700},
+    }
+
+
+def iter_synthetic_pages(pages: int, images_per_page: int = 3, image_bytes: int = 2048,
+                         seed: int = 1) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    for page_index in range(pages):
+        yield synthetic_page(rng, page_index, page_index * images_per_page, images_per_page, image_bytes)
+
+
+def synthetic_ocr_response(pages: int, images_per_page: int = 3, image_bytes: int = 2048,
+                           seed: int = 1) -> Dict[str, Any]:
+    """Deterministic OCR response dict with `pages` pages and pages * images_per_page images."""
+    return {
+        "pages": list(iter_synthetic_pages(pages, images_per_page, image_bytes, seed)),
+        "model": "mistral-ocr-latest",
+        "usage_info": {"pages_processed": pages, "doc_size_bytes": None},
+    }
+
+
+def load_document(name: str) -> Dict[str, Any]:
+    """A recorded fixture by name, or "synthetic-<pages>" for a generated one."""
+    if name.startswith("synthetic-"):
+        return synthetic_ocr_response(int(name.split("-", 1)[1]))
+    response_dict = load_recorded(name)
+    if response_dict is None:
+        raise FileNotFoundError(f"No recorded fixture {fixture_path(name)}; run benchmarks/record_fixtures.py")
+    return response_dict
+
+
+class _Obj:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def _split_words(text: str) -> List[str]:
+    words = text.split()
+    return [" ".join(words[:3]), " ".join(words[3:])]
+
+
+class FakeLLM:
+    """
+    Groq-compatible client (`client.chat.completions.create`) that answers
+    after `latency` seconds plus `seconds_per_token` per completion token.
+    Feature-split prompts get a deterministic {"topic": "description"} split
+    of their input (a JSON array for batched prompts); streamed requests get
+    a fixed description in a few chunks. Calls and peak concurrency are counted.
+    """
+
+    def __init__(self, latency: float = 0.0, seconds_per_token: float = 0.0):
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.chat = _Obj(completions=self)
+
+    def create(self, messages: List[Dict[str, str]], stream: bool = False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            prompt = messages[-1]["content"]
+            if stream:
+                content = ("A durable, efficient tool built for professionals. "
+                           "Lightweight design and low emissions. Order yours today.")
+            elif "\nInputs:\n" in prompt:
+                inputs = json.loads(prompt.rsplit("\nInputs:\n", 1)[1].rsplit("\nOutput:", 1)[0])
+                content = json.dumps([
+                    dict(zip(("topic", "description"), _split_words(item["text"])), id=item["id"]) for item in inputs
+                ])
+            else:
+                content = json.dumps(dict([_split_words(prompt.rsplit('Input: "', 1)[-1].rsplit('"', 1)[0])]))
+
+            usage = _Obj(prompt_tokens=len(prompt) // 4, completion_tokens=len(content) // 4)
+            delay = self.latency + self.seconds_per_token * usage.completion_tokens
+            if delay:
+                time.sleep(delay)
+            if stream:
+                return self._stream(content, usage)
+            return _Obj(choices=[_Obj(message=_Obj(content=content))], usage=usage)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    @staticmethod
+    def _stream(text: str, usage) -> Iterator[Any]:
+        words = text.split(" ")
+        for i in range(0, len(words), 4):
+            yield _Obj(choices=[_Obj(delta=_Obj(content=" ".join(words[i:i + 4]) + " "))], x_groq=None)
+        yield _Obj(choices=[_Obj(delta=_Obj(content=None))], x_groq=_Obj(usage=usage))
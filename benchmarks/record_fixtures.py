@@ -0,0 +1,40 @@
+# -----------------------------------------------------------------------------
+# Record Mistral OCR responses for the offline benchmarks
+#
+#   MISTRAL_API_KEY=... python benchmarks/record_fixtures.py [data/test.pdf ...]
+#
+# Each PDF is OCR'd once (results already in the OCR cache are reused) and
+# written to benchmarks/fixtures/<stem>.ocr.jsonl.gz, which the benchmark
+# harness loads without any API keys.
+# -----------------------------------------------------------------------------
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import RECORDED_DOCUMENTS, save_recorded  # noqa: E402
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Record OCR responses as benchmark fixtures.")
+    parser.add_argument("pdfs", nargs="*", default=[str(REPO_ROOT / "data" / f"{name}.pdf") for name in RECORDED_DOCUMENTS])
+    args = parser.parse_args()
+
+    from mistralai import Mistral
+    from ocr_cache import ocr_pdf
+
+    client = Mistral(api_key=os.environ["MISTRAL_API_KEY"])
+    for pdf in args.pdfs:
+        response_dict = ocr_pdf(client, pdf)
+        path = save_recorded(Path(pdf).stem, response_dict)
+        images = sum(len(page.get("images", [])) for page in response_dict["pages"])
+        print(f"{pdf}: {len(response_dict['pages'])} pages, {images} images -> {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
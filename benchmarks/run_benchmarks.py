@@ -0,0 +1,236 @@
+# -----------------------------------------------------------------------------
+# Offline pipeline benchmarks
+#
+#   python benchmarks/run_benchmarks.py                      # all cases
+#   python benchmarks/run_benchmarks.py -k organize --repeat 5
+#   python benchmarks/run_benchmarks.py --compare benchmarks/results/<old>.json
+#
+# Every case runs in its own subprocess (inside a scratch directory) so peak
+# RSS is per case. Wall time is the best of --repeat runs; a separate run
+# under tracemalloc records the Python allocation peak. Results are written
+# to benchmarks/results/<git commit>.json; --compare flags cases that got
+# slower or bigger than the baseline by more than --threshold.
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from fixtures import FakeLLM, RECORDED_DOCUMENTS, fixture_path, load_document  # noqa: E402
+
+STAGES = ["organize", "tables", "product_info", "convert", "render"]
+SYNTHETIC_DOCUMENTS = ["synthetic-100", "synthetic-1000"]
+
+# Metrics compared by --compare (all "lower is better") and the absolute
+# change below which a difference is treated as noise
+COMPARED_METRICS = {"seconds": 0.005, "peak_rss_growth_bytes": 1_000_000, "tracemalloc_peak_bytes": 1_000_000}
+
+
+def default_cases() -> List[str]:
+    documents = [name for name in RECORDED_DOCUMENTS if os.path.exists(fixture_path(name))] + SYNTHETIC_DOCUMENTS
+    return [f"{stage}:{document}" for document in documents for stage in STAGES]
+
+
+def _rss_bytes() -> int:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _prepare(stage: str, document: str, llm_latency: float) -> Tuple[Callable[[], Any], Dict[str, Any]]:
+    """Build the inputs for one case untimed and return (callable under test, size info)."""
+    import clients
+    import main as pipeline
+    import ocr_organizer
+    from renderer import ProductRenderer
+
+    # Unguarded: the provider rate limit would otherwise dominate the timings
+    clients.set_client("groq", FakeLLM(llm_latency), guarded=False)
+
+    response_dict = load_document(document)
+    pages = response_dict["pages"]
+    info = {"pages": len(pages), "images": sum(len(page.get("images", [])) for page in pages)}
+    pdf_filename = f"{document}.pdf"
+
+    if stage == "organize":
+        return lambda: ocr_organizer.organize_ocr_response(response_dict, pdf_filename), info
+
+    all_text = "\n".join(page.get("markdown", "") for page in pages)
+    info["text_bytes"] = len(all_text.encode("utf-8"))
+    if stage == "tables":
+        return lambda: ocr_organizer.extract_tables_from_text(all_text), info
+    if stage == "product_info":
+        return lambda: ocr_organizer.extract_product_info_from_text(all_text), info
+
+    ocr_organizer.process_ocr_response(response_dict, pdf_filename)
+    organized_path = ocr_organizer.organized_data_path(pdf_filename)
+    del response_dict, pages
+    if stage == "convert":
+        return lambda: pipeline.convert_json_format(organized_path, "data.json"), info
+
+    if stage == "render":
+        pipeline.convert_json_format(organized_path, "data.json")
+        with open("data.json", "r", encoding="utf-8") as f:
+            product = json.load(f)["products"][0]
+        renderer = ProductRenderer(os.path.join(REPO_ROOT, "template.html"),
+                                   os.path.join(REPO_ROOT, "maruyama-logo.png"))
+        renderer.render(product)  # compile the template outside the timing
+        return lambda: renderer.render(product), info
+
+    raise ValueError(f"Unknown stage {stage!r}")
+
+
+def run_case(case: str, repeat: int, llm_latency: float) -> Dict[str, Any]:
+    """Body of the per-case subprocess."""
+    import logging
+    stage, document = case.split(":", 1)
+    fn, info = _prepare(stage, document, llm_latency)
+    logging.getLogger("suvetha").setLevel(logging.WARNING)
+
+    baseline_rss = _rss_bytes()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    peak_rss = _rss_bytes()
+
+    tracemalloc.start()
+    fn()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    best = min(times)
+    result = {
+        "case": case,
+        **info,
+        "repeat": repeat,
+        "seconds": best,
+        "median_seconds": sorted(times)[len(times) // 2],
+        "pages_per_second": info["pages"] / best if best > 0 else None,
+        "baseline_rss_bytes": baseline_rss,
+        "peak_rss_bytes": peak_rss,
+        "peak_rss_growth_bytes": peak_rss - baseline_rss,
+        "tracemalloc_peak_bytes": traced_peak,
+        "retained_blocks": sum(stat.count for stat in snapshot.statistics("filename")),
+    }
+    return result
+
+
+def run_in_subprocess(case: str, repeat: int, llm_latency: float) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="bench-") as scratch:
+        env = dict(os.environ, LLM_CACHE_PATH=":memory:", LLM_CACHE_BYPASS="1", LOG_DIR=os.path.join(scratch, "logs"))
+        # The result goes to a file: the logger's listener thread also writes to stdout
+        result_path = os.path.join(scratch, "result.json")
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", case, "--repeat", str(repeat),
+             "--llm-latency", str(llm_latency), "--result-file", result_path],
+            cwd=scratch, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            return {"case": case, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Lines describing every compared metric; regressions are prefixed with REGRESSION."""
+    old_cases = {case["case"]: case for case in baseline["cases"] if "error" not in case}
+    lines = []
+    for case in results["cases"]:
+        old = old_cases.get(case["case"])
+        if old is None or "error" in case:
+            continue
+        for metric, noise in COMPARED_METRICS.items():
+            before, after = old.get(metric), case.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            flag = "REGRESSION " if change > threshold and after - before > noise else ""
+            lines.append(f"{flag}{case['case']:32} {metric:24} {before:>14.4g} -> {after:>14.4g} ({change:+.1%})")
+    return lines
+
+
+def format_results(results: Dict[str, Any]) -> str:
+    lines = [f"commit {results['commit']}  python {results['python']}  llm latency {results['llm_latency']}s"]
+    for case in results["cases"]:
+        if "error" in case:
+            lines.append(f"  {case['case']:32} ERROR {case['error']}")
+            continue
+        lines.append(
+            f"  {case['case']:32} {case['seconds'] * 1000:10.1f} ms  {case['pages_per_second'] or 0:10.1f} pages/s"
+            f"  rss +{case['peak_rss_growth_bytes'] / 1e6:7.1f} MB  traced peak {case['tracemalloc_peak_bytes'] / 1e6:7.1f} MB"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the extraction pipeline.")
+    parser.add_argument("-k", "--filter", default="", help="only run cases containing this text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("-o", "--output", help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative increase counted as a regression")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        result = run_case(args.worker, args.repeat, args.llm_latency)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    results = {
+        "commit": git_commit(),
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "llm_latency": args.llm_latency,
+        "repeat": args.repeat,
+        "cases": [run_in_subprocess(case, args.repeat, args.llm_latency)
+                  for case in default_cases() if args.filter in case],
+    }
+    print(format_results(results))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines = compare(results, baseline, args.threshold)
+        print("\n".join(lines))
+        if any(line.startswith("REGRESSION") for line in lines):
+            return 1
+    return 1 if any("error" in case for case in results["cases"]) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,272 @@
+# -----------------------------------------------------------------------------
+# Incremental build graph: PDF -> organized JSON -> data JSON -> HTML
+#
+#   python build_graph.py data/test.pdf -o output --html --explain
+#
+# Each stage's inputs (upstream artifact hashes, settings, code version,
+# prompt version) are fingerprinted into <stem>.build.json next to the
+# outputs. A stage reruns only when its fingerprint changed or one of its
+# outputs is missing or was modified; the OCR and LLM caches then make the
+# rerun itself cheap (OCR is reused unless the PDF or OCR settings changed).
+# -----------------------------------------------------------------------------
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from logger import setup_logger, log_info
+import image_pipeline
+import main as pipeline
+import ocr_cache
+import ocr_organizer
+import renderer
+import serialization
+import text_layer
+from workspace import atomic_open
+
+logger = setup_logger()
+
+MANIFEST_SUFFIX = ".build.json"
+# Bump when the manifest layout changes
+BUILD_FORMAT_VERSION = 1
+STAGES = ["organize", "convert", "render"]
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_hash(path: str) -> Optional[str]:
+    """sha256 of the file read in chunks, or None when it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def source_hash(*modules) -> str:
+    """Code version of a stage: hash of the source files of the modules it runs."""
+    digest = hashlib.sha256()
+    for module in modules:
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _fingerprint(inputs: Dict[str, Any]) -> str:
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _settings(module, *names: str) -> Dict[str, Any]:
+    # JSON round trip so values compare equal to the ones read back from the manifest
+    return json.loads(json.dumps({name: getattr(module, name) for name in names}))
+
+
+def _diff(old: Any, new: Any, prefix: str) -> List[str]:
+    """Human-readable differences between two fingerprint input trees."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in sorted(set(old) | set(new)):
+            changes += _diff(old.get(key), new.get(key), f"{prefix}.{key}" if prefix else key)
+        return changes
+    if old == new:
+        return []
+    if isinstance(old, str) and isinstance(new, str) and len(old) == len(new) == 64:  # hashes
+        return [f"{prefix} changed ({old[:8]} -> {new[:8]})"]
+    return [f"{prefix} changed ({old!r} -> {new!r})"]
+
+
+class DocumentBuild:
+    """
+    Fingerprints and manifest for one PDF's stages. Callers ask
+    `reasons(stage)` before running a stage (an empty list means it is up
+    to date) and `record(stage)` after it succeeded.
+    """
+
+    def __init__(self, pdf_path: str, output_dir: str = ".", data_path: Optional[str] = None,
+                 html_path: Optional[str] = None, force: bool = False,
+                 template_path: str = renderer.TEMPLATE_PATH, logo_path: str = renderer.LOGO_PATH,
+                 compact: Optional[bool] = None):
+        self.pdf_path = str(pdf_path)
+        self.organized_path = ocr_organizer.organized_data_path(self.pdf_path, output_dir)
+        self.data_path = data_path or os.path.join(output_dir, f"{Path(self.pdf_path).stem}_data.json")
+        self.html_path = html_path
+        self.template_path = template_path
+        self.logo_path = logo_path
+        self.force = force
+        self.compact = serialization.JSON_COMPACT if compact is None else compact
+        self.manifest_path = os.path.join(output_dir, f"{Path(self.pdf_path).stem}{MANIFEST_SUFFIX}")
+        self.manifest = self._load_manifest()
+        self._inputs: Dict[str, Dict[str, Any]] = {}
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == BUILD_FORMAT_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {"version": BUILD_FORMAT_VERSION, "pdf": self.pdf_path, "stages": {}}
+
+    def stages(self) -> List[str]:
+        return STAGES if self.html_path else STAGES[:-1]
+
+    def outputs(self, stage: str) -> List[str]:
+        return {"organize": [self.organized_path], "convert": [self.data_path], "render": [self.html_path]}[stage]
+
+    def inputs(self, stage: str) -> Dict[str, Any]:
+        """Everything the stage's output depends on, read now (upstream outputs included)."""
+        if stage == "organize":
+            return {
+                "pdf": file_hash(self.pdf_path),
+                "ocr": {
+                    **_settings(ocr_cache, "OCR_MODEL"),
+                    **_settings(text_layer, "TEXT_LAYER_MODE", "TEXT_LAYER_MIN_CHARS"),
+                },
+                "settings": {
+                    **_settings(ocr_organizer, "IMAGE_MODE", "FEATURE_LIMIT", "FEATURE_SPLIT_MODE",
+                                "FEATURE_SPLIT_MODEL", "FEATURE_SPLIT_MAX_TOKENS", "FEATURE_SPLIT_BATCH_MAX_TOKENS",
+                                "LOCAL_SPLIT_THRESHOLD"),
+                    **_settings(image_pipeline, "IMAGE_VARIANTS", "IMAGE_VARIANT_SIZES", "IMAGE_VARIANT_FORMATS",
+                                "IMAGE_VARIANT_QUALITY"),
+                },
+                "prompt_version": ocr_organizer.FEATURE_SPLIT_PROMPT_VERSION,
+                "code": source_hash(ocr_organizer, image_pipeline, text_layer),
+            }
+        if stage == "convert":
+            return {
+                "organized": file_hash(self.organized_path),
+                # Only data.json: reformatting alone does not rerun organize
+                "format": {"JSON_COMPACT": self.compact},
+                "prompt_version": pipeline.PRODUCT_DESC_PROMPT_VERSION,
+                "code": source_hash(pipeline, image_pipeline),
+            }
+        if stage == "render":
+            return {
+                "data": file_hash(self.data_path),
+                "template": file_hash(self.template_path),
+                "logo": file_hash(self.logo_path),
+                "code": source_hash(renderer),
+            }
+        raise ValueError(f"Unknown stage {stage!r}")
+
+    def reasons(self, stage: str) -> List[str]:
+        """Why `stage` has to run; empty when its outputs are up to date."""
+        inputs = self._inputs[stage] = self.inputs(stage)
+        previous = self.manifest["stages"].get(stage)
+        if self.force:
+            reasons = ["forced"]
+        elif previous is None:
+            reasons = ["no previous build"]
+        elif previous["fingerprint"] != _fingerprint(inputs):
+            old_inputs = previous.get("inputs", {})
+            reasons = _diff(old_inputs, inputs, "") or ["fingerprint changed"]
+            if stage == "organize" and all(old_inputs.get(key) == inputs[key] for key in ("pdf", "ocr")):
+                reasons.append("OCR reused from cache")
+        else:
+            reasons = []
+            for path, digest in previous.get("outputs", {}).items():
+                current = file_hash(path)
+                if current is None:
+                    reasons.append(f"{path} is missing")
+                elif current != digest:
+                    reasons.append(f"{path} was modified")
+        log_info(logger, f"{Path(self.pdf_path).name} {stage}: {'; '.join(reasons) or 'up to date'}")
+        return reasons
+
+    def record(self, stage: str, seconds: Optional[float] = None, outputs: Optional[List[str]] = None) -> None:
+        """
+        Store the stage's fingerprint and output hashes after it ran.
+        `outputs` overrides the stage's usual outputs ([] when it wrote none).
+        """
+        inputs = self._inputs.pop(stage, None) or self.inputs(stage)
+        self.manifest["stages"][stage] = {
+            "fingerprint": _fingerprint(inputs),
+            "inputs": inputs,
+            "outputs": {path: file_hash(path) for path in (self.outputs(stage) if outputs is None else outputs)},
+            "seconds": seconds,
+            "built_at": time.time(),
+        }
+        with atomic_open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=4)
+
+
+def build_document(pdf_path: str, output_dir: str = ".", data_path: Optional[str] = None,
+                   html_path: Optional[str] = None, force: bool = False, dry_run: bool = False,
+                   mistral_client=None, compact: Optional[bool] = None) -> Dict[str, List[str]]:
+    """
+    Bring one PDF's outputs up to date, running only stale stages. Returns
+    {stage: reasons it ran} ([] for stages that were skipped). With
+    `dry_run` nothing runs, and stages after a stale one report that.
+    `compact` (default JSON_COMPACT) drops the indentation of the JSON outputs.
+    """
+    build = DocumentBuild(pdf_path, output_dir, data_path, html_path, force, compact=compact)
+    os.makedirs(output_dir, exist_ok=True)
+    report = {}
+    stale_upstream = None
+    # Artifacts produced in this run are handed to the next stage in memory
+    organized_data = converted = None
+    for stage in build.stages():
+        if dry_run and stale_upstream:
+            report[stage] = [f"after {stale_upstream} reruns, if its output changes"]
+            continue
+        reasons = report[stage] = build.reasons(stage)
+        if not reasons:
+            continue
+        if dry_run:
+            stale_upstream = stale_upstream or stage
+            continue
+
+        start = time.perf_counter()
+        if stage == "organize":
+            pages = ocr_cache.ocr_pdf_pages(mistral_client or pipeline.get_mistral_client(), build.pdf_path)
+            organized_data = ocr_organizer.process_ocr_pages(pages, build.pdf_path, output_dir, compact=build.compact)
+        elif stage == "convert":
+            converted = pipeline.convert_json_format(organized_data or build.organized_path, build.data_path,
+                                                     compact=build.compact)
+        elif stage == "render":
+            products = (converted or serialization.load(build.data_path))["products"]
+            if not products:
+                log_info(logger, f"{build.data_path} has no products; nothing to render")
+                # Recorded without outputs, so the next build skips it until data.json changes
+                build.record(stage, time.perf_counter() - start, outputs=[])
+                continue
+            renderer.render_html_handlebars(products[0], build.html_path, os.path.dirname(build.data_path))
+        build.record(stage, time.perf_counter() - start)
+    return report
+
+
+def format_explanation(pdf_path: str, report: Dict[str, List[str]]) -> str:
+    lines = [pdf_path]
+    for stage, reasons in report.items():
+        lines.append(f"  {stage:9} {'run: ' + '; '.join(reasons) if reasons else 'skip: up to date'}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild the stale stages of PDF -> product data -> HTML.")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("-o", "--output-dir", default=".")
+    parser.add_argument("--html", action="store_true", help="also render <stem>.html")
+    parser.add_argument("--force", action="store_true", help="rerun every stage")
+    parser.add_argument("--explain", action="store_true", help="print why each stage ran or was skipped")
+    parser.add_argument("--dry-run", action="store_true", help="only explain what would run")
+    args = parser.parse_args(argv)
+
+    for pdf in args.pdfs:
+        html_path = os.path.join(args.output_dir, f"{Path(pdf).stem}.html") if args.html else None
+        report = build_document(pdf, args.output_dir, html_path=html_path, force=args.force, dry_run=args.dry_run)
+        if args.explain or args.dry_run:
+            print(format_explanation(pdf, report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# -----------------------------------------------------------------------------
+# Shared API clients: rate limiting, retry and circuit breaking per provider
+# -----------------------------------------------------------------------------
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+from logger import setup_logger, log_info
+import metrics
+
+logger = setup_logger()
+
+CLIENT_MAX_RETRIES = int(os.getenv("CLIENT_MAX_RETRIES", "4"))
+CLIENT_BACKOFF_BASE = float(os.getenv("CLIENT_BACKOFF_BASE", "1.0"))  # seconds, doubled per attempt
+CLIENT_BACKOFF_MAX = float(os.getenv("CLIENT_BACKOFF_MAX", "30"))
+CLIENT_TIMEOUT = float(os.getenv("CLIENT_TIMEOUT", "120"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# Requests per minute and burst size of each provider's token bucket
+PROVIDER_LIMITS = {
+    "groq": (float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30")), int(os.getenv("GROQ_BURST", "5"))),
+    "mistral": (float(os.getenv("MISTRAL_REQUESTS_PER_MINUTE", "60")), int(os.getenv("MISTRAL_BURST", "5"))),
+}
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, at most `capacity` saved up."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures; while open every
+    call fails fast. After `reset_seconds` one trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    raise CircuitOpenError("circuit open")
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._trial_running:
+                    raise CircuitOpenError("circuit half-open, trial call in progress")
+                self._trial_running = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True when this failure opened the circuit."""
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                opened = self.state != "open"
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                return opened
+            return False
+
+    def release(self) -> None:
+        """End a trial call that neither succeeded nor failed in a way that counts."""
+        with self._lock:
+            self._trial_running = False
+
+
+def error_status(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Retry-After from the error's HTTP response, in seconds (delta or HTTP date)."""
+    response = getattr(error, "response", None) or getattr(error, "raw_response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    status = error_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # Transport problems (connection reset, timeouts) carry no status
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError)) or "Timeout" in name or "Connection" in name
+
+
+class Provider:
+    """
+    Guards calls to one API provider: waits for a rate-limit token, fails
+    fast while the circuit is open and retries retryable errors with
+    exponential backoff and jitter, honouring Retry-After when given.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, burst: int, max_retries: int = CLIENT_MAX_RETRIES,
+                 backoff_base: float = CLIENT_BACKOFF_BASE, backoff_max: float = CLIENT_BACKOFF_MAX,
+                 breaker: Optional[CircuitBreaker] = None, sleep: Callable[[float], None] = time.sleep):
+        self.name = name
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            waited = self.bucket.acquire()
+            if waited:
+                metrics.registry.observe("rate_limit_wait_seconds", waited, help="Time spent waiting for a "
+                                         "rate-limit token", provider=self.name)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                metrics.count("api_errors_total", help="Failed provider API calls", provider=self.name,
+                              status=str(error_status(e) or type(e).__name__))
+                if not retryable:
+                    # The provider answered; a bad request says nothing about its health
+                    self.breaker.release()
+                    raise
+                if self.breaker.record_failure():
+                    metrics.count("circuit_opened_total", help="Circuit breaker trips", provider=self.name)
+                    log_info(logger, f"{self.name}: circuit opened after {type(e).__name__}: {e}")
+                if attempt >= self.max_retries or self.breaker.state == "open":
+                    raise
+                delay = self.backoff(attempt, e)
+                attempt += 1
+                metrics.count("api_retries_total", help="Retried provider API calls", provider=self.name)
+                log_info(logger, f"{self.name}: retry {attempt}/{self.max_retries} in {delay:.1f}s after "
+                                 f"{type(e).__name__}: {e}")
+                self._sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+
+class GuardedClient:
+    """
+    Proxy over an SDK client that routes every method call (at any depth,
+    e.g. `client.chat.completions.create`) through `provider.call`.
+    """
+
+    def __init__(self, target: Any, provider: Provider):
+        self._target = target
+        self._provider = provider
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if callable(attr):
+            return lambda *args, **kwargs: self._provider.call(attr, *args, **kwargs)
+        if attr is None or isinstance(attr, (str, bytes, int, float, bool, dict, list, tuple)):
+            return attr
+        return GuardedClient(attr, self._provider)
+
+
+_providers: Dict[str, Provider] = {}
+_clients: Dict[str, Any] = {}
+_lock = threading.Lock()
+_env_loaded = False
+
+
+def _load_env() -> None:
+    """Read API keys from .env once, when the first client is built rather than at import."""
+    global _env_loaded
+    if not _env_loaded:
+        try:
+            from dotenv import load_dotenv
+        except ImportError:
+            pass
+        else:
+            load_dotenv()
+        _env_loaded = True
+
+
+def get_provider(name: str) -> Provider:
+    with _lock:
+        if name not in _providers:
+            requests_per_minute, burst = PROVIDER_LIMITS[name]
+            _providers[name] = Provider(name, requests_per_minute, burst)
+        return _providers[name]
+
+
+def _http_client():
+    import httpx
+    return httpx.Client(
+        timeout=CLIENT_TIMEOUT,
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+    )
+
+
+def _build_client(name: str) -> Any:
+    _load_env()
+    if name == "groq":
+        from groq import Groq
+        # Retries are ours, so the SDK's own retry loop is disabled
+        return Groq(api_key=os.getenv("GROQ_API_KEY"), http_client=_http_client(), max_retries=0)
+    if name == "mistral":
+        from mistralai import Mistral
+        return Mistral(api_key=os.getenv("MISTRAL_API_KEY"), client=_http_client())
+    raise KeyError(name)
+
+
+def get_client(name: str) -> Any:
+    """Process-wide guarded client for `name` ("groq" or "mistral"), built on first use."""
+    provider = get_provider(name)
+    with _lock:
+        if name not in _clients:
+            _clients[name] = GuardedClient(_build_client(name), provider)
+        return _clients[name]
+
+
+def set_client(name: str, client: Any, guarded: bool = True) -> None:
+    """Replace the shared client for `name` (e.g. with a local fake)."""
+    provider = get_provider(name)
+    with _lock:
+        _clients[name] = GuardedClient(client, provider) if guarded else client
+
+
+def get_groq_client() -> Any:
+    return get_client("groq")
+
+
+def get_mistral_client() -> Any:
+    return get_client("mistral")
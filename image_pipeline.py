@@ -0,0 +1,237 @@
+# -----------------------------------------------------------------------------
+# Image post-processing: true type and size, thumbnails and web variants
+# -----------------------------------------------------------------------------
+import hashlib
+import io
+import itertools
+import json
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from logger import setup_logger, log_info
+import metrics
+from workspace import atomic_write
+
+logger = setup_logger()
+
+# Longest edge of each generated variant, in pixels
+IMAGE_VARIANT_SIZES = {"thumb": 320, "large": 1280}
+IMAGE_VARIANT_FORMATS = ("webp", "jpeg")
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+IMAGE_VARIANTS = os.getenv("IMAGE_VARIANTS", "1").lower() not in ("0", "false", "no")
+IMAGE_PIPELINE_WORKERS = int(os.getenv("IMAGE_PIPELINE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+MIME_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/gif": "gif", "image/webp": "webp"}
+
+# JPEG start-of-frame markers (every SOFn; C4, C8 and CC are other segments)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(data: bytes) -> Tuple[Optional[int], Optional[int]]:
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            return None, None
+        marker = data[offset + 1]
+        if marker == 0xFF:  # fill byte
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # markers without a length field
+            offset += 2
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + struct.unpack(">H", data[offset + 2:offset + 4])[0]
+    return None, None
+
+
+def sniff_image(data: bytes) -> Tuple[str, Optional[int], Optional[int]]:
+    """(MIME type, width, height) read from the image header, without decoding it."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return ("image/png", *struct.unpack(">II", data[16:24]))
+    if data[:3] == b"\xff\xd8\xff":
+        return ("image/jpeg", *_jpeg_size(data))
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return ("image/gif", *struct.unpack("<HH", data[6:10]))
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return "image/webp", width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return "image/webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return "image/webp", int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        return "image/webp", None, None
+    return "application/octet-stream", None, None
+
+
+def image_extension(data: bytes, default: str = "jpg") -> str:
+    """File extension matching the image's real format."""
+    return MIME_EXTENSIONS.get(sniff_image(data)[0], default)
+
+
+_pillow_warned = False
+
+
+def _pillow():
+    # Optional ("images" extra): without Pillow only the sniffed type and size are recorded
+    global _pillow_warned
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        if not _pillow_warned:
+            _pillow_warned = True
+            logger.warning("Pillow is not installed (pip install '.[images]'); "
+                           "recording image types and sizes without variants")
+        return None
+    return Image, ImageOps
+
+
+def variant_key(data: bytes) -> str:
+    """
+    Hash of the source image and the variant settings. It is part of every
+    variant's file name, so a source overwritten under the same name (inline
+    mode) or changed settings never reuse stale variants.
+    """
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps([IMAGE_VARIANT_SIZES, IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY]).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def variant_path(local_path: str, label: str, image_format: str, key: str) -> str:
+    extension = "jpg" if image_format == "jpeg" else image_format
+    return f"{os.path.splitext(local_path)[0]}.{label}.{key}.{extension}"
+
+
+def _variant_entry(path: str, label: str, image_format: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        header = f.read(64 * 1024)
+    _, width, height = sniff_image(header)
+    return {"label": label, "mime_type": f"image/{image_format}", "width": width, "height": height,
+            "local_path": path, "size_bytes": os.path.getsize(path)}
+
+
+def _write_variant(Image, image, image_format: str, path: str) -> None:
+    buffer = io.BytesIO()
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if image_format == "jpeg":
+        if has_alpha:
+            # JPEG has no alpha channel: flatten onto white
+            rgba = image.convert("RGBA")
+            flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+            flattened.paste(rgba, mask=rgba.getchannel("A"))
+            image = flattened
+        image.convert("RGB").save(buffer, "JPEG", quality=IMAGE_VARIANT_QUALITY, optimize=True, progressive=True)
+    else:
+        image.convert("RGBA" if has_alpha else "RGB").save(buffer, "WEBP", quality=IMAGE_VARIANT_QUALITY, method=4)
+    atomic_write(path, buffer.getvalue())
+
+
+def _variants_exist(local_path: str, key: Optional[str] = None) -> bool:
+    if key is None:
+        with open(local_path, "rb") as f:
+            key = variant_key(f.read())
+    return all(os.path.exists(variant_path(local_path, label, image_format, key))
+               for label in IMAGE_VARIANT_SIZES for image_format in IMAGE_VARIANT_FORMATS)
+
+
+def process_image(local_path: str, make_variants: bool = True) -> Dict[str, Any]:
+    """
+    Read one stored image and return its true MIME type and size. With
+    Pillow (and `make_variants`), the image is decoded once and a resized
+    WebP and JPEG copy per IMAGE_VARIANT_SIZES is written next to it as
+    <name>.<label>.<key>.<ext> (see variant_key); variants already on disk
+    for the same source and settings are reused.
+    """
+    with open(local_path, "rb") as f:
+        data = f.read()
+    mime_type, width, height = sniff_image(data)
+    info = {"mime_type": mime_type, "width": width, "height": height, "variants": []}
+    pillow = _pillow() if make_variants else None
+    if pillow is None:
+        return info
+
+    key = variant_key(data)
+    if _variants_exist(local_path, key):
+        info["variants"] = [_variant_entry(variant_path(local_path, label, image_format, key), label, image_format)
+                            for label in IMAGE_VARIANT_SIZES for image_format in IMAGE_VARIANT_FORMATS]
+        return info
+
+    Image, ImageOps = pillow
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            info["mime_type"] = Image.MIME.get(image.format, mime_type)
+            image = ImageOps.exif_transpose(image)
+            info["width"], info["height"] = image.size
+            for label, max_edge in IMAGE_VARIANT_SIZES.items():
+                resized = image.copy()
+                resized.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+                for image_format in IMAGE_VARIANT_FORMATS:
+                    path = variant_path(local_path, label, image_format, key)
+                    _write_variant(Image, resized, image_format, path)
+                    info["variants"].append({
+                        "label": label,
+                        "mime_type": f"image/{image_format}",
+                        "width": resized.width,
+                        "height": resized.height,
+                        "local_path": path,
+                        "size_bytes": os.path.getsize(path),
+                    })
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        info["variants"] = []
+        info["error"] = f"{type(e).__name__}: {e}"
+    return info
+
+
+def process_images(images: List[Dict[str, Any]], max_workers: int = IMAGE_PIPELINE_WORKERS,
+                   make_variants: bool = IMAGE_VARIANTS) -> int:
+    """
+    Run process_image once per stored file referenced by `images` (entries
+    of all_extracted_images) and merge the results into those entries.
+    Files that still need variants are decoded on a process pool. Returns
+    the number of variants available.
+    """
+    paths = list(dict.fromkeys(img["local_path"] for img in images if img.get("local_path")))
+    if not paths:
+        return 0
+    if make_variants and _pillow() is None:
+        make_variants = False
+
+    pending = [path for path in paths if make_variants and not _variants_exist(path)]
+    results = {}
+    if max_workers > 1 and len(pending) > 1:
+        workers = min(max_workers, len(pending))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(pending) // (workers * 4))
+            results.update(zip(pending, executor.map(process_image, pending, itertools.repeat(True),
+                                                     chunksize=chunksize)))
+    for path in paths:
+        if path not in results:
+            results[path] = process_image(path, make_variants)
+
+    for img in images:
+        info = results.get(img.get("local_path"))
+        if info is None:
+            continue
+        if "error" in info:
+            log_info(logger, f"Could not make variants of {img['local_path']}: {info['error']}")
+        img.update({key: value for key, value in info.items() if key != "error"})
+
+    variants = [variant for info in results.values() for variant in info["variants"]]
+    metrics.count("image_variants_total", len(variants), help="Image variants available after post-processing")
+    metrics.count("image_variant_bytes_total", sum(variant["size_bytes"] for variant in variants),
+                  help="Bytes of image variants")
+    return len(variants)
+
+
+def pick_variant(image: Dict[str, Any], label: str, mime_type: str = "image/webp") -> Optional[str]:
+    """Path of `image`'s variant with this label and type, if one was made."""
+    for variant in image.get("variants", []):
+        if variant["label"] == label and variant["mime_type"] == mime_type:
+            return variant["local_path"]
+    return None
@@ -0,0 +1,200 @@
+# -----------------------------------------------------------------------------
+# Background extraction jobs for the API service
+# -----------------------------------------------------------------------------
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from logger import setup_logger, log_info
+import metrics
+from batch import process_document
+from renderer import render_html_handlebars
+import workspace as workspaces
+
+logger = setup_logger()
+
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "16"))
+# Finished jobs (and their workspaces) are dropped after this long
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", str(workspaces.WORKSPACE_RETENTION_HOURS)))
+JOB_GC_INTERVAL_SECONDS = 600
+
+# Shared by every job in the process, like the batch CLI's stage limits
+OCR_SLOTS = threading.Semaphore(int(os.getenv("JOB_OCR_CONCURRENCY", "2")))
+LLM_SLOTS = threading.Semaphore(int(os.getenv("JOB_LLM_CONCURRENCY", "2")))
+
+
+class JobQueueFull(Exception):
+    """Raised by JobManager.submit when the pending queue is at capacity."""
+
+
+def run_extraction_job(pdf_path: str, workspace: str, mistral_client=None) -> Dict[str, str]:
+    """
+    Default job pipeline: OCR -> organized JSON -> data.json -> rendered HTML,
+    all written inside the job's workspace directory (images included).
+    """
+    result = process_document(Path(pdf_path), workspace, OCR_SLOTS, LLM_SLOTS, mistral_client, force=True,
+                              image_dir=os.path.join(workspace, workspaces.Workspace.IMAGES_DIR))
+    data_path = os.path.join(workspace, "data.json")
+    os.replace(result["data_file"], data_path)
+    # force=True: conversion always ran, so the data comes back in memory
+    data = result["data"]
+
+    outputs = {"data": data_path}
+    if data["products"]:
+        outputs["html"] = render_html_handlebars(data["products"][0], os.path.join(workspace, "rendered_product.html"),
+                                                 workspace)
+    return outputs
+
+
+class JobManager:
+    """
+    Runs `pipeline(pdf_path, workspace)` for submitted PDFs on a fixed pool
+    of worker threads. Pending jobs wait in a bounded queue; submit raises
+    JobQueueFull instead of blocking when it is full, so callers can apply
+    backpressure. Each job runs in its own workspace under `root`; finished
+    jobs older than `retention_hours` are garbage collected.
+    """
+
+    def __init__(self, pipeline: Callable[[str, str], Dict[str, str]] = run_extraction_job,
+                 workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE, root: str = JOBS_DIR,
+                 retention_hours: float = JOB_RETENTION_HOURS):
+        self.pipeline = pipeline
+        self.root = root
+        self.retention_hours = retention_hours
+        self._last_gc = 0.0
+        self._reserved = 0  # queue slots held by submits still writing their upload
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, filename: str, content: bytes) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        workspace = os.path.join(self.root, job_id)
+        job = {
+            "id": job_id,
+            "filename": os.path.basename(filename) or "upload.pdf",
+            "status": "queued",
+            "workspace": workspace,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "outputs": {},
+            "timings": None,
+        }
+
+        # Reserve a queue slot under the lock, write the upload outside it
+        with self._lock:
+            if self._queue.maxsize > 0 and self._queue.qsize() + self._reserved >= self._queue.maxsize:
+                raise JobQueueFull(f"{self._queue.maxsize} jobs already pending")
+            self._reserved += 1
+        try:
+            job_workspace = workspaces.Workspace(self.root, job_id)
+            job_workspace.mark_active()
+            job_workspace.save_upload(job["filename"], content)
+        except Exception:
+            with self._lock:
+                self._reserved -= 1
+            shutil.rmtree(workspace, ignore_errors=True)
+            raise
+        with self._lock:
+            self._reserved -= 1
+            self._jobs[job_id] = job
+            self._queue.put_nowait(job_id)
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def collect_garbage(self, max_age_hours: Optional[float] = None) -> List[str]:
+        """
+        Forget finished jobs older than `max_age_hours` (default: the
+        manager's retention) and remove their workspaces, plus any stale
+        workspace under `root` left by an earlier process. Returns the
+        removed job ids.
+        """
+        max_age_hours = self.retention_hours if max_age_hours is None else max_age_hours
+        cutoff = time.time() - max_age_hours * 3600
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["finished_at"] is not None and job["finished_at"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+            keep = set(self._jobs)
+        for job_id in expired:
+            shutil.rmtree(os.path.join(self.root, job_id), ignore_errors=True)
+        removed = expired + workspaces.collect_garbage(self.root, max_age_hours, keep)
+        if removed:
+            metrics.count("jobs_collected_total", len(removed), help="Finished job workspaces removed")
+        return removed
+
+    def _maybe_collect_garbage(self) -> None:
+        now = time.time()
+        with self._lock:
+            if now - self._last_gc < JOB_GC_INTERVAL_SECONDS:
+                return
+            self._last_gc = now
+        self.collect_garbage()
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _write_timings(self, job: Dict[str, Any], report: metrics.TimingReport) -> Optional[str]:
+        timings = report.to_dict()
+        timings["job_id"] = job["id"]
+        timings["queued_seconds"] = round(job["started_at"] - job["created_at"], 6)
+        path = os.path.join(job["workspace"], "timings.json")
+        try:
+            with workspaces.atomic_open(path, "w", encoding="utf-8") as f:
+                json.dump(timings, f, indent=4)
+            return path
+        except OSError as e:
+            print(f"Error writing timings for job {job['id']}: {e}")
+            return None
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            self._update(job_id, status="running", started_at=time.time())
+            job = self.get(job_id)
+            # Refresh the heartbeat: the job may have waited in the queue
+            workspaces.Workspace(self.root, job_id).mark_active()
+            metrics.registry.observe("job_queue_seconds", job["started_at"] - job["created_at"],
+                                     help="Time jobs wait in the queue before a worker picks them up")
+            with metrics.collect() as report:
+                try:
+                    with metrics.span("job"):
+                        outputs = self.pipeline(os.path.join(job["workspace"], job["filename"]), job["workspace"])
+                    self._update(job_id, status="done", outputs=outputs, finished_at=time.time())
+                    metrics.count("jobs_total", help="Finished extraction jobs", status="done")
+                    log_info(logger, f"Job {job_id} finished: {outputs}")
+                except Exception as e:
+                    log_info(logger, f"Job {job_id} failed: {e}\n{traceback.format_exc()}")
+                    self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+                    metrics.count("jobs_total", help="Finished extraction jobs", status="failed")
+                finally:
+                    self._update(job_id, timings=self._write_timings(job, report))
+                    workspaces.Workspace(self.root, job_id).mark_finished()
+                    self._queue.task_done()
+            self._maybe_collect_garbage()
@@ -1,40 +1,221 @@
 # -----------------------------------------------------------------------------
 # Setup logging
 # -----------------------------------------------------------------------------
-import logging
+import atexit
 import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
 import sys
+import threading
+from typing import Any, Dict, Optional
 
-import os
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Per-logger overrides, e.g. "suvetha=DEBUG,httpx=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" or "json"
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1").lower() not in ("0", "false", "no")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "500"))
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "20000"))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Fields whose values are image payloads and are never worth logging
+_BINARY_KEYS = {"image_base64", "base64_data", "image_base64_prefix"}
+_BASE64_RUN_RE = re.compile(r'(data:[\w/+.-]+;base64,)?[A-Za-z0-9+/]{200,}={0,2}')
+
+
+def _base64_summary(match: "re.Match") -> str:
+    return f"<{match.group(1) or ''}base64 {len(match.group(0))} chars>"
+
+
+def summarize(value: Any, max_chars: int = LOG_MAX_FIELD_CHARS, _depth: int = 0) -> Any:
+    """
+    Copy of `value` that is safe and cheap to log: base64 payloads are
+    replaced by their length, long strings are truncated and deep or
+    wide containers are cut short. Never formats the whole object.
+    """
+    if isinstance(value, str):
+        if len(value) > max_chars:
+            # Only look at the part that will be kept
+            head = _BASE64_RUN_RE.sub(_base64_summary, value[:max_chars])
+            return f"{head}...<{len(value) - max_chars} more chars>"
+        return _BASE64_RUN_RE.sub(_base64_summary, value) if len(value) >= 200 else value
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if _depth >= 6:
+        return f"<{type(value).__name__}>"
+    if isinstance(value, dict):
+        items = list(value.items())
+        summary = {
+            str(k): (f"<{len(v)} chars>" if k in _BINARY_KEYS and isinstance(v, str)
+                     else summarize(v, max_chars, _depth + 1))
+            for k, v in items[:100]
+        }
+        if len(items) > 100:
+            summary["..."] = f"<{len(items) - 100} more keys>"
+        return summary
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        summary = [summarize(v, max_chars, _depth + 1) for v in items[:50]]
+        if len(items) > 50:
+            summary.append(f"<{len(items) - 50} more items>")
+        return summary
+    return value
+
+
+def _message(record: logging.LogRecord) -> str:
+    message = record.getMessage()
+    if len(message) >= 200 and _BASE64_RUN_RE.search(message):
+        message = _BASE64_RUN_RE.sub(_base64_summary, message)
+    if len(message) > LOG_MAX_MESSAGE_CHARS:
+        message = f"{message[:LOG_MAX_MESSAGE_CHARS]}...<{len(message) - LOG_MAX_MESSAGE_CHARS} more chars>"
+    return message
+
+
+class SummarizingFormatter(logging.Formatter):
+    """The usual text format, with base64 runs summarized and long messages truncated."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.message = _message(record)
+        if self.usesTime():
+            record.asctime = self.formatTime(record, self.datefmt)
+        text = self.formatMessage(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            text = f"{text}\n{record.exc_text}"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra={"fields": {...}}` is merged in (summarized)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": _message(record),
+        }
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, dict):
+            entry.update(summarize(fields))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SummarizingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without formatting them. Object
+    messages and arguments are replaced by cheap summaries here so the
+    listener never sees (or has to stringify) full OCR payloads, and later
+    mutation of the logged objects can't race with formatting.
+    """
 
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if not isinstance(record.msg, str):
+            record.msg = summarize(record.msg)
+        if record.args:
+            if isinstance(record.args, dict):
+                record.args = summarize(record.args)
+            else:
+                record.args = tuple(summarize(arg) for arg in record.args)
+        if record.exc_info:
+            # Tracebacks hold frames; render them while they are still valid
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
-def setup_logger(name="suvetha", level=logging.INFO):
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def _make_formatter() -> logging.Formatter:
+    return JsonFormatter() if LOG_FORMAT == "json" else SummarizingFormatter(TEXT_FORMAT)
+
+
+class LazyRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Creates the log directory along with the file, on the first record."""
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+def _output_handlers(name: str) -> list:
+    # Create console handler
+    console_handler = logging.StreamHandler(sys.stdout)
+
+    # Create rotating file handler; nothing touches the disk until the first record
+    timestamp = datetime.datetime.now().strftime("%H_%M_%d-%m-%Y")
+    file_handler = LazyRotatingFileHandler(
+        f"{LOG_DIR}/{name}_{timestamp}.log", maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8", delay=True,
+    )
+
+    formatter = _make_formatter()
+    for handler in (console_handler, file_handler):
+        handler.setFormatter(formatter)
+    return [console_handler, file_handler]
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread (registered with atexit)."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _queue_handler(name: str) -> logging.Handler:
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = logging.handlers.QueueListener(queue.SimpleQueue(), *_output_handlers(name),
+                                                       respect_handler_level=True)
+            _listener.start()
+            atexit.register(stop_logging)
+        return SummarizingQueueHandler(_listener.queue)
+
+
+def apply_log_levels(spec: str = LOG_LEVELS) -> None:
+    """Set levels from a "logger=LEVEL,other=LEVEL" spec."""
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        logger_name, _, level = item.partition("=")
+        if level:
+            logging.getLogger(logger_name.strip()).setLevel(level.strip().upper())
+
+
+def setup_logger(name="suvetha", level=None):
+    """
+    Return the named logger, configured once per process. By default records
+    go through a queue to a background listener that writes to stdout and a
+    rotating file, so callers never block on log I/O. LOG_ASYNC=0 writes
+    synchronously instead.
+    """
     logger = logging.getLogger(name)
     if not logger.handlers:
-        logger.setLevel(level)
-        
-        # Create console handler
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setLevel(level)
-        
-        # Create file handler
-        log_dir = 'logs'
-        os.makedirs(log_dir, exist_ok=True)
-        timestamp = datetime.datetime.now().strftime("%H_%M_%d-%m-%Y")
-        file_handler = logging.FileHandler(f"{log_dir}/{name}_{timestamp}.log")
-    
-        file_handler.setLevel(level)
-        
-        # Create formatter
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        console_handler.setFormatter(formatter)
-        file_handler.setFormatter(formatter)
-        
-        # Add handlers to logger
-        logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
-    
+        logger.setLevel(level if level is not None else LOG_LEVEL)
+        if LOG_ASYNC:
+            logger.addHandler(_queue_handler(name))
+        else:
+            for handler in _output_handlers(name):
+                logger.addHandler(handler)
+        apply_log_levels()
+
     return logger
 
 def log_info(logger, message):
-    logger.info(message)
\ No newline at end of file
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(message)
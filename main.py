@@ -1,64 +1,36 @@
-from mistralai import Mistral
 from pathlib import Path
-from mistralai import DocumentURLChunk, ImageURLChunk, TextChunk
-import json
-import json
 import base64
 import os
+import sys
 
 from logger import setup_logger, log_info
+from llm_cache import get_llm_cache
+import metrics
+from clients import get_groq_client, get_mistral_client
+from image_pipeline import pick_variant
+import serialization
 
 logger = setup_logger()
 
-# NEW: Import the organizer function
-from ocr_organizer import process_ocr_response
-
-from dotenv import load_dotenv
-load_dotenv()
-
-
-# Your existing OCR processing code remains the same
-api_key = os.getenv("MISTRAL_API_KEY")
-
-client = Mistral(api_key=api_key)
-from groq import Groq
-
-
-groq_client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-
-pdf_file = Path("data/test_2.pdf")
-# assert pdf_file.is_file()
-
-uploaded_file = client.files.upload(
-    file={
-        "file_name": pdf_file.stem,
-        "content": pdf_file.read_bytes(),
-    },
-    purpose="ocr",
-)
-
-signed_url = client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
-
-pdf_response = client.ocr.process(
-    document=DocumentURLChunk(document_url=signed_url.url),
-    model="mistral-ocr-latest",
-    include_image_base64=True
-)
-log_info(logger,"pdf_response")
-log_info(logger,pdf_response)
-
-# ✅ Use safe native Python dict
-response_dict = pdf_response.model_dump()
-
-# Continue to process
-organized_data = process_ocr_response(response_dict, str(pdf_file))
+# Bump when the product description prompt changes; recorded in build manifests (build_graph.py)
+PRODUCT_DESC_PROMPT_VERSION = 1
 
+# NEW: Import the organizer function
+from ocr_organizer import process_ocr_pages
+from ocr_cache import ocr_pdf_pages
 
 
+def process_pdf(pdf_file, output_dir=".", data_file="data.json"):
+    """Run OCR, organizing and conversion for a single PDF."""
+    pdf_file = Path(pdf_file)
 
-# print("Processing completed! Check the generated files.")
+    # ✅ Pages are streamed back from the OCR cache (reused for identical PDFs)
+    pages = ocr_pdf_pages(get_mistral_client(), str(pdf_file))
+    log_info(logger,"pdf_response")
 
-# pprint.pprint(response_dict)
+    # Continue to process; the organized dict is handed over in memory
+    organized_data = process_ocr_pages(pages, str(pdf_file), output_dir)
+    convert_json_format(organized_data, os.path.join(output_dir, data_file))
 
 def generate_product_desc(product_input: str) -> str:
     """
@@ -92,38 +64,62 @@ def generate_product_desc(product_input: str) -> str:
     """
     
     try:
-        # Create completion
-        completion = groq_client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.7,  # Slightly lower for more consistent output
-            max_completion_tokens=1024,
-            top_p=1,
-            stream=True,
-            stop=None,
-        )
+        cache = get_llm_cache()
+        cache_key = cache.make_key("llama-3.1-8b-instant", prompt, 0.7, 1024)
+        cached_description = cache.get(cache_key)
+        metrics.count("llm_cache_requests_total", help="LLM cache lookups", stage="product_desc",
+                      result="miss" if cached_description is None else "hit")
+        if cached_description is not None:
+            return cached_description
+
+        with metrics.span("llm.product_desc", model="llama-3.1-8b-instant"):
+            # Create completion
+            completion = get_groq_client().chat.completions.create(
+                model="llama-3.1-8b-instant",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                temperature=0.7,  # Slightly lower for more consistent output
+                max_completion_tokens=1024,
+                top_p=1,
+                stream=True,
+                stop=None,
+            )
+
+            # Collect the streamed response
+            generated_description = ""
+            for chunk in completion:
+                if chunk.choices[0].delta.content:
+                    generated_description += chunk.choices[0].delta.content
+                # Groq reports token usage on the final streamed chunk
+                if getattr(chunk, "x_groq", None) is not None:
+                    metrics.count_llm_usage(chunk.x_groq, "llama-3.1-8b-instant", "product_desc")
         
-        # Collect the streamed response
-        generated_description = ""
-        for chunk in completion:
-            if chunk.choices[0].delta.content:
-                generated_description += chunk.choices[0].delta.content
-        
-        return generated_description.strip()
+        generated_description = generated_description.strip()
+        cache.put(cache_key, generated_description)
+        return generated_description
     
     except Exception as e:
+        metrics.count("llm_fallbacks_total", help="LLM answers replaced by a local fallback", stage="product_desc",
+                      reason=type(e).__name__)
         return f"Error generating product description: {str(e)}"
     
     
-def convert_json_format(input_file, output_file):
+@metrics.timed("convert")
+def convert_json_format(input_file, output_file, compact=None):
+    """
+    Convert organized data into data.json format and write it to
+    `output_file`. `input_file` is the organized JSON path or the organized
+    dict itself (no re-read from disk). Returns the converted data.
+    """
     # Read the input JSON
-    with open(input_file, 'r') as f:
-        data = json.load(f)
+    if isinstance(input_file, dict):
+        data = input_file
+    else:
+        data = serialization.load(input_file)
     
     # Helper function to read image and convert to base64
     def image_to_base64(image_path):
@@ -137,41 +133,57 @@ def convert_json_format(input_file, output_file):
     def extract_specifications(tables):
         specs = []
         for table in tables:
-            if 'rows' in table:
-                for row in table['rows']:
-                    if len(row) >= 2:
-                        label_value = row[1].split(' | ')
-                        if len(label_value) == 2:
+            headers = table.get('headers', [])
+            rows = table.get('rows', [])
+            if len(headers) == 2:
+                # Two-column spec sheets are label/value pairs. Without a
+                # separator row the "header" is really the first pair; with
+                # one it holds column titles (Parameter | Value) and is skipped
+                pairs = [row[:2] for row in rows if len(row) >= 2]
+                if not table.get('has_separator', True):
+                    pairs.insert(0, headers)
+                for label, value in pairs:
+                    if label and value:
+                        specs.append({"label": label, "value": value})
+            elif len(headers) > 2:
+                # Wider tables: first column names the row, other columns by header
+                for row in rows:
+                    for column in range(1, min(len(row), len(headers))):
+                        if row[0] and row[column]:
                             specs.append({
-                                "label": label_value[0].strip(),
-                                "value": label_value[1].strip()
+                                "label": f"{row[0]} {headers[column]}".strip(),
+                                "value": row[column]
                             })
-            # Handle single row tables from headers
-            if 'headers' in table and len(table['headers']) >= 2:
-                header_parts = table['headers'][1].split(' | ')
-                if len(header_parts) == 2:
-                    specs.append({
-                        "label": header_parts[0].strip(),
-                        "value": header_parts[1].strip()
-                    })
         return specs
     
+    # Resized variants when the image pipeline made them; otherwise inline-mode
+    # images carry base64 and reference-mode images only a file path.
+    # Paths are relative to the directory holding data.json: the rendered
+    # page fetches ./data.json and loads the images from there
+    data_dir = os.path.dirname(os.path.abspath(output_file))
+
+    def image_source(img_data, variant="large"):
+        path = pick_variant(img_data, variant)
+        if not path and img_data.get('base64_data'):
+            return img_data['base64_data']
+        path = path or img_data.get('local_path', "")
+        return Path(os.path.relpath(path, data_dir)).as_posix() if path else ""
+
     # Convert each product
     converted_products = []
     for product in data['products']:
-        # Get base64 data from all_page_images
+        # Get image references from all_page_images
         main_image_base64 = ""
         thumbnails = []
         count =0
         if 'all_page_images' in product and product['all_page_images']:
             for img_data in product['all_page_images']:
-                if 'base64_data' in img_data and img_data["id"]!= "img-0.jpeg":
+                if img_data["id"]!= "img-0.jpeg":
                     print(img_data["id"])
-                    base64_str = img_data['base64_data']
                     count += 1 
-                    thumbnails.append(base64_str)
-        main_image_base64 = product["all_page_images"][0]["base64_data"]
-        print(product["all_page_images"][0]["id"])
+                    thumbnails.append(image_source(img_data, "thumb"))
+            main_image_base64 = image_source(product["all_page_images"][0])
+            print(product["all_page_images"][0]["id"])
         
         # If all_page_images is empty, try to read from local paths
         count =0
@@ -206,12 +218,13 @@ def convert_json_format(input_file, output_file):
         "products": converted_products
     }
     
-    # Write to output file
-    with open(output_file, 'w') as f:
-        json.dump(output_data, f, indent=2)
+    # Write to output file (renamed into place, so readers never see a partial file)
+    serialization.dump(output_data, output_file, indent=2, compact=compact)
+    return output_data
 
-# Usage
-convert_json_format('test_2_organized_data.json', 'data.json')
+if __name__ == "__main__":
+    # Single document run; use batch.py for directories and globs
+    process_pdf(sys.argv[1] if len(sys.argv) > 1 else "data/test_2.pdf")
 
 
 
@@ -0,0 +1,232 @@
+# -----------------------------------------------------------------------------
+# Pipeline instrumentation: spans, counters and histograms
+# -----------------------------------------------------------------------------
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+METRIC_PREFIX = "extraction_"
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> _LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: _LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[_LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[_LabelKey, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self, name: str, value: float, help: str = "", buckets: Tuple[float, ...] = DURATION_BUCKETS,
+                **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = _Histogram(buckets)
+            series[key].observe(value)
+            if help:
+                self._help.setdefault(name, help)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                full_name = f"{METRIC_PREFIX}{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {value:g}")
+
+            for name in sorted(self._histograms):
+                full_name = f"{METRIC_PREFIX}{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} histogram")
+                for key, hist in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{full_name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{full_name}_bucket{_format_labels(key, ('le', '+Inf'))} {hist.count}")
+                    lines.append(f"{full_name}_sum{_format_labels(key)} {hist.sum:.6f}")
+                    lines.append(f"{full_name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+class TimingReport:
+    """Spans and counters recorded while a `collect()` block is active (one job or document)."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = {}
+
+    def add_span(self, name: str, start: float, seconds: float, labels: Dict[str, Any], error: Optional[str]) -> None:
+        span = {"name": name, "offset_seconds": round(start - self._start, 6), "seconds": round(seconds, 6)}
+        if labels:
+            span["labels"] = labels
+        if error:
+            span["error"] = error
+        with self._lock:
+            self.spans.append(span)
+
+    def add_count(self, name: str, value: float) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["offset_seconds"])
+            counters = dict(self.counters)
+
+        stages: Dict[str, Dict[str, float]] = {}
+        for span in spans:
+            stage = stages.setdefault(span["name"], {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stage["count"] += 1
+            stage["total_seconds"] = round(stage["total_seconds"] + span["seconds"], 6)
+            stage["max_seconds"] = max(stage["max_seconds"], span["seconds"])
+
+        return {
+            "started_at": self.started_at,
+            "total_seconds": round(time.perf_counter() - self._start, 6),
+            "stages": stages,
+            "counters": counters,
+            "spans": spans,
+        }
+
+
+registry = MetricsRegistry()
+_current_report: contextvars.ContextVar[Optional[TimingReport]] = contextvars.ContextVar("timing_report", default=None)
+
+
+@contextmanager
+def collect() -> Iterator[TimingReport]:
+    """Record every span and count made in this context (and contexts copied from it) into a TimingReport."""
+    report = TimingReport()
+    token = _current_report.set(report)
+    try:
+        yield report
+    finally:
+        _current_report.reset(token)
+
+
+@contextmanager
+def span(name: str, **labels) -> Iterator[Dict[str, Any]]:
+    """
+    Time a pipeline stage. The duration goes to the `stage_duration_seconds`
+    histogram and to the active TimingReport. The yielded dict can be
+    filled with extra labels for the report (e.g. page counts).
+    """
+    extra: Dict[str, Any] = {}
+    error = None
+    start = time.perf_counter()
+    try:
+        yield extra
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe("stage_duration_seconds", seconds, help="Time spent in each pipeline stage",
+                         stage=name, outcome="error" if error else "ok")
+        report = _current_report.get()
+        if report is not None:
+            report.add_span(name, start, seconds, {**labels, **extra}, error)
+
+
+def timed(name: str, **labels):
+    """Decorator form of span() for functions that are a stage on their own."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: float = 1, help: str = "", **labels) -> None:
+    """Increment a process-wide counter and the active TimingReport's total for `name`."""
+    if not value:
+        return
+    registry.inc(name, value, help=help, **labels)
+    report = _current_report.get()
+    if report is not None:
+        report.add_count(name + _format_labels(_label_key(labels)), value)
+
+
+def count_llm_usage(response, model: str, stage: str) -> None:
+    """
+    Record prompt/completion token counts from an OpenAI-style completion
+    response (or the `x_groq` field of the last streamed chunk).
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None) or 0
+        count(f"llm_{kind}_tokens_total", tokens, help=f"LLM {kind} tokens used", model=model, stage=stage)
+
+
+def render_prometheus() -> str:
+    return registry.render_prometheus()
@@ -0,0 +1,413 @@
+# -----------------------------------------------------------------------------
+# Mistral OCR result store keyed by PDF content
+# -----------------------------------------------------------------------------
+import base64
+import contextvars
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from logger import setup_logger, log_info
+import metrics
+import text_layer
+
+logger = setup_logger()
+
+OCR_MODEL = "mistral-ocr-latest"
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "cache/ocr")
+
+# Chunked OCR: documents with more pages than OCR_CHUNK_PAGES are sent as
+# page ranges of that size (0 = always one request), OCR_CHUNK_CONCURRENCY
+# at a time; failed chunks are retried up to OCR_CHUNK_RETRIES times.
+OCR_CHUNK_PAGES = int(os.getenv("OCR_CHUNK_PAGES", "25"))
+OCR_CHUNK_CONCURRENCY = int(os.getenv("OCR_CHUNK_CONCURRENCY", "4"))
+OCR_CHUNK_RETRIES = int(os.getenv("OCR_CHUNK_RETRIES", "2"))
+
+
+_IMAGE_REF_RE = re.compile(r'!\[([^\]]*)\]\(([^)]*)\)')
+
+
+def pdf_cache_key(pdf_bytes: bytes) -> str:
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def page_ranges(pages: Iterable[int]) -> str:
+    """Compact form of sorted page indexes: [0, 1, 2, 5] -> "0-2_5"."""
+    ranges = []
+    for page in sorted(pages):
+        if ranges and ranges[-1][1] == page - 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return "_".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+def pages_cache_key(key: str, pages: List[int]) -> str:
+    """Cache key for the OCR result of a subset of a PDF's pages."""
+    tag = page_ranges(pages)
+    if len(tag) > 64:
+        tag = hashlib.sha256(tag.encode("ascii")).hexdigest()[:16]
+    return f"{key}/pages-{tag}"
+
+
+def renumber_page_images(page: Dict[str, Any], first_image: int) -> int:
+    """
+    Give the page's images document-wide ids img-<n> starting at
+    `first_image` and rewrite the markdown references to match. Pages
+    merged from several sources (text layer, OCR calls) would otherwise
+    reuse ids. Returns the next free number.
+    """
+    mapping = {}
+    for offset, image in enumerate(page.get("images", [])):
+        old_id = image.get("id") or ""
+        extension = old_id.rsplit(".", 1)[1] if "." in old_id else "jpeg"
+        image["id"] = mapping[old_id] = f"img-{first_image + offset}.{extension}"
+    if mapping:
+        page["markdown"] = _IMAGE_REF_RE.sub(
+            lambda match: f"![{mapping.get(match.group(1), match.group(1))}]({mapping.get(match.group(2), match.group(2))})",
+            page.get("markdown", ""),
+        )
+    return first_image + len(mapping)
+
+
+class OCRCache:
+    """
+    On-disk store of `ocr_response.model_dump()` results.
+
+    Layout under `root`:
+        <pdf sha256>/<model>/response.json   top-level fields except pages
+        <pdf sha256>/<model>/pages.jsonl     one compact JSON page per line
+        blobs/<image sha256>                 decoded image bytes, shared
+
+    Page images keep their metadata inline but their base64 payload is
+    replaced by a reference to the blob, so the JSON stays small and
+    identical images are stored once.
+    """
+
+    def __init__(self, root: str = OCR_CACHE_DIR):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+
+    def _entry_dir(self, key: str, model: str) -> Path:
+        return self.root / key / model.replace("/", "_")
+
+    def has(self, key: str, model: str = OCR_MODEL) -> bool:
+        return (self._entry_dir(key, model) / "pages.jsonl").is_file()
+
+    def _store_image(self, image: Dict[str, Any]) -> Dict[str, Any]:
+        data_uri = image.get("image_base64")
+        if not data_uri:
+            return image
+
+        image = dict(image)
+        del image["image_base64"]
+
+        prefix, _, payload = data_uri.rpartition(",")
+        image_bytes = base64.b64decode(payload)
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        blob_path = self.blob_dir / digest
+        if not blob_path.exists():
+            tmp_path = blob_path.with_name(f"{digest}.{uuid.uuid4().hex}.tmp")
+            tmp_path.write_bytes(image_bytes)
+            os.replace(tmp_path, blob_path)
+
+        image["image_blob"] = digest
+        image["image_base64_prefix"] = f"{prefix}," if prefix else ""
+        return image
+
+    def _load_image(self, image: Dict[str, Any]) -> Dict[str, Any]:
+        digest = image.pop("image_blob", None)
+        prefix = image.pop("image_base64_prefix", "")
+        if digest:
+            payload = base64.b64encode((self.blob_dir / digest).read_bytes()).decode("utf-8")
+            image["image_base64"] = prefix + payload
+        return image
+
+    def put(self, key: str, response_dict: Dict[str, Any], model: str = OCR_MODEL) -> None:
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        entry_dir = self._entry_dir(key, model)
+        tmp_dir = entry_dir.with_name(f"{entry_dir.name}.{uuid.uuid4().hex}.tmp")
+        tmp_dir.mkdir(parents=True)
+
+        try:
+            header = {k: v for k, v in response_dict.items() if k != "pages"}
+            with open(tmp_dir / "response.json", "w", encoding="utf-8") as f:
+                json.dump(header, f, separators=(",", ":"), ensure_ascii=False)
+
+            with open(tmp_dir / "pages.jsonl", "w", encoding="utf-8") as f:
+                for page in response_dict.get("pages", []):
+                    page = dict(page)
+                    page["images"] = [self._store_image(image) for image in page.get("images", [])]
+                    f.write(json.dumps(page, separators=(",", ":"), ensure_ascii=False))
+                    f.write("\n")
+
+            try:
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                if not self.has(key, model):
+                    raise
+                # Another worker stored the same document first; its entry is just as good
+                shutil.rmtree(tmp_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def iter_pages(self, key: str, model: str = OCR_MODEL) -> Iterator[Dict[str, Any]]:
+        """Yield stored pages one at a time, with image payloads restored."""
+        with open(self._entry_dir(key, model) / "pages.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                page = json.loads(line)
+                page["images"] = [self._load_image(image) for image in page.get("images", [])]
+                yield page
+
+    def get(self, key: str, model: str = OCR_MODEL) -> Optional[Dict[str, Any]]:
+        if not self.has(key, model):
+            return None
+
+        with open(self._entry_dir(key, model) / "response.json", "r", encoding="utf-8") as f:
+            response_dict = json.load(f)
+        response_dict["pages"] = list(self.iter_pages(key, model))
+        return response_dict
+
+
+def _upload_pdf(client, pdf_file: Path, pdf_bytes: bytes) -> str:
+    """Upload the PDF once and return a signed URL that OCR requests can reference."""
+    with metrics.span("ocr.upload", bytes=len(pdf_bytes)):
+        uploaded_file = client.files.upload(
+            file={
+                "file_name": pdf_file.stem,
+                "content": pdf_bytes,
+            },
+            purpose="ocr",
+        )
+        signed_url = client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
+    metrics.count("ocr_upload_bytes_total", len(pdf_bytes), help="PDF bytes uploaded for OCR")
+    return signed_url.url
+
+
+def _process_pdf(client, pdf_file: Path, document_url: str, model: str,
+                 pages: Optional[List[int]] = None) -> Dict[str, Any]:
+    from mistralai import DocumentURLChunk
+
+    # Only the listed (0-based) pages when a subset is asked for
+    page_selection = {"pages": pages} if pages is not None else {}
+    with metrics.span("ocr.process", model=model) as span_info:
+        pdf_response = client.ocr.process(
+            document=DocumentURLChunk(document_url=document_url),
+            model=model,
+            include_image_base64=True,
+            **page_selection
+        )
+        response_dict = pdf_response.model_dump()
+        span_info["pages"] = len(response_dict.get("pages", []))
+    metrics.count("ocr_pages_total", len(response_dict.get("pages", [])), help="Pages returned by the OCR API")
+    log_info(logger, f"OCR processed {pdf_file.name}: {len(response_dict.get('pages', []))} pages")
+    return response_dict
+
+
+def _run_ocr(client, pdf_file: Path, pdf_bytes: bytes, model: str,
+             pages: Optional[List[int]] = None) -> Dict[str, Any]:
+    return _process_pdf(client, pdf_file, _upload_pdf(client, pdf_file, pdf_bytes), model, pages)
+
+
+def ocr_pdf(client, pdf_path: str, model: str = OCR_MODEL, cache: Optional[OCRCache] = None) -> Dict[str, Any]:
+    """
+    Return the OCR response dict for `pdf_path`, running Mistral OCR only
+    when no result is stored for these exact PDF bytes and model.
+    """
+    pdf_file = Path(pdf_path)
+    pdf_bytes = pdf_file.read_bytes()
+    cache = cache or OCRCache()
+    key = pdf_cache_key(pdf_bytes)
+
+    cached = cache.get(key, model)
+    metrics.count("ocr_cache_requests_total", help="OCR cache lookups", result="miss" if cached is None else "hit")
+    if cached is not None:
+        log_info(logger, f"OCR cache hit for {pdf_file.name} ({key[:12]})")
+        return cached
+
+    response_dict = _run_ocr(client, pdf_file, pdf_bytes, model)
+    _put_or_log(cache, key, response_dict, model, pdf_file)
+    return response_dict
+
+
+def _put_or_log(cache: OCRCache, key: str, response_dict: Dict[str, Any], model: str, pdf_file: Path) -> bool:
+    """Store an OCR result; a failed write is logged, not raised, so the caller can use it from memory."""
+    try:
+        cache.put(key, response_dict, model)
+        return True
+    except Exception as e:
+        print(f"Error caching OCR response for {pdf_file.name}: {e}")
+        metrics.count("ocr_cache_write_errors_total", help="OCR results that could not be cached")
+        return False
+
+
+def _chunk_pages(pages: List[int], chunk_pages: int) -> List[List[int]]:
+    return [pages[start:start + chunk_pages] for start in range(0, len(pages), chunk_pages)]
+
+
+def _chunk_page_index(page: Dict[str, Any], position: int, chunk: List[int]) -> int:
+    """
+    Original index of the page at `position` in a chunk's OCR result. The
+    page's own index may count from the document or from the chunk start;
+    anything else (a dropped or reordered page) is an error, never a relabel.
+    """
+    index = page.get("index")
+    if position < len(chunk) and index in (chunk[position], position):
+        return chunk[position]
+    raise RuntimeError(f"OCR chunk pages {page_ranges(chunk)} returned page index {index} at position {position}")
+
+
+def _check_chunk_pages(pages: List[Dict[str, Any]], chunk: List[int]) -> None:
+    if len(pages) != len(chunk):
+        raise RuntimeError(f"OCR chunk pages {page_ranges(chunk)} returned {len(pages)} of {len(chunk)} pages")
+    for position, page in enumerate(pages):
+        _chunk_page_index(page, position, chunk)
+
+
+def _iter_chunk_pages(cache: OCRCache, chunk_keys: List[str], chunks: List[List[int]], model: str,
+                      uncached: Optional[Dict[int, List[Dict[str, Any]]]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Chunk results in document order, with original page indexes and
+    document-wide image ids. Chunks in `uncached` (chunk number -> pages)
+    could not be stored and are read from memory.
+    """
+    uncached = uncached or {}
+    next_image = 0
+    for i, (chunk_key, chunk) in enumerate(zip(chunk_keys, chunks)):
+        chunk_pages = uncached[i] if i in uncached else cache.iter_pages(chunk_key, model)
+        count = 0
+        for count, page in enumerate(chunk_pages, 1):
+            page["index"] = _chunk_page_index(page, count - 1, chunk)
+            next_image = renumber_page_images(page, next_image)
+            yield page
+        if count != len(chunk):
+            raise RuntimeError(f"OCR chunk pages {page_ranges(chunk)} holds {count} of {len(chunk)} pages")
+
+
+def _chunked_ocr_pages(client, pdf_file: Path, pdf_bytes: bytes, model: str, cache: OCRCache,
+                       pages: List[int]) -> Iterator[Dict[str, Any]]:
+    """
+    OCR `pages` as page ranges of OCR_CHUNK_PAGES: one upload, then up to
+    OCR_CHUNK_CONCURRENCY ocr.process calls at a time. Each chunk is cached
+    on its own, so only failed chunks are retried (here, or by a later run).
+    """
+    key = pdf_cache_key(pdf_bytes)
+    chunks = _chunk_pages(pages, OCR_CHUNK_PAGES)
+    chunk_keys = [pages_cache_key(key, chunk) for chunk in chunks]
+    pending = [i for i, chunk_key in enumerate(chunk_keys) if not cache.has(chunk_key, model)]
+    metrics.count("ocr_cache_requests_total", len(chunks) - len(pending), help="OCR cache lookups", result="hit")
+    metrics.count("ocr_cache_requests_total", len(pending), help="OCR cache lookups", result="miss")
+
+    if pending:
+        log_info(logger, f"OCR {pdf_file.name}: {len(pending)} of {len(chunks)} chunks of {OCR_CHUNK_PAGES} pages")
+        document_url = _upload_pdf(client, pdf_file, pdf_bytes)
+        uncached = {}
+
+        def run_chunk(i: int) -> None:
+            with metrics.span("ocr.chunk", pages=page_ranges(chunks[i])):
+                response_dict = _process_pdf(client, pdf_file, document_url, model, chunks[i])
+            # A short or mismatched result fails the chunk (and is retried) before it is cached
+            _check_chunk_pages(response_dict.get("pages", []), chunks[i])
+            if not _put_or_log(cache, chunk_keys[i], response_dict, model, pdf_file):
+                uncached[i] = response_dict.get("pages", [])
+
+        last_error = None
+        for attempt in range(OCR_CHUNK_RETRIES + 1):
+            if attempt:
+                metrics.count("ocr_chunk_retries_total", len(pending), help="OCR chunks retried")
+                log_info(logger, f"Retrying {len(pending)} failed OCR chunks of {pdf_file.name}")
+            failed = []
+            with ThreadPoolExecutor(max_workers=max(1, min(OCR_CHUNK_CONCURRENCY, len(pending))),
+                                    thread_name_prefix="ocr-chunk") as executor:
+                futures = {executor.submit(contextvars.copy_context().run, run_chunk, i): i for i in pending}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        log_info(logger, f"OCR chunk pages {page_ranges(chunks[futures[future]])} failed: {e}")
+                        failed.append(futures[future])
+                        last_error = e
+            pending = sorted(failed)
+            if not pending:
+                break
+        if pending:
+            failed_pages = page_ranges(itertools.chain.from_iterable(chunks[i] for i in pending))
+            raise RuntimeError(f"OCR failed for {pdf_file.name} pages {failed_pages}") from last_error
+        return _iter_chunk_pages(cache, chunk_keys, chunks, model, uncached)
+
+    return _iter_chunk_pages(cache, chunk_keys, chunks, model)
+
+
+def _cached_ocr_pages(client, pdf_file: Path, pdf_bytes: bytes, model: str, cache: OCRCache,
+                      pages: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+    if pages is not None and 0 < OCR_CHUNK_PAGES < len(pages):
+        return _chunked_ocr_pages(client, pdf_file, pdf_bytes, model, cache, pages)
+
+    key = pdf_cache_key(pdf_bytes)
+    if pages is not None:
+        key = pages_cache_key(key, pages)
+
+    if cache.has(key, model):
+        metrics.count("ocr_cache_requests_total", help="OCR cache lookups", result="hit")
+        log_info(logger, f"OCR cache hit for {pdf_file.name} ({key[:12]})")
+    else:
+        metrics.count("ocr_cache_requests_total", help="OCR cache lookups", result="miss")
+        response_dict = _run_ocr(client, pdf_file, pdf_bytes, model, pages)
+        if not _put_or_log(cache, key, response_dict, model, pdf_file):
+            # Not stored (full disk, permissions): use the paid-for result from memory
+            return iter(response_dict.get("pages", []))
+    return cache.iter_pages(key, model)
+
+
+def _merge_pages(pdf_bytes: bytes, plan: List[bool], ocr_pages: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Interleave text-layer and OCR pages in document order with renumbered image ids."""
+    local_pages = text_layer.iter_text_layer_pages(pdf_bytes, [index for index, local in enumerate(plan) if local])
+    next_image = 0
+    for index, local in enumerate(plan):
+        page = next(local_pages) if local else next(ocr_pages, None)
+        if page is None:
+            raise RuntimeError(f"OCR returned no result for page {index + 1}")
+        page["index"] = index
+        next_image = renumber_page_images(page, next_image)
+        yield page
+
+
+def ocr_pdf_pages(client, pdf_path: str, model: str = OCR_MODEL, cache: Optional[OCRCache] = None,
+                  use_text_layer: Optional[bool] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Like ocr_pdf, but return the pages as a generator read back from the
+    cache, so callers hold at most one page (and its images) at a time.
+
+    Pages with a usable embedded text layer are read locally (see
+    text_layer) and only the others are sent to cloud OCR; a born-digital
+    PDF needs no API call at all. `use_text_layer` defaults to
+    TEXT_LAYER_MODE and is ignored when PyMuPDF is not installed. More
+    than OCR_CHUNK_PAGES pages are OCRed in concurrent page-range chunks.
+    """
+    pdf_file = Path(pdf_path)
+    pdf_bytes = pdf_file.read_bytes()
+    cache = cache or OCRCache()
+    if use_text_layer is None:
+        use_text_layer = text_layer.TEXT_LAYER_MODE != "off"
+
+    plan = text_layer.text_layer_plan(pdf_bytes) if use_text_layer else None
+    if not plan or not any(plan):
+        # Large documents are OCRed in chunks when the page count is known locally
+        page_count = len(plan) if plan else text_layer.page_count(pdf_bytes)
+        pages = list(range(page_count)) if page_count and 0 < OCR_CHUNK_PAGES < page_count else None
+        return _cached_ocr_pages(client, pdf_file, pdf_bytes, model, cache, pages)
+
+    missing = [index for index, local in enumerate(plan) if not local]
+    metrics.count("pdf_pages_total", len(plan) - len(missing), help="PDF pages by text source", source="text_layer")
+    metrics.count("pdf_pages_total", len(missing), help="PDF pages by text source", source="ocr")
+    log_info(logger, f"{pdf_file.name}: {len(plan) - len(missing)} of {len(plan)} pages read from the text layer")
+    ocr_pages = _cached_ocr_pages(client, pdf_file, pdf_bytes, model, cache, missing) if missing else iter(())
+    return _merge_pages(pdf_bytes, plan, ocr_pages)
@@ -1,31 +1,85 @@
 import json
 import base64
+import hashlib
 import os
 import re
 import ast
+import contextvars
+import itertools
 import unicodedata
 from pathlib import Path
-from typing import Dict, List, Any
-from datetime import datetime
-from groq import Groq
+from typing import Dict, List, Any, Callable, Iterable, Iterator, Optional, Tuple, TypedDict
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from logger import setup_logger, log_info
+from llm_cache import get_llm_cache
+import metrics
+from clients import get_groq_client
+from image_pipeline import image_extension, process_images
+from workspace import atomic_write
+import serialization
 
 logger = setup_logger()
-#api key
 
-from dotenv import load_dotenv
-load_dotenv()
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-def save_base64_image(base64_str: str, filename: str, output_dir: str = "extracted_images") -> str:
+# "reference": organized JSON carries content-hashed image paths only.
+# "inline": legacy mode that also keeps each image's base64 payload.
+IMAGE_MODE = os.getenv("IMAGE_MODE", "reference")
+IMAGE_OUTPUT_DIR = "extracted_images"
+
+FEATURE_SPLIT_MODEL = "llama-3.1-8b-instant"
+FEATURE_SPLIT_MAX_TOKENS = 512
+# Bump when the feature-split prompts change; recorded in build manifests (build_graph.py)
+FEATURE_SPLIT_PROMPT_VERSION = 1
+
+# Feature splitting: number of features kept per product and how many
+# generate_product_desc calls may be in flight at once (1 = sequential).
+FEATURE_LIMIT = 4
+FEATURE_MAX_IN_FLIGHT = int(os.getenv("FEATURE_MAX_IN_FLIGHT", "4"))
+
+# "per_section": one generate_product_desc call per section, up to
+# FEATURE_MAX_IN_FLIGHT at once. The default: lowest latency.
+# "batched": one request splits all candidate sections (numbered JSON array);
+# items that fail validation are retried per section. About 30% of the
+# prompt tokens but about 1.5x the wall time (benchmarks/bench_feature_split.py),
+# so it suits offline batch runs where token cost matters more than latency.
+FEATURE_SPLIT_MODE = os.getenv("FEATURE_SPLIT_MODE", "per_section")
+FEATURE_SPLIT_BATCH_MAX_TOKENS = 2048
+
+# Sections whose local_split confidence reaches this are split without the
+# LLM; anything above 1.0 sends every section to the LLM.
+LOCAL_SPLIT_THRESHOLD = float(os.getenv("LOCAL_SPLIT_THRESHOLD", "0.75"))
+
+def save_base64_image(base64_str: str, filename: str, output_dir: str = IMAGE_OUTPUT_DIR) -> str:
     os.makedirs(output_dir, exist_ok=True)
     if base64_str.startswith('data:image'):
         base64_str = base64_str.split(',')[1]
     image_data = base64.b64decode(base64_str)
+    # Name the file after the image's real format, whatever extension was asked for
+    filename = f"{os.path.splitext(filename)[0]}.{image_extension(image_data)}"
+    return atomic_write(os.path.join(output_dir, filename), image_data)
+
+def save_image_by_hash(base64_str: str, output_dir: str = IMAGE_OUTPUT_DIR) -> Dict[str, Any]:
+    """
+    Decode an image and store it as <sha256>.<ext>. Identical images are
+    written once; later calls only return the existing file's reference.
+    """
+    extension = "jpg"
+    if base64_str.startswith('data:image'):
+        header, base64_str = base64_str.split(',', 1)
+        subtype = header[len('data:image/'):].split(';')[0]
+        if subtype and subtype != "jpeg":
+            extension = subtype
+    image_data = base64.b64decode(base64_str)
+    # The data URI header is not always right; trust the bytes
+    extension = image_extension(image_data, extension)
+    digest = hashlib.sha256(image_data).hexdigest()
+
+    filename = f"{digest[:32]}.{extension}"
     file_path = os.path.join(output_dir, filename)
-    with open(file_path, 'wb') as f:
-        f.write(image_data)
-    return file_path
+    if not os.path.exists(file_path):
+        # Renamed into place, so a concurrent writer of the same image never leaves a partial file
+        atomic_write(file_path, image_data)
+    return {"filename": filename, "local_path": file_path, "sha256": digest, "size_bytes": len(image_data)}
 
 def clean_text(text: str) -> str:
     text = unicodedata.normalize("NFKD", text)
@@ -33,13 +87,21 @@ def clean_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
+# Line classifier patterns for extract_product_info_from_text
+_IMAGE_MARKDOWN_RE = re.compile(r'!\[.*?\]\(.*?\)')
+_FIRST_WORD_RE = re.compile(r'\w+')
+_MODEL_RE = re.compile(r'Model[:\s]+([A-Z0-9\-]+)', re.IGNORECASE)
+_BRAND_RE = re.compile(r'Brand[:\s]+(\w+)', re.IGNORECASE)
+_SPEC_RE = re.compile(r'^([A-Za-z\s]+):\s*(.+)$')
+_BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+
 def extract_first_word_as_product_name(text: str) -> str:
-    cleaned_text = re.sub(r'[^\w\s]', ' ', text)
-    words = [word.strip() for word in cleaned_text.split() if word.strip()]
-    return words[0] if words else ""
+    # First run of word characters, i.e. the first word once punctuation is treated as whitespace
+    match = _FIRST_WORD_RE.search(text)
+    return match.group() if match else ""
 
 def extract_product_info_from_text(text: str) -> Dict[str, Any]:
-    text = re.sub(r'!\[.*?\]\(.*?\)', '', text)
+    text = _IMAGE_MARKDOWN_RE.sub('', text)
     log_info(logger, text)
 
     product_info = {
@@ -51,94 +113,157 @@ def extract_product_info_from_text(text: str) -> Dict[str, Any]:
         "brand": ""
     }
 
-    lines = text.split('\n')
-
-    for line in lines:
-        line = line.strip()
-        if not line or re.match(r'^\|.*\|$', line):
-            continue
-        first_word = extract_first_word_as_product_name(line)
-        if first_word and len(first_word) > 2:
-            product_info["product_name"] = first_word
-            break
+    # Single sweep over the lines. Name and description fall back to the
+    # first candidates from any line (table rows included) when no regular
+    # line provides them.
+    fallback_name = ""
+    description_lines = []
+    specifications = product_info["specifications"]
 
-    for line in lines:
+    for line in text.split('\n'):
         line = line.strip()
-        if not line or re.match(r'^\|.*\|$', line):
+        if not line:
             continue
 
-        model_match = re.search(r'Model[:\s]+([A-Z0-9\-]+)', line, re.IGNORECASE)
-        if model_match:
-            product_info["model_number"] = model_match.group(1)
+        first_word = None
+        if not fallback_name and len(line) > 2 and not line.isdigit():
+            first_word = extract_first_word_as_product_name(line)
+            fallback_name = first_word
 
-        brand_match = re.search(r'Brand[:\s]+(\w+)', line, re.IGNORECASE)
-        if brand_match:
-            product_info["brand"] = brand_match.group(1)
+        if len(line) > 20 and len(description_lines) < 3:
+            description_lines.append(line)
 
-        spec_match = re.match(r'^([A-Za-z\s]+):\s*(.+)$', line)
-        if spec_match:
-            key = spec_match.group(1).strip()
-            value = spec_match.group(2).strip()
-            product_info["specifications"][key] = value
+        # Skip markdown table rows
+        if line[0] == '|' and line[-1] == '|' and len(line) > 1:
+            continue
 
-        if not product_info["product_description"]:
-            if '#' in line and '**' in line:
-                desc_match = re.search(r'\*\*(.+?)\*\*', line)
-                if desc_match:
-                    product_info["product_description"] = desc_match.group(1).strip()
+        if not product_info["product_name"]:
+            if first_word is None:
+                first_word = extract_first_word_as_product_name(line)
+            if len(first_word) > 2:
+                product_info["product_name"] = first_word
+
+        lowered = line.lower()
+        if "model" in lowered:
+            model_match = _MODEL_RE.search(line)
+            if model_match:
+                product_info["model_number"] = model_match.group(1)
+
+        if "brand" in lowered:
+            brand_match = _BRAND_RE.search(line)
+            if brand_match:
+                product_info["brand"] = brand_match.group(1)
+
+        if ':' in line:
+            spec_match = _SPEC_RE.match(line)
+            if spec_match:
+                specifications[spec_match.group(1).strip()] = spec_match.group(2).strip()
+
+        if not product_info["product_description"] and '#' in line and '**' in line:
+            desc_match = _BOLD_RE.search(line)
+            if desc_match:
+                product_info["product_description"] = desc_match.group(1).strip()
 
     if not product_info["product_name"]:
-        for line in lines:
-            line = line.strip()
-            if len(line) > 2 and not line.isdigit():
-                first_word = extract_first_word_as_product_name(line)
-                if first_word:
-                    product_info["product_name"] = first_word
-                    break
+        product_info["product_name"] = fallback_name
 
     if not product_info["product_description"]:
-        description_lines = []
-        for line in lines:
-            if len(line.strip()) > 20:
-                description_lines.append(line.strip())
-            if len(description_lines) >= 3:
-                break
         product_info["product_description"] = " ".join(description_lines)
 
     return product_info
 
-def extract_tables_from_text(text: str) -> List[Dict[str, Any]]:
-    tables = []
-    lines = text.split('\n')
-    current_table = None
+class MarkdownTable(TypedDict):
+    headers: List[str]
+    rows: List[List[str]]
+    page_number: Optional[int]
+    # False when the table had no separator row, so `headers` is really its first data row
+    has_separator: bool
+
+_TABLE_CELL_SPLIT_RE = re.compile(r'(?<!\\)\|')
+_TABLE_SEPARATOR_CELL_RE = re.compile(r'^:?-{1,}:?$')
+_TABLE_LINE_BREAK_RE = re.compile(r'<br\s*/?>', re.IGNORECASE)
+
+def _split_table_row(line: str) -> List[str]:
+    inner = line[1:-1] if line.endswith('|') else line[1:]
+    return [
+        _TABLE_LINE_BREAK_RE.sub('\n', cell.replace('\\|', '|')).strip()
+        for cell in _TABLE_CELL_SPLIT_RE.split(inner)
+    ]
+
+def _is_separator_row(cells: List[str]) -> bool:
+    return bool(cells) and all(_TABLE_SEPARATOR_CELL_RE.match(cell.replace(' ', '')) for cell in cells)
+
+def _build_table(rows: List[List[str]], has_separator: bool, page_number: Optional[int]) -> MarkdownTable:
+    headers, body = rows[0], rows[1:]
+    if has_separator:
+        # Column-aligned rows so consumers can index cells by header position
+        width = len(headers)
+        body = [(row + [""] * width)[:width] for row in body]
+    return {"headers": headers, "rows": body, "page_number": page_number, "has_separator": has_separator}
+
+def iter_markdown_tables(lines: Iterable[str], page_number: Optional[int] = None) -> Iterator[MarkdownTable]:
+    """
+    Streaming parser for the pipe tables Mistral OCR emits. Works line by
+    line in a single pass and yields each table as soon as it ends.
+
+    - the row before a `| --- | :-: |` separator becomes the header row
+      (without a separator the first row is used as header)
+    - a row that opens with `|` but doesn't close continues on following
+      lines that carry a pipe but don't start a new row (multi-line cell);
+      a blank line, a line without pipes or a new row ends it, and the row
+      counts as complete, as in GFM. `<br>` inside cells becomes a newline
+    - any non-table line ends the current table, so a page may hold several
+    """
+    rows: List[List[str]] = []
+    has_separator = False
+    pending = None
+
+    def add_row(line: str) -> None:
+        nonlocal has_separator
+        cells = _split_table_row(line)
+        if _is_separator_row(cells):
+            if len(rows) == 1:
+                has_separator = True
+            return
+        rows.append(cells)
 
     for line in lines:
         line = line.strip()
-        if not line:
+
+        if pending is not None:
+            if line and '|' in line and not line.startswith('|'):
+                pending = f"{pending}\n{line}"
+                if line.endswith('|'):
+                    add_row(pending)
+                    pending = None
+                continue
+            add_row(pending)
+            pending = None
+
+        if line.startswith('|'):
+            if len(line) == 1 or not line.endswith('|'):
+                pending = line
+            else:
+                add_row(line)
             continue
 
-        if '\t' in line or '  ' in line:
-            columns = re.split(r'\s{2,}|\t', line)
-            columns = [col.strip() for col in columns if col.strip()]
-            if len(columns) >= 2:
-                if current_table is None:
-                    current_table = {"headers": columns, "rows": []}
-                else:
-                    current_table["rows"].append(columns)
-        else:
-            if current_table is not None:
-                tables.append(current_table)
-                current_table = None
+        if rows:
+            yield _build_table(rows, has_separator, page_number)
+        rows, has_separator = [], False
 
-    if current_table is not None:
-        tables.append(current_table)
+    if pending is not None:
+        add_row(pending)
+    if rows:
+        yield _build_table(rows, has_separator, page_number)
 
-    return tables
+def extract_tables_from_text(text: str, page_number: Optional[int] = None) -> List[MarkdownTable]:
+    return list(iter_markdown_tables(text.splitlines(), page_number))
 
-def generate_product_desc(product_input: str) -> dict:
+def generate_product_desc(product_input: str, client=None) -> dict:
     """
     Extract topic and description from a product input string.
     Returns a dictionary with format: {"topic": "description"}
+    `client` overrides the shared Groq client (e.g. a local fake).
     """
     prompt = f"""You are a text parser. Your job is to split a product input into topic and description.
 
@@ -162,19 +287,28 @@ Input: "{product_input}"
 Output:"""
 
     try:
-        completion = groq_client.chat.completions.create(
-            model="llama-3.1-8b-instant",  # Updated to use the better model
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.0,
-            max_completion_tokens=512,
-            top_p=1,
-            stream=False,
-            stop=None,
-        )
-        
-        output_text = completion.choices[0].message.content.strip()
+        cache = get_llm_cache()
+        cache_key = cache.make_key(FEATURE_SPLIT_MODEL, prompt, 0.0, FEATURE_SPLIT_MAX_TOKENS)
+        output_text = cache.get(cache_key)
+        metrics.count("llm_cache_requests_total", help="LLM cache lookups", stage="feature_split",
+                      result="miss" if output_text is None else "hit")
+        if output_text is None:
+            client = client or get_groq_client()
+            with metrics.span("llm.feature_split", model=FEATURE_SPLIT_MODEL):
+                completion = client.chat.completions.create(
+                    model=FEATURE_SPLIT_MODEL,  # Updated to use the better model
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.0,
+                    max_completion_tokens=FEATURE_SPLIT_MAX_TOKENS,
+                    top_p=1,
+                    stream=False,
+                    stop=None,
+                )
+            metrics.count_llm_usage(completion, FEATURE_SPLIT_MODEL, "feature_split")
+            output_text = completion.choices[0].message.content.strip()
+            cache.put(cache_key, output_text)
         log_info(logger, f"Raw LLM output: {output_text}")  # Debug log
         
         # Try to extract JSON from the response
@@ -194,7 +328,7 @@ Output:"""
                     return result
                 else:
                     log_info(logger, f"Result is not a dict: {type(result)}")
-                    return fallback_parse(product_input)
+                    return _fallback(product_input, "not_dict")
             except json.JSONDecodeError:
                 try:
                     # Fallback to ast.literal_eval for single-quoted strings
@@ -204,37 +338,111 @@ Output:"""
                         return result
                     else:
                         log_info(logger, f"ast.literal_eval result is not a dict: {type(result)}")
-                        return fallback_parse(product_input)
+                        return _fallback(product_input, "not_dict")
                 except (ValueError, SyntaxError) as e:
                     log_info(logger, f"Failed to parse JSON/dict: {e}")
-                    return fallback_parse(product_input)
+                    return _fallback(product_input, "unparseable")
         else:
             log_info(logger, "No valid JSON found in response")
-            return fallback_parse(product_input)
+            return _fallback(product_input, "no_json")
             
     except Exception as e:
         log_info(logger, f"API Error: {e}")
-        return fallback_parse(product_input)
+        return _fallback(product_input, type(e).__name__)
+
+def _fallback(product_input: str, reason: str) -> dict:
+    """fallback_parse, counted so silent degradation shows up in the metrics."""
+    metrics.count("llm_fallbacks_total", help="LLM answers replaced by a local fallback", stage="feature_split",
+                  reason=reason)
+    return fallback_parse(product_input)
+
+# Common patterns for product titles
+_FALLBACK_SPLIT_PATTERNS = [
+    # Pattern 1: Title followed by description (multiple words in title)
+    re.compile(r'^([A-Z][A-Za-z\s&\.]+(?:Technology|Engine|System|Shaft|Component|Tool|Device|Machine))\s+(.+)$'),
+    # Pattern 2: Acronym/Technical term followed by description
+    re.compile(r'^([A-Z\.]+(?:\s+[A-Z][A-Za-z]+)*)\s+(.+)$'),
+    # Pattern 3: First sentence as title, rest as description
+    re.compile(r'^([^.]+\.)\s*(.+)$'),
+    # Pattern 4: First few capitalized words as title
+    re.compile(r'^((?:[A-Z][A-Za-z]*\s*){2,4})\s*(.+)$'),
+]
+
+# local_split vocabulary
+_WORD_RE = re.compile(r'\S+')
+_TITLE_WORD_RE = re.compile(r'^[("\']?[A-Z0-9]')
+_TITLE_CONNECTORS = {"&", "and", "of", "for", "with", "to", "in", "on", "-", "/", "+"}
+_SENTENCE_STARTERS = {
+    "The", "A", "An", "This", "These", "That", "Its", "It", "Our", "Each", "Every", "All", "With",
+    "Designed", "Provides", "Allows", "Features", "Helps", "Makes", "Reduces", "Ensures", "Uses",
+}
+_HEAD_NOUNS = {
+    "technology", "engine", "system", "shaft", "component", "tool", "device", "machine", "design", "tank",
+    "handle", "clutch", "pump", "filter", "start", "starter", "blade", "guard", "nozzle", "frame", "valve",
+    "carburetor", "harness", "strap", "cover", "body", "motor", "gear", "gearbox", "hose", "lance", "head",
+}
+
+def local_split(product_input: str) -> Tuple[Dict[str, str], float]:
+    """
+    Split a feature section into {topic: description} without the LLM and
+    score how sure the split is (0-1).
+
+    The topic is the leading run of title-case words. A sentence starter
+    inside that run ("The", "A", "Designed"...) marks the split with high
+    confidence; otherwise the last capitalized word is taken as the start
+    of the description, which is only trusted when the topic ends in a
+    typical feature noun ("Shaft", "System"...). Words are never changed:
+    topic and description are slices of the input.
+    """
+    text = product_input.strip()
+    spans = [match.span() for match in _WORD_RE.finditer(text)]
+    words = [text[start:end] for start, end in spans]
+
+    # Leading title-case run (connectors allowed between title words)
+    run = 0
+    while run < len(words):
+        word = words[run]
+        if _TITLE_WORD_RE.match(word):
+            run += 1
+        elif run and word.lower() in _TITLE_CONNECTORS and run + 1 < len(words) and _TITLE_WORD_RE.match(words[run + 1]):
+            run += 1
+        else:
+            break
+
+    if run == 0 or run >= len(words):
+        return fallback_parse(text), 0.0
+
+    starter = next((k for k in range(1, run) if words[k] in _SENTENCE_STARTERS), None)
+    if starter is not None:
+        split_at, confidence = starter, 0.9
+    elif run >= 2:
+        split_at, confidence = run - 1, 0.55
+    else:
+        return fallback_parse(text), 0.1
+
+    topic_words, description_words = words[:split_at], words[split_at:]
+    if topic_words[-1].strip(".,:;").lower() in _HEAD_NOUNS:
+        confidence += 0.25
+    if topic_words[-1].lower() in _TITLE_CONNECTORS or topic_words[-1].endswith((",", ":")):
+        confidence -= 0.4
+    if len(topic_words) == 1:
+        confidence -= 0.2
+    if len(topic_words) > 8:
+        confidence -= 0.3
+    if len(description_words) < 3:
+        confidence -= 0.3
+
+    topic = text[:spans[split_at - 1][1]]
+    description = text[spans[split_at][0]:]
+    return {topic: description}, max(0.0, min(1.0, confidence))
 
 def fallback_parse(product_input: str) -> dict:
     """
     Fallback method to parse product input using regex patterns.
     This runs if LLM fails to provide proper output.
     """
-    # Common patterns for product titles
-    patterns = [
-        # Pattern 1: Title followed by description (multiple words in title)
-        r'^([A-Z][A-Za-z\s&\.]+(?:Technology|Engine|System|Shaft|Component|Tool|Device|Machine))\s+(.+)$',
-        # Pattern 2: Acronym/Technical term followed by description
-        r'^([A-Z\.]+(?:\s+[A-Z][A-Za-z]+)*)\s+(.+)$',
-        # Pattern 3: First sentence as title, rest as description
-        r'^([^.]+\.)\s*(.+)$',
-        # Pattern 4: First few capitalized words as title
-        r'^((?:[A-Z][A-Za-z]*\s*){2,4})\s*(.+)$'
-    ]
-    
-    for pattern in patterns:
-        match = re.match(pattern, product_input.strip())
+    for pattern in _FALLBACK_SPLIT_PATTERNS:
+        match = pattern.match(product_input.strip())
         if match:
             topic = match.group(1).strip()
             description = match.group(2).strip()
@@ -260,53 +468,280 @@ def fallback_parse(product_input: str) -> dict:
     # If all else fails, return the original text with a generic key
     return {"Feature": product_input}
 
-def extract_features_from_image_sections(text: str) -> List[Dict[str, str]]:
-    features = []
-    
-    # Split text by image markers to get all sections
-    image_pattern = r"!\[img-\d+\.jpeg\]\(img-\d+\.jpeg\)"
-    sections = re.split(image_pattern, text)
-    
-    # Process each section that has meaningful content
+def _normalize_words(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+def build_batch_split_prompt(product_inputs: List[str]) -> str:
+    numbered = json.dumps([{"id": i + 1, "text": text} for i, text in enumerate(product_inputs)], ensure_ascii=False)
+    return f"""You are a text parser. Split each product input into topic and description.
+
+Rules:
+1. The topic is usually the first few words (product name/title)
+2. The description is the rest of the text
+3. Do not add, remove, or modify any words from the original input
+4. Return ONLY a JSON array with one object per input, in the same order:
+   [{{"id": <input id>, "topic": "<topic>", "description": "<description>"}}]
+5. Do not include any explanation or additional text
+
+Example:
+Inputs: [{{"id": 1, "text": "Treaded Clutch Shaft The solid steel inner drive-shaft is threaded at the clutch end, which eliminates vibration."}}]
+Output: [{{"id": 1, "topic": "Treaded Clutch Shaft", "description": "The solid steel inner drive-shaft is threaded at the clutch end, which eliminates vibration."}}]
+
+Inputs:
+{numbered}
+Output:"""
+
+def parse_batch_split_output(output_text: str, product_inputs: List[str]) -> List[Optional[Dict[str, str]]]:
+    """
+    Map a batched JSON-array answer back to the inputs. An item is accepted
+    only if its id is in range and its topic is a prefix of that input, so
+    a dropped or reordered item can't shift topics onto the wrong section.
+    Missing or invalid items are None.
+    """
+    results: List[Optional[Dict[str, str]]] = [None] * len(product_inputs)
+    start, end = output_text.find("["), output_text.rfind("]")
+    if start == -1 or end <= start:
+        return results
+    try:
+        items = json.loads(output_text[start:end + 1])
+    except json.JSONDecodeError:
+        return results
+    if not isinstance(items, list):
+        return results
+
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item_id, topic, description = item.get("id"), item.get("topic"), item.get("description")
+        if not isinstance(item_id, int) or not 1 <= item_id <= len(product_inputs) or results[item_id - 1]:
+            continue
+        if not isinstance(topic, str) or not isinstance(description, str) or not topic.strip() or not description.strip():
+            continue
+        if not _normalize_words(product_inputs[item_id - 1]).startswith(_normalize_words(topic)):
+            continue
+        results[item_id - 1] = {topic.strip(): description.strip()}
+    return results
+
+def generate_product_desc_batch(product_inputs: List[str], client=None) -> List[Optional[Dict[str, str]]]:
+    """
+    Split several product inputs with a single LLM request, sending only the
+    items not already cached. Returns one {"topic": "description"} dict per
+    input, or None where the answer was missing or failed validation (the
+    caller decides how to retry).
+    """
+    if not product_inputs:
+        return []
+    results: List[Optional[Dict[str, str]]] = [None] * len(product_inputs)
+
+    try:
+        cache = get_llm_cache()
+        # Cached per item, under the key of a one-item batch: items that were
+        # answered are reused even when others in the same request failed
+        cache_keys = [cache.make_key(FEATURE_SPLIT_MODEL, build_batch_split_prompt([text]), 0.0,
+                                     FEATURE_SPLIT_BATCH_MAX_TOKENS) for text in product_inputs]
+        for position, (text, cache_key) in enumerate(zip(product_inputs, cache_keys)):
+            cached = cache.get(cache_key)
+            if cached is not None:
+                results[position] = parse_batch_split_output(cached, [text])[0]
+        missing = [position for position, result in enumerate(results) if result is None]
+        metrics.count("llm_cache_requests_total", len(results) - len(missing), help="LLM cache lookups",
+                      stage="feature_split_batch", result="hit")
+        metrics.count("llm_cache_requests_total", len(missing), help="LLM cache lookups",
+                      stage="feature_split_batch", result="miss")
+
+        if missing:
+            pending = [product_inputs[position] for position in missing]
+            client = client or get_groq_client()
+            with metrics.span("llm.feature_split_batch", model=FEATURE_SPLIT_MODEL, items=len(pending)):
+                completion = client.chat.completions.create(
+                    model=FEATURE_SPLIT_MODEL,
+                    messages=[
+                        {"role": "user", "content": build_batch_split_prompt(pending)}
+                    ],
+                    temperature=0.0,
+                    max_completion_tokens=FEATURE_SPLIT_BATCH_MAX_TOKENS,
+                    top_p=1,
+                    stream=False,
+                    stop=None,
+                )
+            metrics.count_llm_usage(completion, FEATURE_SPLIT_MODEL, "feature_split_batch")
+            output_text = completion.choices[0].message.content.strip()
+            log_info(logger, f"Raw batched LLM output: {output_text}")
+            for position, result in zip(missing, parse_batch_split_output(output_text, pending)):
+                if result is None:
+                    continue
+                results[position] = result
+                [(topic, description)] = result.items()
+                cache.put(cache_keys[position],
+                          json.dumps([{"id": 1, "topic": topic, "description": description}], ensure_ascii=False))
+    except Exception as e:
+        log_info(logger, f"API Error: {e}")
+        metrics.count("llm_fallbacks_total", help="LLM answers replaced by a local fallback",
+                      stage="feature_split_batch", reason=type(e).__name__)
+
+    failed = sum(1 for result in results if result is None)
+    metrics.count("feature_split_batch_items_total", len(results) - failed, help="Sections split by batched requests",
+                  result="ok")
+    metrics.count("feature_split_batch_items_total", failed, help="Sections split by batched requests",
+                  result="failed")
+    return results
+
+def _split_sections_batched(candidates: Iterable[Tuple[int, str]], max_in_flight: int,
+                            client=None) -> List[Dict[str, str]]:
+    """
+    Send the first FEATURE_LIMIT candidate sections in one batched request,
+    then retry only the items that failed, per section (which itself falls
+    back to fallback_parse).
+    """
+    batch = []
+    for idx, input_text in candidates:
+        log_info(logger, f"Batching section {idx}: {input_text[:100]}...")
+        batch.append((idx, input_text))
+        if len(batch) >= FEATURE_LIMIT:
+            break
+
+    results = generate_product_desc_batch([input_text for _, input_text in batch], client)
+    retry = [(idx, input_text) for (idx, input_text), result in zip(batch, results) if result is None]
+    if retry:
+        log_info(logger, f"Retrying {len(retry)} of {len(batch)} sections individually")
+        if max_in_flight > 1:
+            retried = iter(_split_sections_concurrently(retry, max_in_flight, client))
+        else:
+            retried = iter([_feature_from_result(generate_product_desc(input_text, client), input_text)
+                            for _, input_text in retry])
+
+    return [
+        _feature_from_result(result, input_text) if result is not None else next(retried)
+        for (_, input_text), result in zip(batch, results)
+    ]
+
+def _split_locally(candidates: List[Tuple[int, str]],
+                   threshold: float) -> Tuple[Dict[int, Dict[str, str]], List[Tuple[int, str]]]:
+    """Split confident sections locally; return ({section index: feature}, sections left for the LLM)."""
+    local, escalated = {}, []
+    for idx, input_text in candidates:
+        result, confidence = local_split(input_text)
+        if confidence >= threshold:
+            local[idx] = {clean_text(k): clean_text(v) for k, v in result.items()}
+            log_info(logger, f"Split section {idx} locally ({confidence:.2f}): {local[idx]}")
+        else:
+            escalated.append((idx, input_text))
+    metrics.count("feature_split_sections_total", len(local), help="Feature sections by splitter", splitter="local")
+    metrics.count("feature_split_sections_total", len(escalated), help="Feature sections by splitter", splitter="llm")
+    return local, escalated
+
+def _iter_feature_candidates(sections: List[str]) -> Iterator[Tuple[int, str]]:
+    """Yield (section index, cleaned text) for sections that should be sent to the LLM."""
     feature_count = 0
     for idx, section in enumerate(sections):
         input_text = clean_text(section.strip())
-        
+
         # Skip empty sections or very short content
         if not input_text or len(input_text) < 10:
             continue
-            
+
         # Skip the first section (usually header/title content before any images)
         if idx == 0:
             continue
-        
+
         # Skip the first feature (increment counter but don't add to features)
         if feature_count == 0:
             feature_count += 1
             log_info(logger, f"Skipping first feature in section {idx}")
             continue
-            
-        log_info(logger, f"Processing section {idx}: {input_text[:100]}...")
-        result = generate_product_desc(input_text)
-        
-        # Ensure result is a dictionary and handle all cases
-        if isinstance(result, dict) and result and not result.get("error"):
-            # Clean the result keys and values
-            clean_result = {clean_text(k): clean_text(v) for k, v in result.items()}
-            features.append(clean_result)
-            log_info(logger, f"Successfully extracted feature: {clean_result}")
-        else:
-            # Fallback: create a generic feature entry
-            fallback_feature = {"Feature": input_text[:200]}
-            features.append(fallback_feature)
-            log_info(logger, f"Used fallback for feature (result type: {type(result)}): {fallback_feature}")
-        
-        # Stop after collecting 4 features (excluding the skipped first one)
-        if len(features) >= 4:
-            break
+
+        yield idx, input_text
+
+def _feature_from_result(result: Any, input_text: str) -> Dict[str, str]:
+    # Ensure result is a dictionary and handle all cases
+    if isinstance(result, dict) and result and not result.get("error"):
+        # Clean the result keys and values
+        clean_result = {clean_text(k): clean_text(v) for k, v in result.items()}
+        log_info(logger, f"Successfully extracted feature: {clean_result}")
+        return clean_result
+
+    # Fallback: create a generic feature entry
+    fallback_feature = {"Feature": input_text[:200]}
+    log_info(logger, f"Used fallback for feature (result type: {type(result)}): {fallback_feature}")
+    return fallback_feature
+
+def _split_sections_concurrently(candidates: Iterable[Tuple[int, str]], max_in_flight: int,
+                                 client=None) -> List[Dict[str, str]]:
+    """
+    Run generate_product_desc for the candidate sections with at most
+    `max_in_flight` requests outstanding. Results are consumed in section
+    order; once FEATURE_LIMIT features are collected the remaining calls are
+    cancelled.
+    """
+    features = []
+    candidates = iter(candidates)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="feature-split")
+
+    def submit_next() -> None:
+        # Every answered section yields a feature (parsed or fallback), so
+        # never have more requests outstanding than features still missing.
+        if len(features) + len(pending) >= FEATURE_LIMIT:
+            return
+        for idx, input_text in candidates:
+            log_info(logger, f"Processing section {idx}: {input_text[:100]}...")
+            # Copy the context so LLM spans land in the caller's timing report
+            pending.append((input_text, executor.submit(contextvars.copy_context().run,
+                                                        generate_product_desc, input_text, client)))
+            return
+
+    try:
+        for _ in range(max_in_flight):
+            submit_next()
+
+        while pending and len(features) < FEATURE_LIMIT:
+            input_text, future = pending.popleft()
+            try:
+                result = future.result()
+            except Exception as e:
+                log_info(logger, f"Feature split failed: {e}")
+                result = None
+            features.append(_feature_from_result(result, input_text))
+            submit_next()
+    finally:
+        # Drop queued calls and don't wait for the ones already running
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return features
+
+def extract_features_from_image_sections(text: str, max_in_flight: Optional[int] = None,
+                                         client=None, mode: Optional[str] = None,
+                                         local_threshold: Optional[float] = None) -> List[Dict[str, str]]:
+    if max_in_flight is None:
+        max_in_flight = FEATURE_MAX_IN_FLIGHT
+    mode = mode or FEATURE_SPLIT_MODE
+    if local_threshold is None:
+        local_threshold = LOCAL_SPLIT_THRESHOLD
+
+    # Split text by image markers to get all sections
+    image_pattern = r"!\[img-\d+\.jpeg\]\(img-\d+\.jpeg\)"
+    sections = re.split(image_pattern, text)
+    # Every candidate yields a feature, so only the first FEATURE_LIMIT matter
+    candidates = list(itertools.islice(_iter_feature_candidates(sections), FEATURE_LIMIT))
+    local, escalated = _split_locally(candidates, local_threshold)
+
+    # Process each ambiguous section with the LLM
+    if mode == "batched":
+        llm_features = _split_sections_batched(escalated, max_in_flight, client)
+    elif max_in_flight > 1:
+        llm_features = _split_sections_concurrently(escalated, max_in_flight, client)
+    else:
+        llm_features = []
+        for idx, input_text in escalated:
+            log_info(logger, f"Processing section {idx}: {input_text[:100]}...")
+            result = generate_product_desc(input_text, client)
+            llm_features.append(_feature_from_result(result, input_text))
+
+    llm_features = iter(llm_features)
+    features = [local[idx] if idx in local else next(llm_features) for idx, _ in candidates]
     
     # If we still don't have enough features, try alternative extraction
-    if len(features) < 4:
+    if len(features) < FEATURE_LIMIT:
         # Look for additional patterns that might indicate features
         additional_patterns = [
             r"!\[.*?\]\(.*?\)(.*?)(?=!\[.*?\]\(.*?\)|$)",  # Any image followed by text
@@ -316,12 +751,12 @@ def extract_features_from_image_sections(text: str) -> List[Dict[str, str]]:
         
         skip_first_additional = True  # Skip first feature from additional patterns too
         for pattern in additional_patterns:
-            if len(features) >= 4:
+            if len(features) >= FEATURE_LIMIT:
                 break
                 
             matches = re.findall(pattern, text, re.DOTALL)
             for match in matches:
-                if len(features) >= 4:
+                if len(features) >= FEATURE_LIMIT:
                     break
                 
                 if skip_first_additional:
@@ -340,55 +775,142 @@ def extract_features_from_image_sections(text: str) -> List[Dict[str, str]]:
                             features.append(feature_dict)
                             log_info(logger, f"Added additional feature: {feature_dict}")
 
-    return features[:4]  # Return exactly 4 features or less if not available
+    return features[:FEATURE_LIMIT]  # Return exactly 4 features or less if not available
+
+def _organize_page_image(image: Dict[str, Any], page_number: int, image_counter: int,
+                         image_mode: str, image_dir: str = IMAGE_OUTPUT_DIR) -> Dict[str, Any]:
+    image_id = image.get("id", f"img_{image_counter}")
+    # if image_id in ["img-6.jpeg"]:
+    #     continue
+
+    if image_mode == "reference":
+        saved = save_image_by_hash(image.get("image_base64", ""), image_dir)
+        return {
+            "id": image_id,
+            "filename": saved["filename"],
+            "local_path": saved["local_path"],
+            "sha256": saved["sha256"],
+            "page_number": page_number,
+            "size_bytes": saved["size_bytes"],
+            "size_estimate": saved["size_bytes"]
+        }
+
+    image_filename = f"page_{page_number}image{image_counter}.jpg"
+    saved_path = save_base64_image(
+        image.get("image_base64", ""),
+        image_filename,
+        image_dir
+    )
+    return {
+        "id": image_id,
+        "filename": os.path.basename(saved_path),
+        "local_path": saved_path,
+        "base64_data": image.get("image_base64", ""),
+        "page_number": page_number,
+        "size_estimate": len(image.get("image_base64", "")) * 3 // 4
+    }
+
+def iter_ocr_pages(source: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Yield OCR pages as plain dicts from an OCR response dict, an SDK
+    response object, a .json/.jsonl file of a stored response, or any
+    iterable of pages (dicts or SDK page models).
+    """
+    if isinstance(source, (str, Path)):
+        path = Path(source)
+        if path.suffix == ".jsonl":
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            source = json.load(f)
+
+    if isinstance(source, dict):
+        pages = source.get("pages", [])
+    else:
+        pages = getattr(source, "pages", source)
+
+    for page in pages:
+        yield page.model_dump() if hasattr(page, "model_dump") else page
+
+def iter_organized_pages(pages: Iterable[Any], image_mode: Optional[str] = None,
+                         image_dir: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Write each page's images to `image_dir` (default IMAGE_OUTPUT_DIR) as
+    the page arrives and yield a per-page partial result:
+    {"page_number", "markdown", "images"}. The page's OCR payload can be
+    released as soon as it has been yielded.
+    """
+    image_mode = image_mode or IMAGE_MODE
+    image_dir = image_dir or IMAGE_OUTPUT_DIR
+    image_counter = 1
 
-def organize_ocr_response(ocr_response_dict: Dict[str, Any], pdf_filename: str) -> Dict[str, Any]:
+    for page_idx, page in enumerate(iter_ocr_pages(pages)):
+        page_images = []
+        for image in page.get("images", []):
+            try:
+                page_images.append(_organize_page_image(image, page_idx + 1, image_counter, image_mode, image_dir))
+                image_counter += 1
+            except Exception as e:
+                print(f"Error saving image {image.get('id', image_counter)} on page {page_idx + 1}: {e}")
+
+        yield {
+            "page_number": page_idx + 1,
+            "markdown": page.get("markdown", ""),
+            "images": page_images,
+        }
+
+def organize_ocr_pages(pages: Iterable[Any], pdf_filename: str, image_mode: Optional[str] = None,
+                       on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+                       image_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Streaming variant of organize_ocr_response: consumes pages one at a time
+    (see iter_ocr_pages), so peak memory is one page of OCR output plus the
+    accumulated text. `on_page` receives each per-page partial result.
+    """
     organized_data = {
 
         "products": [],
         "all_extracted_images": [],
         "metadata": {
-            "total_pages": len(ocr_response_dict.get("pages", [])),
+            "total_pages": 0,
             "total_images": 0,
             "total_text_length": 0
         }
     }
 
-    image_counter = 1
-    all_text = ""
-
-    for page_idx, page in enumerate(ocr_response_dict.get("pages", [])):
-        page_text = page.get("markdown", "")
-        all_text += page_text + "\n"
-
-        for image in page.get("images", []):
-            image_id = image.get("id", f"img_{image_counter}")
-            # if image_id in ["img-6.jpeg"]:
-            #     continue
-
-            image_filename = f"page_{page_idx + 1}image{image_counter}.jpg"
-            try:
-                saved_path = save_base64_image(
-                    image.get("image_base64", ""),
-                    image_filename
-                )
-                organized_data["all_extracted_images"].append({
-                    "id": image_id,
-                    "filename": image_filename,
-                    "local_path": saved_path,
-                    "base64_data": image.get("image_base64", ""),
-                    "page_number": page_idx + 1,
-                    "size_estimate": len(image.get("image_base64", "")) * 3 // 4
-                })
-                image_counter += 1
-            except Exception as e:
-                print(f"Error saving image {image_filename}: {e}")
-
-    product_info = extract_product_info_from_text(all_text)
+    text_parts = []
+    tables = []
+    with metrics.span("organize.pages") as span_info:
+        for partial in iter_organized_pages(pages, image_mode, image_dir):
+            text_parts.append(partial["markdown"])
+            text_parts.append("\n")
+            tables.extend(extract_tables_from_text(partial["markdown"], partial["page_number"]))
+            organized_data["all_extracted_images"].extend(partial["images"])
+            organized_data["metadata"]["total_pages"] += 1
+            metrics.count("pages_total", help="OCR pages organized")
+            metrics.count("images_total", len(partial["images"]), help="Page images extracted")
+            metrics.count("image_bytes_total", sum(img.get("size_estimate", 0) for img in partial["images"]),
+                          help="Decoded bytes of extracted page images")
+            if on_page is not None:
+                on_page(partial)
+        span_info["pages"] = organized_data["metadata"]["total_pages"]
+
+    # Decode each stored image once: true type and size, thumbnails and web variants
+    with metrics.span("organize.images") as span_info:
+        span_info["variants"] = process_images(organized_data["all_extracted_images"])
+
+    all_text = "".join(text_parts)
+    del text_parts
+
+    with metrics.span("organize.product_info"):
+        product_info = extract_product_info_from_text(all_text)
     log_info(logger, product_info)
-    tables = extract_tables_from_text(all_text)
     log_info(logger, tables)
-    features = extract_features_from_image_sections(all_text)
+    with metrics.span("organize.features"):
+        features = extract_features_from_image_sections(all_text)
     log_info(logger, f"Extracted features: {features}")
 
     product_data = {
@@ -415,30 +937,33 @@ def organize_ocr_response(ocr_response_dict: Dict[str, Any], pdf_filename: str)
 
     return organized_data
 
-def save_organized_data(organized_data: Dict[str, Any], output_filename: str = "organized_product_data.json"):
+def organize_ocr_response(ocr_response_dict: Dict[str, Any], pdf_filename: str,
+                          image_mode: Optional[str] = None, image_dir: Optional[str] = None) -> Dict[str, Any]:
+    return organize_ocr_pages(ocr_response_dict.get("pages", []), pdf_filename, image_mode, image_dir=image_dir)
+
+def save_organized_data(organized_data: Dict[str, Any], output_filename: str = "organized_product_data.json",
+                        compact: Optional[bool] = None):
+    # Written atomically; `compact` (default JSON_COMPACT) drops the indentation
     try:
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            json.dump(organized_data, f, indent=4, ensure_ascii=False)
+        serialization.dump(organized_data, output_filename, indent=4, compact=compact)
     except Exception as e:
         print(f"Error saving JSON file: {e}")
 
-def process_ocr_response(ocr_response_dict: Dict[str, Any], pdf_filename: str):
-    organized_data = organize_ocr_response(ocr_response_dict, pdf_filename)
+def organized_data_path(pdf_filename: str, output_dir: str = ".") -> str:
+    return os.path.join(output_dir, f"{Path(pdf_filename).stem}_organized_data.json")
+
+def process_ocr_response(ocr_response_dict: Dict[str, Any], pdf_filename: str, output_dir: str = ".",
+                         image_dir: Optional[str] = None):
+    organized_data = organize_ocr_response(ocr_response_dict, pdf_filename, image_dir=image_dir)
     log_info(logger, organized_data)
-    output_filename = f"{Path(pdf_filename).stem}_organized_data.json"
+    output_filename = organized_data_path(pdf_filename, output_dir)
     save_organized_data(organized_data, output_filename)
     return organized_data
 
-def save_organized_data(organized_data: Dict[str, Any], output_filename: str = "organized_product_data.json"):
-    try:
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            json.dump(organized_data, f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        print(f"Error saving JSON file: {e}")
-
-def process_ocr_response(ocr_response_dict: Dict[str, Any], pdf_filename: str):
-    organized_data = organize_ocr_response(ocr_response_dict, pdf_filename)
+def process_ocr_pages(pages: Iterable[Any], pdf_filename: str, output_dir: str = ".",
+                      image_dir: Optional[str] = None, compact: Optional[bool] = None):
+    """Same as process_ocr_response, for a stream of pages (e.g. from OCRCache.iter_pages)."""
+    organized_data = organize_ocr_pages(pages, pdf_filename, image_dir=image_dir)
     log_info(logger, organized_data)
-    output_filename = f"{Path(pdf_filename).stem}_organized_data.json"
-    save_organized_data(organized_data, output_filename)
+    save_organized_data(organized_data, organized_data_path(pdf_filename, output_dir), compact)
     return organized_data
\ No newline at end of file
@@ -0,0 +1,200 @@
+# -----------------------------------------------------------------------------
+# Product page rendering (Handlebars template -> self-contained HTML)
+# -----------------------------------------------------------------------------
+import base64
+import json
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import metrics
+from workspace import atomic_open
+
+# === Settings ===
+TEMPLATE_PATH = "template.html"
+OUTPUT_HTML_PATH = "rendered_product.html"
+LOGO_PATH = "static/maruyama-logo.png"
+DATA_URI_CACHE_SIZE = 256
+
+# JavaScript data placeholders left in the rendered HTML, replaced in one pass
+_INJECTION_RE = re.compile(r'\{\{\{(features|thumbnailsJSON)\}\}\}')
+
+
+# === Convert image to base64 data URI ===
+def image_to_base64_data_uri(image_path: str) -> str:
+    with open(image_path, "rb") as f:
+        ext = image_path.split('.')[-1]
+        mime_type = mimetypes.guess_type(image_path)[0] or f"image/{ext}"
+        base64_img = base64.b64encode(f.read()).decode("utf-8")
+        return f"data:{mime_type};base64,{base64_img}"
+
+
+class ProductRenderer:
+    """
+    Renders product dicts (data.json format) with the Handlebars template.
+
+    The template is compiled once and recompiled only when the file
+    changes on disk. Asset data URIs are memoized by (path, mtime, size),
+    so the logo and images shared between products are read and encoded
+    once per renderer.
+    """
+
+    def __init__(self, template_path: str = TEMPLATE_PATH, logo_path: str = LOGO_PATH):
+        self.template_path = template_path
+        self.logo_path = logo_path
+        self._init_args = (template_path, logo_path)
+        self._compiler = None
+        self._template = None
+        self._template_mtime = None
+        self._data_uris: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def template(self):
+        mtime = os.stat(self.template_path).st_mtime_ns
+        with self._lock:
+            if self._template is None or mtime != self._template_mtime:
+                if self._compiler is None:
+                    from pybars import Compiler  # slow to import; only needed once a page is rendered
+                    self._compiler = Compiler()
+                with open(self.template_path, 'r', encoding='utf-8') as f:
+                    self._template = self._compiler.compile(self.prepare_template_source(f.read()))
+                self._template_mtime = mtime
+            return self._template
+
+    def prepare_template_source(self, source: str) -> str:
+        """Hook for subclasses to adjust the template before it is compiled."""
+        return source
+
+    def data_uri(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key in self._data_uris:
+                self._data_uris.move_to_end(key)
+                return self._data_uris[key]
+
+        data_uri = image_to_base64_data_uri(path)
+        with self._lock:
+            self._data_uris[key] = data_uri
+            while len(self._data_uris) > DATA_URI_CACHE_SIZE:
+                self._data_uris.popitem(last=False)
+        return data_uri
+
+    def asset_url(self, path_or_uri: str) -> str:
+        """Local files become data URIs; anything else (data URIs, URLs) passes through."""
+        return self.data_uri(path_or_uri) if path_or_uri and os.path.exists(path_or_uri) else path_or_uri
+
+    def build_context(self, product_data: Dict[str, Any]) -> Dict[str, Any]:
+        # Convert features to flat list for display
+        features_flat = [
+            f"{list(item.keys())[0]}: {list(item.values())[0]}"
+            for item in product_data.get("features", [])
+        ]
+        thumbnail_uris = [self.asset_url(thumb) for thumb in product_data.get("thumbnails", [])]
+
+        return {
+            "mainImage": self.asset_url(product_data["mainImage"]),
+            "productName": product_data["product_name"],
+            "category": product_data["category"],
+            "description": product_data["product_description"],
+            "rating": product_data["rating"],
+            "reviewCount": product_data["reviewCount"],
+            "detailedDescription": product_data["detailedDescription"],
+            "specifications": product_data["specifications"],
+            "features": features_flat,
+            "thumbnails": thumbnail_uris,
+            "logo": self.asset_url(self.logo_path),
+            # Add JSON data for JavaScript
+            "featuresJSON": json.dumps(features_flat),
+            "thumbnailsJSON": json.dumps(thumbnail_uris)
+        }
+
+    def render(self, product_data: Dict[str, Any]) -> str:
+        context = self.build_context(product_data)
+        rendered_html = self.template(context)
+
+        # Replace the JavaScript data injection placeholders
+        injections = {"features": context["featuresJSON"], "thumbnailsJSON": context["thumbnailsJSON"]}
+        return _INJECTION_RE.sub(lambda match: injections[match.group(1)], str(rendered_html))
+
+    @metrics.timed("render")
+    def render_to_file(self, product_data: Dict[str, Any], output_path: str = OUTPUT_HTML_PATH) -> str:
+        rendered_html = self.render(product_data)
+        with atomic_open(output_path, "w", encoding="utf-8") as f:
+            f.write(rendered_html)
+        return output_path
+
+    def render_many(self, products: List[Dict[str, Any]], output_dir: str, max_workers: Optional[int] = None,
+                    use_processes: bool = True, filenames: Optional[List[str]] = None) -> List[str]:
+        """
+        Render every product to <output_dir>/product_<n>.html (or the given
+        filenames) on a worker pool. Template rendering is pure Python, so
+        processes (each with its own renderer, compiled template and asset
+        cache) are used by default.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        filenames = filenames or [f"product_{index + 1}.html" for index in range(len(products))]
+        output_paths = [os.path.join(output_dir, filename) for filename in filenames]
+        if len(products) <= 1:
+            return [self.render_to_file(product, path) for product, path in zip(products, output_paths)]
+
+        if use_processes:
+            executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker_renderer,
+                                           initargs=(type(self), self._init_args))
+            render_fn = _render_in_worker
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            render_fn = self.render_to_file
+
+        with executor:
+            return list(executor.map(render_fn, products, output_paths, chunksize=1))
+
+
+_worker_renderer: Optional[ProductRenderer] = None
+
+
+def _init_worker_renderer(renderer_cls: type, init_args: tuple) -> None:
+    global _worker_renderer
+    _worker_renderer = renderer_cls(*init_args)
+
+
+def _render_in_worker(product_data: Dict[str, Any], output_path: str) -> str:
+    return _worker_renderer.render_to_file(product_data, output_path)
+
+
+_default_renderer: Optional[ProductRenderer] = None
+
+
+def get_renderer() -> ProductRenderer:
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = ProductRenderer()
+    return _default_renderer
+
+
+def resolve_image_paths(product_data: Dict[str, Any], base_dir: str) -> Dict[str, Any]:
+    """
+    Copy of `product_data` whose image paths, stored in data.json relative
+    to its directory, are joined to `base_dir` (that directory).
+    """
+    def resolve(ref: str) -> str:
+        if not ref or ref.startswith("data:") or "://" in ref or os.path.isabs(ref):
+            return ref
+        return os.path.join(base_dir, ref)
+
+    return {**product_data, "mainImage": resolve(product_data.get("mainImage", "")),
+            "thumbnails": [resolve(thumb) for thumb in product_data.get("thumbnails", [])]}
+
+
+# === HTML rendering function ===
+def render_html_handlebars(product_data: dict, output_path: str = OUTPUT_HTML_PATH,
+                           base_dir: Optional[str] = None) -> str:
+    """Render one product; `base_dir` is the directory of the data.json it came from."""
+    if base_dir is not None:
+        product_data = resolve_image_paths(product_data, base_dir)
+    return get_renderer().render_to_file(product_data, output_path)
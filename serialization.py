@@ -0,0 +1,84 @@
+# -----------------------------------------------------------------------------
+# JSON serialization for pipeline artifacts (organized JSON, data.json, JSON Lines)
+#
+# orjson is used when it is installed (JSON_BACKEND=auto) and the standard
+# library otherwise. JSON_COMPACT=1 drops indentation from the artifacts,
+# which are mostly base64 image strings, so indentation buys little
+# readability. orjson only indents by two spaces, so pretty output from the
+# two backends differs in whitespace only.
+# -----------------------------------------------------------------------------
+import json
+import os
+from typing import Any, Dict, IO, Optional
+
+from logger import setup_logger
+from workspace import atomic_open
+
+logger = setup_logger()
+
+# "auto": orjson when installed, else json. "json": always the standard library.
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+JSON_COMPACT = os.getenv("JSON_COMPACT", "0").lower() in ("1", "true", "yes")
+
+_orjson_module = None
+
+
+def _orjson():
+    # Optional ("fast-json" extra), imported on first use
+    global _orjson_module
+    if _orjson_module is None:
+        try:
+            import orjson
+        except ImportError:
+            logger.warning("orjson is not installed (pip install '.[fast-json]'); using the standard json module")
+            orjson = False
+        _orjson_module = orjson
+    return _orjson_module or None
+
+
+def backend() -> str:
+    return "orjson" if JSON_BACKEND != "json" and _orjson() else "json"
+
+
+def dumps(obj: Any, indent: Optional[int] = 2, compact: Optional[bool] = None) -> bytes:
+    """
+    UTF-8 JSON for `obj`. `indent` applies unless `compact` (default
+    JSON_COMPACT) is set. Falls back to the standard library for values
+    orjson rejects (non-string keys, integers over 64 bits).
+    """
+    compact = JSON_COMPACT if compact is None else compact
+    orjson = _orjson() if JSON_BACKEND != "json" else None
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=0 if compact or not indent else orjson.OPT_INDENT_2)
+        except TypeError:
+            pass
+    if compact or not indent:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=indent).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    orjson = _orjson() if JSON_BACKEND != "json" else None
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump(obj: Any, path: str, indent: Optional[int] = 2, compact: Optional[bool] = None) -> str:
+    """Write `obj` to `path` atomically (see workspace.atomic_open)."""
+    data = dumps(obj, indent, compact)
+    with atomic_open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def load(path: str) -> Any:
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def write_jsonl_record(f: IO[bytes], record: Dict[str, Any]) -> None:
+    """Append one record as a single compact line to a file opened in binary mode."""
+    f.write(dumps(record, compact=True))
+    f.write(b"\n")
@@ -0,0 +1,301 @@
+# -----------------------------------------------------------------------------
+# Static site generator: one page per product, shared content-hashed assets
+# -----------------------------------------------------------------------------
+import argparse
+import base64
+import hashlib
+import html
+import json
+import mimetypes
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from logger import setup_logger, log_info
+from renderer import ProductRenderer, TEMPLATE_PATH, LOGO_PATH, resolve_image_paths
+from workspace import atomic_write
+
+logger = setup_logger()
+
+SITE_DIR = "site"
+ASSETS_DIRNAME = "assets"
+MANIFEST_NAME = "manifest.json"
+# Bump when the page layout changes in a way the fingerprints can't see
+SITE_FORMAT_VERSION = 1
+
+_STYLE_RE = re.compile(r'<style>(.*?)</style>', re.DOTALL)
+_DATA_FETCH = 'fetch("./data.json")'
+_SLUG_RE = re.compile(r'[^a-z0-9]+')
+_DATA_URI_RE = re.compile(r'^data:([^;,]+)?(;base64)?,(.*)$', re.DOTALL)
+
+
+def _read_bytes(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def slugify(name: str, fallback: str) -> str:
+    slug = _SLUG_RE.sub("-", (name or "").lower()).strip("-")
+    return slug[:80] or fallback
+
+
+class SiteRenderer(ProductRenderer):
+    """
+    ProductRenderer that links assets instead of inlining them.
+
+    Local images, data URIs, the logo and the template's <style> block are
+    copied to <site_dir>/assets/<name>.<sha256[:16]><ext> once and
+    referenced by relative URL, so every page shares the same cacheable
+    files. `known_assets` maps source paths to [mtime, size, url] of an
+    earlier build, letting a rebuild skip re-hashing unchanged files.
+    """
+
+    def __init__(self, template_path: str = TEMPLATE_PATH, logo_path: str = LOGO_PATH, site_dir: str = SITE_DIR,
+                 known_assets: Optional[Dict[str, List[Any]]] = None):
+        super().__init__(template_path, logo_path)
+        self._init_args = (template_path, logo_path, site_dir)
+        self.site_dir = site_dir
+        self.assets_dir = os.path.join(site_dir, ASSETS_DIRNAME)
+        self.known_assets = dict(known_assets or {})
+        self.published = set()
+        self._publish_lock = threading.Lock()
+        os.makedirs(self.assets_dir, exist_ok=True)
+
+    def publish_bytes(self, data: bytes, stem: str, ext: str) -> str:
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        filename = f"{stem}.{digest}{ext}"
+        path = os.path.join(self.assets_dir, filename)
+        if not os.path.exists(path):
+            atomic_write(path, data)
+        with self._publish_lock:
+            self.published.add(filename)
+        return f"{ASSETS_DIRNAME}/{filename}"
+
+    def publish_file(self, path: str) -> str:
+        stat = os.stat(path)
+        source_key = os.path.abspath(path)
+        known = self.known_assets.get(source_key)
+        if known and known[:2] == [stat.st_mtime_ns, stat.st_size] and \
+                os.path.exists(os.path.join(self.site_dir, known[2])):
+            with self._publish_lock:
+                self.published.add(os.path.basename(known[2]))
+            return known[2]
+
+        stem, ext = os.path.splitext(os.path.basename(path))
+        with open(path, "rb") as f:
+            url = self.publish_bytes(f.read(), stem, ext.lower())
+        with self._publish_lock:
+            self.known_assets[source_key] = [stat.st_mtime_ns, stat.st_size, url]
+        return url
+
+    def asset_url(self, path_or_uri: str) -> str:
+        if not path_or_uri or path_or_uri.startswith(f"{ASSETS_DIRNAME}/"):
+            return path_or_uri
+        match = _DATA_URI_RE.match(path_or_uri)
+        if match and match.group(2):
+            mime_type = match.group(1) or "application/octet-stream"
+            ext = mimetypes.guess_extension(mime_type) or ".bin"
+            return self.publish_bytes(base64.b64decode(match.group(3)), "image", ext)
+        if os.path.exists(path_or_uri):
+            return self.publish_file(path_or_uri)
+        return path_or_uri
+
+    def prepare_template_source(self, source: str) -> str:
+        # Move the inline stylesheet to a shared asset
+        match = _STYLE_RE.search(source)
+        if match:
+            css_url = self.publish_bytes(match.group(1).strip().encode("utf-8") + b"\n", "site", ".css")
+            source = source[:match.start()] + f'<link rel="stylesheet" href="{css_url}">' + source[match.end():]
+        # Each page loads its own product JSON instead of ./data.json
+        return source.replace(_DATA_FETCH, 'fetch("{{dataUrl}}")')
+
+    def build_context(self, product_data: Dict[str, Any]) -> Dict[str, Any]:
+        context = super().build_context(product_data)
+        context["dataUrl"] = product_data.get("_data_url", "./data.json")
+        return context
+
+
+def load_products(data_files: List[str]) -> List[Dict[str, Any]]:
+    products = []
+    for data_file in data_files:
+        with open(data_file, "r", encoding="utf-8") as f:
+            products.extend(resolve_image_paths(product, os.path.dirname(data_file))
+                            for product in json.load(f).get("products", []))
+    return products
+
+
+def load_manifest(site_dir: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(site_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == SITE_FORMAT_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": SITE_FORMAT_VERSION, "products": {}, "assets": {}}
+
+
+def _template_hash(template_path: str) -> str:
+    with open(template_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _fingerprint(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _assign_slugs(products: List[Dict[str, Any]]) -> List[str]:
+    slugs, seen = [], set()
+    for index, product in enumerate(products):
+        base = slugify(product.get("product_name", ""), f"product-{index + 1}")
+        slug, n = base, 2
+        while slug in seen:
+            slug, n = f"{base}-{n}", n + 1
+        seen.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def render_index(entries: List[Dict[str, Any]]) -> str:
+    items = "\n".join(
+        f'        <li><a href="{html.escape(entry["html"])}">'
+        f'<img src="{html.escape(entry["image"] or "")}" alt="" loading="lazy">'
+        f'<span>{html.escape(entry["name"])}</span><small>{html.escape(entry["category"])}</small></a></li>'
+        for entry in entries
+    )
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Products - Maruyama</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; margin: 0 auto; max-width: 1200px; padding: 20px; color: #333; }}
+        ul {{ list-style: none; padding: 0; display: grid; grid-template-columns: repeat(auto-fill, minmax(220px, 1fr)); gap: 20px; }}
+        a {{ display: flex; flex-direction: column; gap: 6px; color: inherit; text-decoration: none; }}
+        img {{ width: 100%; height: 160px; object-fit: cover; border-radius: 5px; background: #f5f5f5; }}
+        small {{ color: #666; }}
+    </style>
+</head>
+<body>
+    <h1>Products</h1>
+    <ul>
+{items}
+    </ul>
+</body>
+</html>
+"""
+
+
+def build_site(data_files: List[str], site_dir: str = SITE_DIR, template_path: str = TEMPLATE_PATH,
+               logo_path: str = LOGO_PATH, force: bool = False, max_workers: Optional[int] = None,
+               use_processes: bool = True, prune: bool = True) -> Dict[str, Any]:
+    """
+    Render every product in `data_files` to <site_dir>/<slug>.html (+ <slug>.json
+    for the page script) with an index.html linking them all.
+
+    Each page's fingerprint covers its product data with asset URLs already
+    content-hashed, the template and the logo, so only pages whose inputs
+    changed are rendered again. Pages and assets no longer referenced are
+    removed when `prune` is set.
+    """
+    os.makedirs(site_dir, exist_ok=True)
+    manifest = {"version": SITE_FORMAT_VERSION, "products": {}, "assets": {}} if force else load_manifest(site_dir)
+    renderer = SiteRenderer(template_path, logo_path, site_dir, known_assets=manifest.get("assets"))
+    renderer.template  # publishes the stylesheet
+    shared_inputs = (SITE_FORMAT_VERSION, _template_hash(template_path), renderer.asset_url(logo_path))
+
+    products = load_products(data_files)
+    slugs = _assign_slugs(products)
+    pages: Dict[str, Dict[str, Any]] = {}
+    to_render: List[Tuple[str, Dict[str, Any]]] = []
+
+    for slug, product in zip(slugs, products):
+        site_product = dict(product)
+        site_product["mainImage"] = renderer.asset_url(product.get("mainImage", ""))
+        site_product["thumbnails"] = [renderer.asset_url(thumb) for thumb in product.get("thumbnails", [])]
+        fingerprint = _fingerprint(shared_inputs, site_product)
+
+        page = {
+            "fingerprint": fingerprint,
+            "html": f"{slug}.html",
+            "data": f"{slug}.json",
+            "name": product.get("product_name", slug),
+            "category": product.get("category", ""),
+            "image": site_product["mainImage"],
+        }
+        pages[slug] = page
+
+        previous = manifest["products"].get(slug, {})
+        if previous.get("fingerprint") == fingerprint and os.path.exists(os.path.join(site_dir, page["html"])):
+            continue
+
+        data = json.dumps({"products": [site_product]}, indent=4, ensure_ascii=False)
+        atomic_write(os.path.join(site_dir, page["data"]), data.encode("utf-8"))
+        to_render.append((slug, dict(site_product, _data_url=f"./{page['data']}")))
+
+    if to_render:
+        renderer.render_many([product for _, product in to_render], site_dir, max_workers=max_workers,
+                             use_processes=use_processes, filenames=[pages[slug]["html"] for slug, _ in to_render])
+
+    index_html = render_index(list(pages.values())).encode("utf-8")
+    index_path = os.path.join(site_dir, "index.html")
+    index_changed = _read_bytes(index_path) != index_html
+    if index_changed:
+        atomic_write(index_path, index_html)
+
+    removed = []
+    if prune:
+        for slug, page in manifest["products"].items():
+            if slug not in pages:
+                removed.append(slug)
+                for name in (page.get("html"), page.get("data")):
+                    if name and os.path.exists(os.path.join(site_dir, name)):
+                        os.remove(os.path.join(site_dir, name))
+        for filename in os.listdir(renderer.assets_dir):
+            if filename not in renderer.published:
+                os.remove(os.path.join(renderer.assets_dir, filename))
+
+    new_manifest = {
+        "version": SITE_FORMAT_VERSION,
+        "products": pages,
+        "assets": {source: entry for source, entry in renderer.known_assets.items()
+                   if os.path.basename(entry[2]) in renderer.published},
+    }
+    atomic_write(os.path.join(site_dir, MANIFEST_NAME), json.dumps(new_manifest, indent=4).encode("utf-8"))
+
+    report = {
+        "products": len(pages),
+        "rendered": len(to_render),
+        "skipped": len(pages) - len(to_render),
+        "removed": len(removed),
+        "index_updated": index_changed,
+        "assets": len(renderer.published),
+    }
+    log_info(logger, f"Built site in {site_dir}: {report}")
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Render product data JSON files into a static site.")
+    parser.add_argument("data_files", nargs="+", help="data.json files produced by convert_json_format")
+    parser.add_argument("-o", "--output-dir", default=SITE_DIR)
+    parser.add_argument("--template", default=TEMPLATE_PATH)
+    parser.add_argument("--logo", default=LOGO_PATH)
+    parser.add_argument("-w", "--workers", type=int, default=None, help="render processes")
+    parser.add_argument("--force", action="store_true", help="re-render every page")
+    args = parser.parse_args(argv)
+
+    report = build_site(args.data_files, args.output_dir, args.template, args.logo, args.force, args.workers)
+    print(f"{report['products']} products: {report['rendered']} rendered, {report['skipped']} unchanged, "
+          f"{report['removed']} removed")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
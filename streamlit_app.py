@@ -1,35 +1,27 @@
 import streamlit as st
-from pathlib import Path
 import os
-import json
-from pybars import Compiler
-from mistralai import Mistral, DocumentURLChunk
-from main import process_ocr_response, convert_json_format
-import base64
+
+# Before the project imports, so .env settings reach their module constants
+from dotenv import load_dotenv
+load_dotenv()
+
+from clients import get_mistral_client
+from main import convert_json_format
+from ocr_cache import ocr_pdf_pages
+from ocr_organizer import process_ocr_pages
+from renderer import render_html_handlebars
+from workspace import Workspace, collect_garbage
+import functools
 import webbrowser
 import threading
 import time
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 import socket
 
-from dotenv import load_dotenv
-load_dotenv()
-
 # === Settings ===
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
-UPLOAD_DIR = "uploads"
-TEMPLATE_PATH = "template.html"
-OUTPUT_HTML_PATH = "rendered_product.html"
-JSON_OUTPUT_PATH = "data.json"
-LOGO_PATH = "static/maruyama-logo.png"
-
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-# === Handlebars template ===
-compiler = Compiler()
-with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
-    template_src = f.read()
-    template = compiler.compile(template_src)
+# Uploads and outputs live in a per-session workspace (see workspace.py)
+JSON_OUTPUT_NAME = "data.json"
+HTML_OUTPUT_NAME = "rendered_product.html"
 
 # === Find available port ===
 def find_free_port():
@@ -41,69 +33,15 @@ def find_free_port():
 
 # === Start local server ===
 def start_local_server(port, directory="."):
-    os.chdir(directory)
-    handler = SimpleHTTPRequestHandler
+    # Serve `directory` without chdir, which would move every session's relative paths
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
     httpd = HTTPServer(("localhost", port), handler)
     httpd.serve_forever()
 
-# === Convert image to base64 data URI ===
-def image_to_base64_data_uri(image_path: str) -> str:
-    with open(image_path, "rb") as f:
-        ext = image_path.split('.')[-1]
-        base64_img = base64.b64encode(f.read()).decode("utf-8")
-        return f"data:image/{ext};base64,{base64_img}"
-
-# === HTML rendering function ===
-def render_html_handlebars(product_data: dict) -> str:
-    logo_data_uri = image_to_base64_data_uri(LOGO_PATH)
-
-    # Convert features to flat list for display
-    features_flat = [
-        f"{list(item.keys())[0]}: {list(item.values())[0]}"
-        for item in product_data.get("features", [])
-    ]
-    
-    # Convert images to base64 data URIs for compatibility
-    main_image_uri = image_to_base64_data_uri(product_data["mainImage"]) if os.path.exists(product_data["mainImage"]) else product_data["mainImage"]
-    
-    thumbnail_uris = []
-    for thumb in product_data.get("thumbnails", []):
-        if os.path.exists(thumb):
-            thumbnail_uris.append(image_to_base64_data_uri(thumb))
-        else:
-            thumbnail_uris.append(thumb)
-    
-    context = {
-        "mainImage": main_image_uri,
-        "productName": product_data["product_name"],
-        "category": product_data["category"],
-        "description": product_data["product_description"],
-        "rating": product_data["rating"],
-        "reviewCount": product_data["reviewCount"],
-        "detailedDescription": product_data["detailedDescription"],
-        "specifications": product_data["specifications"],
-        "features": features_flat,
-        "thumbnails": thumbnail_uris,
-        "logo": logo_data_uri,
-        # Add JSON data for JavaScript
-        "featuresJSON": json.dumps(features_flat),
-        "thumbnailsJSON": json.dumps(thumbnail_uris)
-    }
-
-    rendered_html = template(context)
-    
-    # Replace the JavaScript data injection placeholder
-    rendered_html = rendered_html.replace('{{{features}}}', json.dumps(features_flat))
-    rendered_html = rendered_html.replace('{{{thumbnailsJSON}}}', json.dumps(thumbnail_uris))
-    
-    with open(OUTPUT_HTML_PATH, "w", encoding="utf-8") as f:
-        f.write(rendered_html)
-    return OUTPUT_HTML_PATH
-
 # === Open HTML in new tab ===
 def open_html_in_browser(html_path):
-    # Get current working directory
-    current_dir = os.getcwd()
+    # Serve the directory holding the page (the session's workspace)
+    current_dir = os.path.dirname(os.path.abspath(html_path))
     
     # Find a free port
     port = find_free_port()
@@ -134,41 +72,32 @@ if 'server_started' not in st.session_state:
     st.session_state.server_started = False
 if 'server_url' not in st.session_state:
     st.session_state.server_url = None
+if 'workspace' not in st.session_state:
+    # One workspace per browser session, so concurrent users never share output paths
+    collect_garbage()
+    st.session_state.workspace = Workspace()
+workspace = st.session_state.workspace
+# Heartbeat on every rerun: the workspace is collected once the session goes quiet
+workspace.mark_active()
 
 uploaded_pdf = st.file_uploader("Upload your product PDF", type=["pdf"])
 
 if uploaded_pdf:
-    pdf_path = os.path.join(UPLOAD_DIR, uploaded_pdf.name)
-    with open(pdf_path, "wb") as f:
-        f.write(uploaded_pdf.read())
+    pdf_path = workspace.save_upload(uploaded_pdf.name, uploaded_pdf.read())
     st.success("✅ PDF uploaded.")
 
     if st.button("🚀 Run Extraction"):
         with st.spinner("Converting pdf to product page"):
-            mistral_client = Mistral(api_key=MISTRAL_API_KEY)
-            with open(pdf_path, "rb") as f:
-                uploaded = mistral_client.files.upload(
-                    file={"file_name": Path(pdf_path).stem, "content": f.read()},
-                    purpose="ocr"
-                )
-            signed_url = mistral_client.files.get_signed_url(file_id=uploaded.id, expiry=1)
-            ocr_response = mistral_client.ocr.process(
-                document=DocumentURLChunk(document_url=signed_url.url),
-                model="mistral-ocr-latest",
-                include_image_base64=True
-            )
-            ocr_dict = ocr_response.model_dump()
-
-            organized = process_ocr_response(ocr_dict, pdf_path)
-            json_input = f"{Path(pdf_path).stem}_organized_data.json"
-            convert_json_format(json_input, JSON_OUTPUT_PATH)
+            mistral_client = get_mistral_client()
+            ocr_pages = ocr_pdf_pages(mistral_client, pdf_path)
 
-        with open(JSON_OUTPUT_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
+            organized = process_ocr_pages(ocr_pages, pdf_path, workspace.path, workspace.images_dir)
+            # In-memory handoff: no re-read of the JSON files just written
+            data = convert_json_format(organized, workspace.file(JSON_OUTPUT_NAME))
 
         if data["products"]:
             product = data["products"][0]
-            html_path = render_html_handlebars(product)
+            html_path = render_html_handlebars(product, workspace.file(HTML_OUTPUT_NAME), workspace.path)
 
             st.success("✅ Product HTML generated!")
             
@@ -0,0 +1,190 @@
+# -----------------------------------------------------------------------------
+# Local text-layer extraction for born-digital PDFs (PyMuPDF, optional)
+# -----------------------------------------------------------------------------
+import base64
+import os
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional
+
+from logger import setup_logger, log_info
+
+logger = setup_logger()
+
+# "auto": pages with a usable embedded text layer are read locally and only
+# the rest go to cloud OCR. "off": every page goes to cloud OCR.
+TEXT_LAYER_MODE = os.getenv("TEXT_LAYER_MODE", "auto")
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "80"))
+# Share of garbled characters (U+FFFD, private use, controls) above which the text layer is unusable
+TEXT_LAYER_MAX_GARBLED = 0.05
+# Images smaller than this on the page (in points) are decoration: bullets, rules, separators
+TEXT_LAYER_MIN_IMAGE_SIZE = 24
+HEADING_SCALE = 1.3  # font size relative to body text that makes a line a heading
+
+_WEB_IMAGE_TYPES = {"jpeg", "jpg", "png", "gif", "webp"}
+
+
+_pymupdf_warned = False
+
+
+def _pymupdf():
+    # Optional ("pdf" extra): without it every page goes to cloud OCR
+    global _pymupdf_warned
+    try:
+        import pymupdf
+    except ImportError:
+        if not _pymupdf_warned:
+            _pymupdf_warned = True
+            logger.warning("PyMuPDF is not installed (pip install '.[pdf]'); "
+                           "text-layer pages and local page counts are unavailable, every page goes to cloud OCR")
+        return None
+    return pymupdf
+
+
+def _garbled(char: str) -> bool:
+    code = ord(char)
+    return char == "\ufffd" or 0xE000 <= code <= 0xF8FF or (code < 32 and char not in "\n\r\t")
+
+
+def has_usable_text(text: str, min_chars: int = TEXT_LAYER_MIN_CHARS) -> bool:
+    """True when a page's extracted text is long enough and not mostly unmapped glyphs."""
+    chars = [char for char in text if not char.isspace()]
+    if len(chars) < min_chars:
+        return False
+    return sum(map(_garbled, chars)) / len(chars) <= TEXT_LAYER_MAX_GARBLED
+
+
+def text_layer_plan(pdf_bytes: bytes) -> Optional[List[bool]]:
+    """
+    For each page, whether its embedded text layer is usable. None when
+    PyMuPDF is not installed or the PDF cannot be opened locally.
+    """
+    pymupdf = _pymupdf()
+    if pymupdf is None:
+        return None
+    try:
+        with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return [has_usable_text(page.get_text()) for page in doc]
+    except Exception as e:
+        log_info(logger, f"Could not read the PDF text layer: {e}")
+        return None
+
+
+def page_count(pdf_bytes: bytes) -> Optional[int]:
+    """Number of pages, or None when PyMuPDF is not installed or cannot open the PDF."""
+    pymupdf = _pymupdf()
+    if pymupdf is None:
+        return None
+    try:
+        with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return doc.page_count
+    except Exception as e:
+        log_info(logger, f"Could not count PDF pages: {e}")
+        return None
+
+
+def _image_data_uri(pymupdf, doc, xref: int) -> Optional[str]:
+    extracted = doc.extract_image(xref)
+    if not extracted:
+        return None
+    ext, data = extracted["ext"], extracted["image"]
+    if ext not in _WEB_IMAGE_TYPES or extracted.get("smask"):
+        # JPEG 2000, JBIG2, CMYK or soft-masked images: render to PNG
+        pixmap = pymupdf.Pixmap(doc, xref)
+        if extracted.get("smask"):
+            pixmap = pymupdf.Pixmap(pixmap, pymupdf.Pixmap(doc, extracted["smask"]))
+        if pixmap.n - pixmap.alpha > 3:
+            pixmap = pymupdf.Pixmap(pymupdf.csRGB, pixmap)
+        ext, data = "png", pixmap.tobytes("png")
+    return f"data:image/{'jpeg' if ext == 'jpg' else ext};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def _line_markdown(line: Dict[str, Any], body_size: float) -> str:
+    spans = [span for span in line["spans"] if span["text"].strip()]
+    text = " ".join("".join(span["text"] for span in spans).split())
+    if not text:
+        return ""
+    if max(span["size"] for span in spans) >= body_size * HEADING_SCALE:
+        return f"# **{text}**"
+    if all(span["flags"] & 16 for span in spans):  # bold
+        return f"**{text}**"
+    return text
+
+
+def _page_items(pymupdf, doc, page) -> Iterator[tuple]:
+    """(y, x, kind, payload) for text blocks, tables and images on the page."""
+    table_boxes = []
+    try:
+        for table in page.find_tables().tables:
+            table_boxes.append(pymupdf.Rect(table.bbox))
+            yield table.bbox[1], table.bbox[0], "table", table.to_markdown(clean=False).strip()
+    except Exception as e:  # older PyMuPDF without find_tables, or a table it cannot parse
+        log_info(logger, f"Table detection skipped on page {page.number + 1}: {e}")
+
+    blocks = page.get_text("dict", flags=pymupdf.TEXTFLAGS_TEXT)["blocks"]
+    sizes = Counter()
+    for block in blocks:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                sizes[round(span["size"], 1)] += len(span["text"].strip())
+    body_size = sizes.most_common(1)[0][0] if sizes else 0.0
+
+    for block in blocks:
+        rect = pymupdf.Rect(block["bbox"])
+        if any(box.contains(rect) or box.intersect(rect).get_area() > 0.5 * rect.get_area() for box in table_boxes):
+            continue
+        lines = [_line_markdown(line, body_size) for line in block.get("lines", [])]
+        text = "\n".join(line for line in lines if line)
+        if text:
+            yield rect.y0, rect.x0, "text", text
+
+    for info in page.get_image_info(xrefs=True):
+        x0, y0, x1, y1 = info["bbox"]
+        if info["xref"] and min(x1 - x0, y1 - y0) >= TEXT_LAYER_MIN_IMAGE_SIZE:
+            yield y0, x0, "image", info
+
+
+def extract_text_layer_page(doc, page_index: int) -> Dict[str, Any]:
+    """
+    One page in the OCR response shape ({"index", "markdown", "images",
+    "dimensions"}) built from the embedded text, tables and images, in
+    reading order. Image ids are page-local; the caller renumbers them.
+    """
+    pymupdf = _pymupdf()
+    page = doc[page_index]
+    parts, images = [], []
+    for y, x, kind, payload in sorted(_page_items(pymupdf, doc, page), key=lambda item: (round(item[0]), item[1])):
+        if kind != "image":
+            parts.append(payload)
+            continue
+        try:
+            data_uri = _image_data_uri(pymupdf, doc, payload["xref"])
+        except Exception as e:
+            log_info(logger, f"Could not extract image {payload['xref']} on page {page_index + 1}: {e}")
+            continue
+        if data_uri is None:
+            continue
+        image_id = f"img-{len(images)}.jpeg"
+        x0, y0, x1, y1 = payload["bbox"]
+        images.append({
+            "id": image_id,
+            "top_left_x": round(x0), "top_left_y": round(y0),
+            "bottom_right_x": round(x1), "bottom_right_y": round(y1),
+            "image_base64": data_uri,
+        })
+        parts.append(f"![{image_id}]({image_id})")
+
+    return {
+        "index": page_index,
+        "markdown": "\n\n".join(parts),
+        "images": images,
+        "dimensions": {"dpi": 72, "height": round(page.rect.height), "width": round(page.rect.width)},
+        "source": "text_layer",
+    }
+
+
+def iter_text_layer_pages(pdf_bytes: bytes, page_indexes: List[int]) -> Iterator[Dict[str, Any]]:
+    """Yield extract_text_layer_page for each of `page_indexes`, one page at a time."""
+    pymupdf = _pymupdf()
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page_index in page_indexes:
+            yield extract_text_layer_page(doc, page_index)
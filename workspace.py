@@ -0,0 +1,126 @@
+# -----------------------------------------------------------------------------
+# Job-scoped workspaces and atomic file writes
+#
+# Every extraction job (API upload, Streamlit run) gets its own directory
+# under WORKSPACES_DIR holding the upload, extracted images and all JSON /
+# HTML outputs, so concurrent jobs never write to the same path. Outputs
+# are written to a temporary file in the same directory and renamed into
+# place, so readers see either the old file or the complete new one.
+# -----------------------------------------------------------------------------
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from typing import IO, Iterator, List, Optional
+
+from logger import setup_logger, log_info
+
+logger = setup_logger()
+
+WORKSPACES_DIR = os.getenv("WORKSPACES_DIR", "workspaces")
+# Finished workspaces older than this are removed by collect_garbage
+WORKSPACE_RETENTION_HOURS = float(os.getenv("WORKSPACE_RETENTION_HOURS", "24"))
+# Heartbeat file refreshed while the workspace is in use; garbage collection
+# skips workspaces whose marker is younger than the retention window
+ACTIVE_MARKER = ".active"
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = "w", encoding: Optional[str] = "utf-8") -> Iterator[IO]:
+    """
+    open() for writing that only replaces `path` once the block completes.
+    On an exception the temporary file is removed and `path` is untouched.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, mode, encoding=None if "b" in mode else encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write(path: str, data: bytes) -> str:
+    with atomic_open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+class Workspace:
+    """Directory of one job: <root>/<job_id>/ with the upload, images and outputs."""
+
+    IMAGES_DIR = "extracted_images"
+
+    def __init__(self, root: str = WORKSPACES_DIR, job_id: Optional[str] = None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.path = os.path.join(root, self.job_id)
+        os.makedirs(self.path, exist_ok=True)
+
+    @property
+    def images_dir(self) -> str:
+        return os.path.join(self.path, self.IMAGES_DIR)
+
+    def file(self, name: str) -> str:
+        """Path of `name` inside the workspace (directory parts of `name` are dropped)."""
+        return os.path.join(self.path, os.path.basename(name))
+
+    def save_upload(self, filename: str, content: bytes) -> str:
+        return atomic_write(self.file(filename or "upload.pdf"), content)
+
+    def mark_active(self) -> None:
+        """Write or refresh the heartbeat marker; call again while the workspace stays in use."""
+        with open(os.path.join(self.path, ACTIVE_MARKER), "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))
+
+    def mark_finished(self) -> None:
+        try:
+            os.remove(os.path.join(self.path, ACTIVE_MARKER))
+        except FileNotFoundError:
+            pass
+        # The directory mtime dates the workspace for garbage collection
+        os.utime(self.path)
+
+
+def _heartbeat(path: str) -> float:
+    """mtime of the workspace's active marker, 0 when there is none."""
+    try:
+        return os.stat(os.path.join(path, ACTIVE_MARKER)).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def collect_garbage(root: str = WORKSPACES_DIR, max_age_hours: float = WORKSPACE_RETENTION_HOURS,
+                    keep: Optional[set] = None) -> List[str]:
+    """
+    Remove workspaces under `root` last modified more than `max_age_hours`
+    ago, except the job ids in `keep` and workspaces with a heartbeat
+    marker refreshed within that window. Older markers, left by sessions
+    that went away or processes that died, are ignored. Returns the
+    removed job ids.
+    """
+    cutoff = time.time() - max_age_hours * 3600
+    removed = []
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return removed
+    for entry in entries:
+        if not entry.is_dir() or entry.name in (keep or ()):
+            continue
+        try:
+            if entry.stat().st_mtime >= cutoff or _heartbeat(entry.path) >= cutoff:
+                continue
+            shutil.rmtree(entry.path)
+            removed.append(entry.name)
+        except OSError as e:
+            print(f"Error removing workspace {entry.path}: {e}")
+    if removed:
+        log_info(logger, f"Removed {len(removed)} workspaces older than {max_age_hours}h from {root}")
+    return removed